@@ -1,7 +1,16 @@
 import os
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
+import sys
+from pathlib import Path
+
+# Módulos compartilhados ficam em chatbot_streamlit/
+sys.path.insert(0, str(Path(__file__).resolve().parent / "chatbot_streamlit"))
+from streaming_llm import MedicaoTurno, registrar_latencia
+from cliente_openai import criar_cliente
+from historico_conversa import GerenciadorHistorico, criar_resumidor
+from agendador_llm import AgendadorLLM
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -12,8 +21,20 @@ if not OPENAI_API_KEY:
     st.error("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
     st.stop()
 
-# Instancia o cliente usando a chave do ambiente (sem expor no código)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Cliente compartilhado pelo processo: o pool de conexões sobrevive aos reruns
+@st.cache_resource
+def obter_cliente_openai(api_key):
+    return criar_cliente(api_key)
+
+client, conexoes = obter_cliente_openai(OPENAI_API_KEY)
+
+@st.cache_resource
+def obter_agendador():
+    """Agendador único por processo: limites por modelo, fila justa e novas tentativas"""
+    return AgendadorLLM()
+
+agendador = obter_agendador()
+id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
 
 st.write("## ChatBot com IA - Suporte")
 
@@ -21,6 +42,13 @@ st.write("## ChatBot com IA - Suporte")
 if "lista_mensagens" not in st.session_state:
     st.session_state["lista_mensagens"] = []
 
+# Janela enviada ao modelo: últimos turnos dentro do orçamento + resumo dos antigos
+if "historico" not in st.session_state:
+    st.session_state["historico"] = GerenciadorHistorico(
+        modelo="gpt-4o", resumidor=criar_resumidor(client, "gpt-4o", agendador=agendador, sessao=id_sessao)
+    )
+historico = st.session_state["historico"]
+
 # Exibe histórico
 for msg in st.session_state["lista_mensagens"]:
     st.chat_message(msg["role"]).write(msg["content"])
@@ -33,14 +61,27 @@ if mensagem_usuario:
     st.session_state["lista_mensagens"].append({"role": "user", "content": mensagem_usuario})
     st.chat_message("user").write(mensagem_usuario)
 
-    # Chamada ao modelo
-    resposta = client.chat.completions.create(
-        model="gpt-4o",
-        messages=st.session_state["lista_mensagens"]
-    )
-
-    resposta_ia = resposta.choices[0].message.content
+    # Chamada ao modelo em streaming (pelo agendador): a resposta aparece conforme é gerada
+    medicao = MedicaoTurno()
+    stream = None
+    with st.chat_message("assistant"):
+        try:
+            stream = agendador.criar(
+                client,
+                sessao=id_sessao,
+                model="gpt-4o",
+                messages=historico.montar_mensagens(st.session_state["lista_mensagens"]),
+                stream=True
+            )
 
-    # Guarda e mostra a resposta da IA
-    st.chat_message("assistant").write(resposta_ia)
-    st.session_state["lista_mensagens"].append({"role": "assistant", "content": resposta_ia})
+            # Mostra e guarda a resposta da IA
+            resposta_ia = st.write_stream(medicao.transmitir(stream))
+            st.caption(f"{medicao.resumo()} • 🧮 prompt: {historico.tokens_ultimo_turno} tokens")
+            registrar_latencia(st.session_state, medicao)
+            st.session_state["lista_mensagens"].append({"role": "assistant", "content": resposta_ia})
+        except TimeoutError:
+            st.warning("⏳ Muitas perguntas ao mesmo tempo: tente de novo em alguns instantes.")
+        finally:
+            # Rerun/stop no meio do stream: devolve a vaga do agendador já
+            if stream is not None:
+                stream.close()
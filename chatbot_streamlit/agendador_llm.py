@@ -0,0 +1,573 @@
+"""
+Agendador das chamadas ao chat.completions, compartilhado pelo processo
+
+Com muitas sessões ao mesmo tempo, um 429 ou um timeout passageiro
+encerrava o turno com "❌ Erro na API". Toda chamada ao modelo passa por
+aqui antes de sair:
+
+    - balde de tokens por modelo, com os limites da organização
+      (requisições e tokens por minuto, config "agendador.limites"):
+      a chamada só sai quando cabe no limite, em vez de voltar com 429;
+    - no máximo max_simultaneas chamadas em andamento no processo;
+    - fila justa entre sessões: a vez circula entre as sessões que têm
+      pedidos pendentes, então quem dispara muitos pedidos não segura os
+      demais usuários;
+    - novas tentativas para 429, 5xx, timeout e falha de conexão, com
+      espera exponencial com jitter; o Retry-After da API é respeitado e
+      um 429 pausa o modelo para todas as sessões.
+
+Serve ao mesmo tempo threads (sessões do Streamlit) e asyncio (api_rag.py,
+responder_lote.py): a fila é uma só e cada pedido espera no seu próprio
+evento. Streams seguram a vaga até o último pedaço, até serem fechados ou,
+se abandonados sem leitura, até o coletor de lixo passar por eles;
+erros no meio de um stream não são repetidos (o texto já foi exibido).
+
+O custo de um pedido nos tokens por minuto é o mesmo que a OpenAI conta
+na entrada: tokens das mensagens + max_tokens.
+
+Uso:
+    agendador = AgendadorLLM.de_config(config.get("agendador"), metricas)
+    stream = agendador.criar(client, sessao=id_sessao, model=..., messages=..., stream=True)
+    resposta = await agendador.criar_async(cliente_assincrono, model=..., messages=...)
+    agendador.estatisticas()    # fila, em andamento, espera p50/p95
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+import openai
+
+from historico_conversa import contar_tokens_mensagens
+
+logger = logging.getLogger(__name__)
+
+MAX_SIMULTANEAS_PADRAO = 16
+TENTATIVAS_PADRAO = 3               # novas tentativas depois da primeira chamada
+ESPERA_BASE_PADRAO = 0.5            # segundos; dobra a cada tentativa
+ESPERA_MAXIMA_PADRAO = 20.0         # teto da espera (e do Retry-After aceito)
+TIMEOUT_FILA_PADRAO = 60.0          # tempo máximo esperando a vez
+AMOSTRAS_ESPERA = 1000              # esperas recentes usadas nos percentis
+
+
+class FilaEsgotada(TimeoutError):
+    """O pedido esperou mais que timeout_fila pela vez (a chamada ao modelo nem saiu)"""
+
+# ═══════════════════════════════════════════════════════
+# LIMITES POR MODELO
+# ═══════════════════════════════════════════════════════
+
+class BaldeTokens:
+    """Balde que se enche continuamente até o limite por minuto"""
+
+    def __init__(self, por_minuto):
+        self.capacidade = float(por_minuto)
+        self.taxa = self.capacidade / 60.0
+        self.disponivel = self.capacidade
+        self.atualizado = time.monotonic()
+
+    def espera(self, custo, agora):
+        """Segundos até o custo caber (0 se já cabe); custo acima da capacidade espera o balde cheio"""
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+        falta = min(custo, self.capacidade) - self.disponivel
+        return falta / self.taxa if falta > 0 else 0.0
+
+    def consumir(self, custo):
+        self.disponivel -= min(custo, self.capacidade)
+
+
+class _LimiteModelo:
+    """Baldes de requisições e de tokens de um modelo, e a pausa pedida por um 429"""
+
+    def __init__(self, requisicoes_por_minuto=None, tokens_por_minuto=None):
+        self.requisicoes = BaldeTokens(requisicoes_por_minuto) if requisicoes_por_minuto else None
+        self.tokens = BaldeTokens(tokens_por_minuto) if tokens_por_minuto else None
+        self.pausado_ate = 0.0
+
+    def espera(self, custo, agora):
+        espera = max(self.pausado_ate - agora, 0.0)
+        if self.requisicoes is not None:
+            espera = max(espera, self.requisicoes.espera(1, agora))
+        if self.tokens is not None:
+            espera = max(espera, self.tokens.espera(custo, agora))
+        return espera
+
+    def consumir(self, custo):
+        if self.requisicoes is not None:
+            self.requisicoes.consumir(1)
+        if self.tokens is not None:
+            self.tokens.consumir(custo)
+
+# ═══════════════════════════════════════════════════════
+# PEDIDOS
+# ═══════════════════════════════════════════════════════
+
+class _Pedido:
+    """Um pedido na fila; avisar() acorda quem espera (thread ou corrotina)"""
+
+    __slots__ = ("sessao", "modelo", "custo", "chegada", "liberado", "avisar")
+
+    def __init__(self, sessao, modelo, custo, avisar):
+        self.sessao = sessao
+        self.modelo = modelo
+        self.custo = custo
+        self.chegada = time.monotonic()
+        self.liberado = False
+        self.avisar = avisar
+
+
+def _acordar(futuro):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+def _status(excecao):
+    return getattr(excecao, "status_code", None)
+
+
+def _transitorio(excecao):
+    """429, 408/409, 5xx, timeout e falha de conexão valem uma nova tentativa"""
+    if isinstance(excecao, openai.APIConnectionError):
+        return True
+    status = _status(excecao)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+def _retry_after(excecao):
+    """Segundos pedidos pela API (retry-after-ms, retry-after em segundos ou data HTTP)"""
+    cabecalhos = getattr(getattr(excecao, "response", None), "headers", None)
+    if not cabecalhos:
+        return None
+    try:
+        if cabecalhos.get("retry-after-ms"):
+            return float(cabecalhos["retry-after-ms"]) / 1000
+        valor = cabecalhos.get("retry-after")
+        if not valor:
+            return None
+        try:
+            return float(valor)
+        except ValueError:
+            return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+# ═══════════════════════════════════════════════════════
+# AGENDADOR
+# ═══════════════════════════════════════════════════════
+
+class AgendadorLLM:
+    """Fila justa + limites por modelo + novas tentativas, para todo o processo"""
+
+    def __init__(self, limites=None, max_simultaneas=MAX_SIMULTANEAS_PADRAO, tentativas=TENTATIVAS_PADRAO,
+                 espera_base=ESPERA_BASE_PADRAO, espera_maxima=ESPERA_MAXIMA_PADRAO,
+                 timeout_fila=TIMEOUT_FILA_PADRAO, metricas=None):
+        """limites: {modelo: {"requisicoes_por_minuto", "tokens_por_minuto"}}; "padrao" vale para os demais"""
+        self.max_simultaneas = max_simultaneas
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.timeout_fila = timeout_fila
+        self.metricas = metricas
+        self._config_limites = dict(limites or {})
+        self._limites = {}
+
+        self._lock = threading.Lock()
+        self._filas = {}            # sessão -> deque de pedidos (FIFO por modelo dentro da sessão)
+        self._vez = deque()         # sessões com pedidos pendentes, na ordem em que serão atendidas
+        self._na_fila = 0
+        self._em_andamento = 0
+        self._esperas = deque(maxlen=AMOSTRAS_ESPERA)
+        self._contagens = {"atendidos": 0, "novas_tentativas": 0, "limitados_429": 0, "desistencias_fila": 0}
+        self._pico_fila = 0
+        self._sem_tentativas_sdk = weakref.WeakKeyDictionary()
+
+        if metricas is not None:
+            metricas.adicionar_medidor("chatbot_fila_pedidos", lambda: self._na_fila)
+            metricas.adicionar_medidor("chatbot_llm_em_andamento", lambda: self._em_andamento)
+
+    @classmethod
+    def de_config(cls, config_agendador=None, metricas=None):
+        """Agendador a partir da chave "agendador" do config/bot_config.json"""
+        config_agendador = config_agendador or {}
+        return cls(
+            config_agendador.get("limites"),
+            config_agendador.get("max_simultaneas", MAX_SIMULTANEAS_PADRAO),
+            config_agendador.get("tentativas", TENTATIVAS_PADRAO),
+            config_agendador.get("espera_base_segundos", ESPERA_BASE_PADRAO),
+            config_agendador.get("espera_maxima_segundos", ESPERA_MAXIMA_PADRAO),
+            config_agendador.get("timeout_fila_segundos", TIMEOUT_FILA_PADRAO),
+            metricas,
+        )
+
+    def _limite(self, modelo):
+        limite = self._limites.get(modelo)
+        if limite is None:
+            config = self._config_limites.get(modelo) or self._config_limites.get("padrao") or {}
+            limite = self._limites[modelo] = _LimiteModelo(
+                config.get("requisicoes_por_minuto"), config.get("tokens_por_minuto")
+            )
+        return limite
+
+    @staticmethod
+    def custo(parametros):
+        """Tokens que a chamada consome do limite por minuto: mensagens + max_tokens"""
+        modelo = parametros.get("model") or "gpt-4o"
+        maximo = parametros.get("max_completion_tokens") or parametros.get("max_tokens") or 0
+        return contar_tokens_mensagens(parametros.get("messages", []), modelo) + maximo
+
+    # ───────────────────────────────────────────────────
+    # Fila (tudo aqui roda com self._lock)
+    # ───────────────────────────────────────────────────
+
+    def _enfileirar(self, pedido):
+        fila = self._filas.get(pedido.sessao)
+        if fila is None:
+            fila = self._filas[pedido.sessao] = deque()
+            self._vez.append(pedido.sessao)
+        fila.append(pedido)
+        self._na_fila += 1
+        self._pico_fila = max(self._pico_fila, self._na_fila)
+
+    def _retirar(self, pedido):
+        fila = self._filas[pedido.sessao]
+        fila.remove(pedido)
+        self._na_fila -= 1
+        if not fila:
+            del self._filas[pedido.sessao]
+            self._vez.remove(pedido.sessao)
+
+    def _despachar(self):
+        """
+        Libera pedidos enquanto houver vaga, passando a vez de sessão em
+        sessão; devolve a menor espera de um modelo sem limite no momento
+        (None se nada espera por limite)
+        """
+        agora = time.monotonic()
+        menor_espera = None
+        while self._em_andamento < self.max_simultaneas and self._vez:
+            for _ in range(len(self._vez)):
+                sessao = self._vez[0]
+                fila = self._filas[sessao]
+                pedido, espera = self._proximo_da_sessao(fila, agora)
+                if pedido is None:
+                    # Nenhum modelo da sessão tem limite agora: a próxima sessão tenta
+                    self._vez.rotate(-1)
+                    menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+                    continue
+
+                self._limite(pedido.modelo).consumir(pedido.custo)
+                self._vez.popleft()
+                fila.remove(pedido)
+                if fila:
+                    self._vez.append(sessao)
+                else:
+                    del self._filas[sessao]
+                self._na_fila -= 1
+                self._em_andamento += 1
+                self._contagens["atendidos"] += 1
+                self._esperas.append(agora - pedido.chegada)
+                pedido.liberado = True
+                pedido.avisar()
+                break
+            else:
+                break
+        return menor_espera
+
+    def _proximo_da_sessao(self, fila, agora):
+        """
+        Primeiro pedido da sessão cujo modelo tem limite agora. A ordem é
+        FIFO por modelo: um pedido parado no limite do gpt-4o não segura o
+        do modelo rápido que chegou depois (cascata), mas um pedido do mesmo
+        modelo nunca passa à frente. Devolve (pedido, None) ou (None, menor espera)
+        """
+        bloqueados = set()
+        menor_espera = None
+        for pedido in fila:
+            if pedido.modelo in bloqueados:
+                continue
+            espera = self._limite(pedido.modelo).espera(pedido.custo, agora)
+            if espera <= 0:
+                return pedido, None
+            bloqueados.add(pedido.modelo)
+            menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+        return None, menor_espera
+
+    def _registrar_espera(self, pedido):
+        if self.metricas is not None:
+            self.metricas.observar_fila(pedido.modelo, time.monotonic() - pedido.chegada)
+
+    def _desistir(self, pedido):
+        """Pedido que não vai mais esperar (timeout, cancelamento): sai da fila ou devolve a vaga"""
+        with self._lock:
+            if pedido.liberado:
+                self._em_andamento -= 1
+            else:
+                self._retirar(pedido)
+            self._despachar()
+
+    def _devolver(self):
+        with self._lock:
+            self._em_andamento -= 1
+            self._despachar()
+
+    def _tempo_esgotado(self, pedido):
+        with self._lock:
+            self._contagens["desistencias_fila"] += 1
+        return FilaEsgotada(
+            f"Chamada ao modelo {pedido.modelo} esperou mais de {self.timeout_fila:.0f}s na fila do agendador"
+        )
+
+    def _aguardar_vez(self, sessao, modelo, custo):
+        evento = threading.Event()
+        pedido = _Pedido(sessao, modelo, custo, evento.set)
+        with self._lock:
+            self._enfileirar(pedido)
+            espera = self._despachar()
+        prazo = pedido.chegada + self.timeout_fila if self.timeout_fila else None
+        try:
+            while not pedido.liberado:
+                restante = prazo - time.monotonic() if prazo is not None else None
+                if restante is not None and restante <= 0:
+                    raise self._tempo_esgotado(pedido)
+                # Acorda quando for liberado ou quando o balde do modelo deve ter enchido
+                evento.wait(min(filter(None, (espera, restante)), default=None))
+                with self._lock:
+                    if not pedido.liberado:
+                        espera = self._despachar()
+        except BaseException:
+            # Timeout na fila ou rerun interrompido (StopException do Streamlit): o pedido sai da fila
+            self._desistir(pedido)
+            raise
+        self._registrar_espera(pedido)
+        return pedido
+
+    async def _aguardar_vez_async(self, sessao, modelo, custo):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        pedido = _Pedido(sessao, modelo, custo, lambda: loop.call_soon_threadsafe(_acordar, futuro))
+        with self._lock:
+            self._enfileirar(pedido)
+            espera = self._despachar()
+        prazo = pedido.chegada + self.timeout_fila if self.timeout_fila else None
+        try:
+            while not pedido.liberado:
+                restante = prazo - time.monotonic() if prazo is not None else None
+                if restante is not None and restante <= 0:
+                    raise self._tempo_esgotado(pedido)
+                await asyncio.wait({futuro}, timeout=min(filter(None, (espera, restante)), default=None))
+                with self._lock:
+                    if not pedido.liberado:
+                        espera = self._despachar()
+        except BaseException:
+            # Timeout na fila ou cliente desconectado (CancelledError): o pedido sai da fila
+            self._desistir(pedido)
+            raise
+        self._registrar_espera(pedido)
+        return pedido
+
+    # ───────────────────────────────────────────────────
+    # Novas tentativas
+    # ───────────────────────────────────────────────────
+
+    def _espera_nova_tentativa(self, excecao, tentativa, modelo):
+        """Segundos até a próxima tentativa, ou None se o erro deve subir"""
+        if tentativa >= self.tentativas or not _transitorio(excecao):
+            return None
+        pedida = _retry_after(excecao)
+        if pedida is not None and pedida > self.espera_maxima:
+            return None
+        # Jitter completo: sessões que falharam juntas não voltam juntas
+        espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa))
+        if pedida is not None:
+            espera = max(espera, pedida)
+
+        motivo = "limite" if _status(excecao) == 429 else ("status" if _status(excecao) else "conexao")
+        with self._lock:
+            self._contagens["novas_tentativas"] += 1
+            if motivo == "limite":
+                # O limite é da organização: todas as sessões esperam, não só quem levou o 429
+                self._contagens["limitados_429"] += 1
+                limite = self._limite(modelo)
+                limite.pausado_ate = max(limite.pausado_ate, time.monotonic() + espera)
+        if self.metricas is not None:
+            self.metricas.registrar_nova_tentativa(modelo, motivo)
+        logger.info("Nova tentativa %d para %s em %.2fs (%s)", tentativa + 1, modelo, espera, type(excecao).__name__)
+        return espera
+
+    def _sem_tentativas(self, cliente):
+        """Cópia do cliente sem as novas tentativas do SDK (quem repete é o agendador)"""
+        copia = self._sem_tentativas_sdk.get(cliente)
+        if copia is None:
+            copia = self._sem_tentativas_sdk[cliente] = cliente.with_options(max_retries=0)
+        return copia
+
+    # ───────────────────────────────────────────────────
+    # Chamadas
+    # ───────────────────────────────────────────────────
+
+    def criar(self, cliente, sessao=None, **parametros):
+        """chat.completions.create pelo agendador (cliente síncrono); bloqueia a thread enquanto espera"""
+        modelo = parametros.get("model")
+        custo = self.custo(parametros)
+        cliente = self._sem_tentativas(cliente)
+        tentativa = 0
+        while True:
+            self._aguardar_vez(sessao, modelo, custo)
+            try:
+                resultado = cliente.chat.completions.create(**parametros)
+            except BaseException as e:
+                self._devolver()
+                espera = self._espera_nova_tentativa(e, tentativa, modelo) if isinstance(e, Exception) else None
+                if espera is None:
+                    raise
+                tentativa += 1
+                time.sleep(espera)
+                continue
+            if parametros.get("stream"):
+                return _StreamAgendado(resultado, self._devolver)
+            self._devolver()
+            return resultado
+
+    async def criar_async(self, cliente, sessao=None, **parametros):
+        """chat.completions.create pelo agendador com um AsyncOpenAI"""
+        modelo = parametros.get("model")
+        custo = self.custo(parametros)
+        cliente = self._sem_tentativas(cliente)
+        tentativa = 0
+        while True:
+            await self._aguardar_vez_async(sessao, modelo, custo)
+            try:
+                resultado = await cliente.chat.completions.create(**parametros)
+            except BaseException as e:
+                self._devolver()
+                espera = self._espera_nova_tentativa(e, tentativa, modelo) if isinstance(e, Exception) else None
+                if espera is None:
+                    raise
+                tentativa += 1
+                await asyncio.sleep(espera)
+                continue
+            if parametros.get("stream"):
+                return _StreamAgendadoAsync(resultado, self._devolver)
+            self._devolver()
+            return resultado
+
+    # ───────────────────────────────────────────────────
+    # Estatísticas
+    # ───────────────────────────────────────────────────
+
+    def estatisticas(self):
+        """Fila agora, pico, chamadas em andamento e espera na fila (p50/p95/máx recentes)"""
+        with self._lock:
+            esperas = list(self._esperas)
+            estatisticas = {
+                "na_fila": self._na_fila,
+                "pico_fila": self._pico_fila,
+                "em_andamento": self._em_andamento,
+                "max_simultaneas": self.max_simultaneas,
+                "sessoes_na_fila": len(self._vez),
+                **self._contagens,
+            }
+        if esperas:
+            p50, p95 = np.percentile(esperas, [50, 95])
+            estatisticas["espera_s"] = {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "max": round(max(esperas), 3)}
+        else:
+            estatisticas["espera_s"] = None
+        return estatisticas
+
+# ═══════════════════════════════════════════════════════
+# STREAMS
+# ═══════════════════════════════════════════════════════
+
+class _Vaga:
+    """Vaga do agendador segurada por um stream; devolvida uma única vez"""
+
+    def __init__(self, devolver):
+        self._devolver = devolver
+        self._lock = threading.Lock()
+        self._devolvida = False
+
+    def devolver(self):
+        with self._lock:
+            if self._devolvida:
+                return
+            self._devolvida = True
+        self._devolver()
+
+
+def _fechar_abandonado(stream, vaga):
+    """Finalizador de um stream síncrono: fecha a resposta HTTP e devolve a vaga"""
+    try:
+        stream.close()
+    except Exception as e:
+        logger.debug("Falha ao fechar stream abandonado: %s", e)
+    finally:
+        vaga.devolver()
+
+
+class _StreamAgendado:
+    """Stream que devolve a vaga do agendador no último pedaço, no close() ou se for abandonado"""
+
+    def __init__(self, stream, devolver):
+        self._stream = stream
+        # Abandonado sem ser lido (rerun/stop do Streamlit antes do write_stream): o coletor devolve a vaga
+        self._finalizador = weakref.finalize(self, _fechar_abandonado, stream, _Vaga(devolver))
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        # O finalizador roda uma vez só: chamadas seguintes não fazem nada
+        self._finalizador()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+        return False
+
+    def __getattr__(self, nome):
+        return getattr(self._stream, nome)
+
+
+class _StreamAgendadoAsync:
+    """Mesmo que _StreamAgendado para o AsyncStream do AsyncOpenAI"""
+
+    def __init__(self, stream, devolver):
+        self._stream = stream
+        self._vaga = _Vaga(devolver)
+        # Sem laço de eventos no coletor: abandonado, só devolve a vaga (a resposta é liberada pelo httpx)
+        self._finalizador = weakref.finalize(self, self._vaga.devolver)
+
+    async def __aiter__(self):
+        try:
+            async for pedaco in self._stream:
+                yield pedaco
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._finalizador.detach() is not None:
+            try:
+                await self._stream.close()
+            finally:
+                self._vaga.devolver()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excecao):
+        await self.close()
+        return False
+
+    def __getattr__(self, nome):
+        return getattr(self._stream, nome)
@@ -0,0 +1,343 @@
+"""
+API HTTP assíncrona do RAG, ao lado da interface Streamlit
+
+As integrações (WhatsApp, widget do site) recebem as mesmas respostas do
+chat: mesma base, mesma busca, mesmo prompt (motor_rag.py). A base é
+carregada uma vez por processo, na subida; as chamadas ao modelo usam o
+AsyncOpenAI, então centenas de requisições simultâneas esperam a API sem
+ocupar uma thread cada. A busca (CPU) roda no pool de threads do loop.
+
+As chamadas entram no agendador do processo (agendador_llm.py): limites por
+modelo, fila justa por cliente (cabeçalho X-Sessao, ou o IP) e novas
+tentativas. Erros viram o status que o cliente pode tratar:
+    503 + Retry-After   estouro do tempo na fila do agendador, ou 429 da API
+                        mesmo depois das novas tentativas
+    504                 timeout da API do modelo
+    502                 outros erros da API do modelo
+    500                 falhas do próprio serviço (não são mascaradas como 502)
+No stream, a vaga na fila e a abertura do stream acontecem antes de a
+resposta começar, então valem os mesmos status; o evento "erro" fica para
+falhas no meio do texto.
+
+Rotas:
+    GET  /saude                  base carregada (trechos, versão) e fila do agendador
+    POST /v1/contexto            {"pergunta"} -> contexto recuperado, sem chamar o modelo
+    POST /v1/respostas           {"pergunta"} -> resposta completa em JSON
+    POST /v1/respostas/stream    {"pergunta"} -> tokens por server-sent events
+    GET  /metrics                métricas no formato do Prometheus ("metricas" ativo no config)
+
+Eventos do stream: "contexto" (trechos, relevâncias e o modelo escolhido), vários "token"
+({"texto"}), e por fim "fim" (uso de tokens, latência) ou "erro".
+
+Com API_RAG_CHAVE no ambiente, as rotas /v1 exigem "Authorization: Bearer <chave>".
+Depende de starlette e uvicorn (pip install starlette uvicorn).
+
+Uso (dentro de chatbot_streamlit/):
+    python api_rag.py --porta 8000 [--processos 4]
+    curl -N localhost:8000/v1/respostas/stream -d '{"pergunta": "Como gero um cartaz?"}'
+"""
+import argparse
+import asyncio
+import contextlib
+import hmac
+import json
+import os
+import time
+
+import openai
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from agendador_llm import AgendadorLLM, FilaEsgotada
+from cliente_openai import criar_cliente_assincrono
+from contexto_rag import hashes_trechos
+from metricas import Metricas
+from motor_rag import MotorRAG, uso_como_dict, CAMINHO_CONFIG_PADRAO, CAMINHO_PROMPT_PADRAO
+from rag_busca import cache_busca
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8000
+MAX_CONEXOES_LLM_PADRAO = 200       # chamadas simultâneas ao modelo por processo
+MAX_CARACTERES_PERGUNTA = 4000
+KEEPALIVE_SEGUNDOS = 75             # acima do ocioso típico dos balanceadores: conexão não morre no meio do reuso
+RETRY_AFTER_FILA_CHEIA = "5"        # segundos sugeridos ao cliente quando a fila estoura o timeout
+
+# ═══════════════════════════════════════════════════════
+# SERVIÇO
+# ═══════════════════════════════════════════════════════
+
+class ServicoRAG:
+    """Estado do processo: motor (base + prompt), cliente assíncrono e métricas"""
+
+    def __init__(self, motor, cliente, metricas):
+        self.motor = motor
+        self.cliente = cliente
+        self.metricas = metricas
+
+    def _preparar(self, pergunta):
+        motor = self.motor
+        candidatos, origem = cache_busca.buscar_com_origem(pergunta, motor.base, motor.max_candidatos, motor.motor_busca)
+        return motor.preparar(pergunta, candidatos, origem)
+
+    async def preparar(self, pergunta):
+        """Busca + empacotamento do contexto numa thread: o loop segue atendendo os streams"""
+        with self.metricas.etapa("buscar_contexto_relevante"):
+            return await asyncio.to_thread(self._preparar, pergunta)
+
+    async def responder(self, pergunta, sessao=None):
+        motor = self.motor
+        preparo = await self.preparar(pergunta)
+        inicio = time.perf_counter()
+        with self.metricas.etapa("chat_completions"):
+            resposta = await motor.agendador.criar_async(
+                self.cliente, sessao=sessao, **motor.parametros_chat(preparo['mensagens'], preparo['modelo'])
+            )
+        segundos = time.perf_counter() - inicio
+        resultado = motor.resultado(preparo, resposta, segundos)
+        self.metricas.registrar_resposta(resultado["modelo"], resposta.usage, resultado["relevancias"])
+        if preparo['roteamento'] is not None:
+            self.metricas.registrar_roteamento(preparo['roteamento'], segundos)
+        return resultado
+
+    async def abrir_stream(self, preparo, sessao=None):
+        """
+        Espera a vez no agendador e abre o stream antes de a resposta HTTP
+        começar: fila estourada ou erro da API ainda viram 503/502/504
+        """
+        motor = self.motor
+        return await motor.agendador.criar_async(
+            self.cliente,
+            sessao=sessao,
+            **motor.parametros_chat(preparo['mensagens'], preparo['modelo']),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+    async def transmitir(self, preparo, stream, inicio):
+        """Gera os eventos SSE de uma resposta em streaming (stream aberto por abrir_stream)"""
+        yield _evento("contexto", {
+            "relevancias": [round(float(relevancia), 4) for relevancia, _ in preparo['trechos']],
+            "trechos": hashes_trechos(preparo['trechos']),
+            "tokens_contexto": preparo['estatisticas']['tokens_depois'],
+            "modelo": preparo['modelo'],
+            "roteamento": preparo['roteamento'],
+        })
+
+        tempo_primeiro_token = None
+        uso = None
+        modelo = preparo['modelo']
+        try:
+            async for pedaco in stream:
+                modelo = pedaco.model or modelo
+                if pedaco.usage is not None:
+                    uso = pedaco.usage
+                if not pedaco.choices:
+                    continue
+                texto = pedaco.choices[0].delta.content
+                if texto:
+                    if tempo_primeiro_token is None:
+                        tempo_primeiro_token = time.perf_counter() - inicio
+                    yield _evento("token", {"texto": texto})
+        except Exception as e:     # o status 200 já foi enviado: o erro vai como evento
+            yield _evento("erro", {"mensagem": f"{type(e).__name__}: {e}"[:300]})
+            return
+        finally:
+            # Cliente desconectou no meio: fecha a resposta da API em vez de drená-la (e devolve a vaga)
+            await stream.close()
+
+        segundos = time.perf_counter() - inicio
+        self.metricas.observar_etapa("chat_completions", segundos)
+        self.metricas.registrar_resposta(
+            modelo, uso, [relevancia for relevancia, _ in preparo['trechos']], tempo_primeiro_token
+        )
+        if preparo['roteamento'] is not None:
+            self.metricas.registrar_roteamento(preparo['roteamento'], segundos, tempo_primeiro_token)
+        yield _evento("fim", {
+            "modelo": modelo,
+            "tokens": uso_como_dict(uso),
+            "tempo_primeiro_token_s": round(tempo_primeiro_token, 3) if tempo_primeiro_token is not None else None,
+            "latencia_s": round(segundos, 3),
+        })
+
+
+def _evento(nome, dados):
+    return f"event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+# ═══════════════════════════════════════════════════════
+# ROTAS
+# ═══════════════════════════════════════════════════════
+
+def _erro_do_modelo(excecao):
+    """HTTPException para uma falha do agendador ou da API do modelo (depois das novas tentativas)"""
+    if isinstance(excecao, FilaEsgotada):
+        return HTTPException(503, "Fila de chamadas ao modelo cheia", headers={"Retry-After": RETRY_AFTER_FILA_CHEIA})
+    if isinstance(excecao, openai.RateLimitError):
+        espera = excecao.response.headers.get("retry-after") or RETRY_AFTER_FILA_CHEIA
+        return HTTPException(503, "Limite de uso da API do modelo atingido", headers={"Retry-After": espera})
+    if isinstance(excecao, openai.APITimeoutError):
+        return HTTPException(504, "A API do modelo não respondeu a tempo")
+    return HTTPException(502, f"Falha ao gerar a resposta: {type(excecao).__name__}")
+
+
+def _autorizar(request):
+    chave = os.getenv("API_RAG_CHAVE")
+    if not chave:
+        return
+    enviada = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(enviada.encode('utf-8'), chave.encode('utf-8')):
+        raise HTTPException(401, "Chave de API inválida")
+
+
+def _sessao(request):
+    """Chave da fila justa: X-Sessao enviado pela integração, ou o IP do cliente"""
+    return request.headers.get("x-sessao") or (request.client.host if request.client else None)
+
+
+async def _ler_pergunta(request):
+    _autorizar(request)
+    try:
+        corpo = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Corpo deve ser JSON: {\"pergunta\": \"...\"}")
+    pergunta = corpo.get("pergunta") if isinstance(corpo, dict) else None
+    if not isinstance(pergunta, str) or not pergunta.strip():
+        raise HTTPException(400, "Campo 'pergunta' vazio ou ausente")
+    if len(pergunta) > MAX_CARACTERES_PERGUNTA:
+        raise HTTPException(413, f"Pergunta com mais de {MAX_CARACTERES_PERGUNTA} caracteres")
+    return pergunta.strip()
+
+
+async def saude(request):
+    motor = request.app.state.servico.motor
+    return JSONResponse({
+        "status": "ok",
+        "trechos": len(motor.base['registros']),
+        "versao": motor.base['versao'],
+        "agendador": motor.agendador.estatisticas(),
+    })
+
+
+async def contexto(request):
+    pergunta = await _ler_pergunta(request)
+    servico = request.app.state.servico
+    preparo = await servico.preparar(pergunta)
+    return JSONResponse({**servico.motor.resultado(preparo), "contexto": preparo['contexto']})
+
+
+async def respostas(request):
+    pergunta = await _ler_pergunta(request)
+    try:
+        resultado = await request.app.state.servico.responder(pergunta, _sessao(request))
+    except (FilaEsgotada, openai.APIError) as e:
+        raise _erro_do_modelo(e)
+    return JSONResponse(resultado)
+
+
+async def respostas_stream(request):
+    pergunta = await _ler_pergunta(request)
+    servico = request.app.state.servico
+    preparo = await servico.preparar(pergunta)
+    inicio = time.perf_counter()
+    try:
+        stream = await servico.abrir_stream(preparo, _sessao(request))
+    except (FilaEsgotada, openai.APIError) as e:
+        raise _erro_do_modelo(e)
+    return StreamingResponse(
+        servico.transmitir(preparo, stream, inicio),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def metricas(request):
+    servico = request.app.state.servico
+    if not servico.metricas.ativo:
+        raise HTTPException(404, "Métricas desligadas (config: metricas.ativo)")
+    return PlainTextResponse(
+        servico.metricas.exportar_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+async def _erro_http(request, excecao):
+    return JSONResponse({"erro": excecao.detail}, status_code=excecao.status_code, headers=excecao.headers)
+
+# ═══════════════════════════════════════════════════════
+# APLICAÇÃO
+# ═══════════════════════════════════════════════════════
+
+def criar_app(caminho_config=None, caminho_prompt=None):
+    """App Starlette; a base é montada na subida de cada processo (lifespan), não por requisição"""
+    caminho_config = caminho_config or os.getenv("API_RAG_CONFIG", CAMINHO_CONFIG_PADRAO)
+    caminho_prompt = caminho_prompt or os.getenv("API_RAG_PROMPT", CAMINHO_PROMPT_PADRAO)
+
+    @contextlib.asynccontextmanager
+    async def ciclo_de_vida(app):
+        motor = await asyncio.to_thread(MotorRAG.de_config, caminho_config, caminho_prompt)
+        if not motor.api_key:
+            raise RuntimeError("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
+
+        config_api = motor.config.get("api", {})
+        max_conexoes = config_api.get("max_conexoes_llm", MAX_CONEXOES_LLM_PADRAO)
+        config_http = {**motor.config.get("cliente_http", {}), "max_conexoes": max_conexoes, "max_keepalive": max_conexoes}
+        cliente = criar_cliente_assincrono(motor.api_key, motor.config.get("base_url"), config_http)
+
+        config_metricas = motor.config.get("metricas", {})
+        metricas = Metricas(config_metricas.get("ativo", False), config_metricas.get("arquivo_jsonl"))
+        motor.agendador = AgendadorLLM.de_config(motor.config.get("agendador"), metricas)
+
+        app.state.servico = ServicoRAG(motor, cliente, metricas)
+        try:
+            yield
+        finally:
+            await cliente.close()
+            metricas.fechar()
+
+    return Starlette(
+        routes=[
+            Route("/saude", saude, methods=["GET"]),
+            Route("/v1/contexto", contexto, methods=["POST"]),
+            Route("/v1/respostas", respostas, methods=["POST"]),
+            Route("/v1/respostas/stream", respostas_stream, methods=["POST"]),
+            Route("/metrics", metricas, methods=["GET"]),
+        ],
+        exception_handlers={HTTPException: _erro_http},
+        lifespan=ciclo_de_vida,
+    )
+
+
+def main(argv=None):
+    import uvicorn
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="API HTTP assíncrona do RAG")
+    parser.add_argument("--config", default=CAMINHO_CONFIG_PADRAO)
+    parser.add_argument("--prompt", default=CAMINHO_PROMPT_PADRAO)
+    parser.add_argument("--host", help="padrão: api.host do config ou 127.0.0.1")
+    parser.add_argument("--porta", type=int, help="padrão: api.porta do config ou 8000")
+    parser.add_argument("--processos", type=int, default=1, help="processos do uvicorn (cada um carrega a base)")
+    args = parser.parse_args(argv)
+
+    config_api = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config_api = json.load(f).get("api", {})
+
+    # Os processos do uvicorn importam o app pela fábrica: os caminhos vão pelo ambiente
+    os.environ["API_RAG_CONFIG"] = args.config
+    os.environ["API_RAG_PROMPT"] = args.prompt
+    uvicorn.run(
+        "api_rag:criar_app",
+        factory=True,
+        host=args.host or config_api.get("host", HOST_PADRAO),
+        port=args.porta or config_api.get("porta", PORTA_PADRAO),
+        workers=args.processos,
+        timeout_keep_alive=KEEPALIVE_SEGUNDOS,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Histórico das conversas em SQLite, só com acréscimos
+
+Cada mensagem exibida no chat (usuário, assistente, contexto RAG) vira uma
+linha da tabela 'mensagens'; nada é reescrito nem apagado. "Limpar" apenas
+começa uma conversa nova, e a antiga continua no arquivo.
+
+A tela lê só as últimas N mensagens da conversa (índice por conversa + id,
+custo proporcional a N e não ao tamanho do histórico), e o botão "carregar
+anteriores" aumenta a janela. O id da conversa vai na URL (?conversa=...),
+então recarregar a página ou reiniciar o processo não perde o histórico.
+
+Sem caminho configurado, o banco fica em memória (some com o processo).
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+MENSAGENS_VISIVEIS_PADRAO = 30
+
+
+def nova_conversa():
+    """Id de uma conversa nova (vai na URL)"""
+    return uuid.uuid4().hex
+
+
+class ArmazemConversas:
+    """Mensagens das conversas de todas as sessões do servidor (uma conexão por processo)"""
+
+    def __init__(self, caminho_sqlite=None):
+        if caminho_sqlite:
+            Path(caminho_sqlite).parent.mkdir(parents=True, exist_ok=True)
+        self.caminho = caminho_sqlite or ":memory:"
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        if caminho_sqlite:
+            # WAL: o acréscimo de um turno não bloqueia as leituras das outras sessões
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS mensagens ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, conversa TEXT NOT NULL,"
+            " papel TEXT NOT NULL, conteudo TEXT NOT NULL, criado_em REAL NOT NULL)"
+        )
+        self._conexao.execute(
+            "CREATE INDEX IF NOT EXISTS mensagens_por_conversa ON mensagens (conversa, id)"
+        )
+        self._conexao.commit()
+
+    # ───────────────────────────────────────────────────
+    # Escrita
+    # ───────────────────────────────────────────────────
+
+    def acrescentar(self, conversa, papel, conteudo):
+        """Grava uma mensagem no fim da conversa"""
+        with self._lock:
+            self._conexao.execute(
+                "INSERT INTO mensagens (conversa, papel, conteudo, criado_em) VALUES (?, ?, ?, ?)",
+                (conversa, papel, conteudo, time.time()),
+            )
+            self._conexao.commit()
+
+    # ───────────────────────────────────────────────────
+    # Leitura
+    # ───────────────────────────────────────────────────
+
+    def ultimas(self, conversa, limite=MENSAGENS_VISIVEIS_PADRAO):
+        """
+        As últimas 'limite' mensagens da conversa, da mais antiga para a mais
+        nova, e se há mensagens anteriores a elas
+        """
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT papel, conteudo FROM mensagens WHERE conversa = ?"
+                " ORDER BY id DESC LIMIT ?", (conversa, limite + 1)
+            ).fetchall()
+        ha_anteriores = len(linhas) > limite
+        mensagens = [{"role": papel, "content": conteudo} for papel, conteudo in reversed(linhas[:limite])]
+        return mensagens, ha_anteriores
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
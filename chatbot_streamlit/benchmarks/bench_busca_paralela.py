@@ -0,0 +1,110 @@
+"""
+Benchmark da busca em fatias (busca_paralela.py): latência x número de processos
+
+Monta uma base sintética grande (corpus_sintetico.py), roda as perguntas
+rotuladas com a busca num processo só e com as fatias em 2, 4... processos,
+e mede a latência por consulta (p50/p95) de cada motor. Confere também que
+o top-k de cada pergunta (relevância e id de cada trecho) é idêntico ao da
+busca num processo só.
+
+O ganho depende dos núcleos livres: com N núcleos, a varredura cai para
+~1/N mais o custo fixo de mandar a consulta e juntar os top-k (~1 ms).
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_busca_paralela.py [--escala 300] [--processos 1 2 4]
+        [--motores bm25 similaridade] [--limite 20] [--saida busca_paralela.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import montar_base, buscar_trechos
+from busca_paralela import ativar_busca_paralela
+from corpus_sintetico import gerar_corpus
+
+DIRETORIO = Path(__file__).resolve().parent
+
+
+def _percentis(amostras_ms):
+    p50, p95 = np.percentile(amostras_ms, [50, 95])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+
+
+def _top_k(base, perguntas, motor, max_resultados):
+    return [
+        [(relevancia, registro['id']) for relevancia, registro in buscar_trechos(p, base, max_resultados, motor, faq=False)]
+        for p in perguntas
+    ]
+
+
+def medir(base, perguntas, motor, max_resultados, repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        for pergunta in perguntas:
+            inicio = time.perf_counter()
+            buscar_trechos(pergunta, base, max_resultados, motor, faq=False)
+            amostras.append((time.perf_counter() - inicio) * 1e3)
+    return _percentis(amostras)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latência da busca em fatias por número de processos")
+    parser.add_argument("--base", default="conhecimento/base_conhecimento.txt")
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--escala", type=float, default=300, help="tamanho da base sintética (x a original)")
+    parser.add_argument("--processos", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--motores", nargs="+", choices=["bm25", "similaridade"], default=["bm25", "similaridade"])
+    parser.add_argument("--limite", type=int, default=20, help="perguntas usadas")
+    parser.add_argument("--max-resultados", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=2)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = montar_base(gerar_corpus(f.read(), args.escala))
+    with open(args.perguntas, 'r', encoding='utf-8') as f:
+        perguntas = [item["pergunta"] for item in json.load(f)["perguntas"]][:args.limite]
+    print(f"📚 {len(base['registros'])} trechos ({args.escala:g}x), {len(perguntas)} perguntas, "
+          f"{os.cpu_count()} núcleos")
+
+    relatorio = {"trechos": len(base['registros']), "nucleos": os.cpu_count(), "motores": {}}
+    for motor in args.motores:
+        referencia = _top_k(base, perguntas, motor, args.max_resultados)
+        resultados = {}
+        for processos in args.processos:
+            if processos <= 1:
+                alvo = base
+            else:
+                alvo = ativar_busca_paralela(dict(base), {"processos": processos, "minimo_trechos": 0})
+            try:
+                # Aquecimento: cada trabalhador lê a sua fatia (e monta os postings) na 1ª consulta
+                identico = _top_k(alvo, perguntas, motor, args.max_resultados) == referencia
+                latencia = medir(alvo, perguntas, motor, args.max_resultados, args.repeticoes)
+            finally:
+                if 'fatias' in alvo:
+                    alvo['fatias'].fechar()
+            resultados[str(processos)] = {"latencia_ms": latencia, "top_k_identico": identico}
+            base_p50 = resultados[str(args.processos[0])]["latencia_ms"]["p50"]
+            print(f"   {motor:13s} {processos} processo(s): p50 {latencia['p50']:9.2f} ms  p95 {latencia['p95']:9.2f} ms  "
+                  f"({base_p50 / latencia['p50']:.2f}x)  top-k {'idêntico' if identico else 'DIFERENTE'}")
+        relatorio["motores"][motor] = resultados
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+    divergentes = [
+        (motor, processos) for motor, resultados in relatorio["motores"].items()
+        for processos, dados in resultados.items() if not dados["top_k_identico"]
+    ]
+    return 1 if divergentes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Benchmark do rerun do bot5_rag.py conforme o histórico da conversa cresce
+
+Grava conversas de tamanhos crescentes no SQLite (armazem_conversas.py) e
+mede o tempo de um rerun do app (AppTest do Streamlit, sem chamar o LLM)
+em dois modos:
+    janela  só as últimas N mensagens (config "conversas.mensagens_visiveis")
+    tudo    todas as mensagens, como era antes da janela
+
+Roda numa cópia temporária de config/, prompts/ e da base de conhecimento,
+com o cache de respostas e as métricas desligados; nada do diretório de
+trabalho é alterado.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_historico.py [--tamanhos 30 300 3000] [--reruns 5] [--saida historico.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from armazem_conversas import ArmazemConversas, nova_conversa, MENSAGENS_VISIVEIS_PADRAO
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP = RAIZ / "bot5_rag.py"
+
+RESPOSTA = (
+    "Para guardar valores entre reruns use st.session_state, que funciona como um dicionário "
+    "por sessão. Inicialize a chave antes de ler e altere-a nos callbacks dos widgets.\n\n"
+    "```python\nif 'contador' not in st.session_state:\n    st.session_state['contador'] = 0\n```"
+)
+CONTEXTO = "**1. [relevância 0.82]** session_state guarda o estado da sessão entre reruns. " * 6
+
+
+def preparar_diretorio(destino, visiveis):
+    """Cópia mínima do app: config (com o SQLite no diretório temporário), prompts e base"""
+    shutil.copytree(RAIZ / "prompts", destino / "prompts")
+    (destino / "conhecimento").mkdir()
+    shutil.copy(RAIZ / "conhecimento" / "base_conhecimento.txt", destino / "conhecimento")
+    with open(RAIZ / "config" / "bot_config.json", 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config["cache_respostas"] = {"ativo": False}
+    config["metricas"] = {"ativo": False}
+    config["conversas"] = {"sqlite": str(destino / "conversas.sqlite"), "mensagens_visiveis": visiveis}
+    (destino / "config").mkdir()
+    with open(destino / "config" / "bot_config.json", 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    return config["conversas"]["sqlite"]
+
+
+def gravar_conversa(armazem, mensagens):
+    """Conversa com 'mensagens' linhas no formato do bot: usuário, assistente, contexto"""
+    conversa = nova_conversa()
+    papeis = ("user", "assistant", "context")
+    for i in range(mensagens):
+        papel = papeis[i % 3]
+        conteudo = {"user": f"Pergunta {i // 3}: como usar session_state?", "assistant": RESPOSTA, "context": CONTEXTO}[papel]
+        armazem.acrescentar(conversa, papel, conteudo)
+    return conversa
+
+
+def medir_reruns(conversa, visiveis, reruns, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP), default_timeout=timeout)
+    app.query_params["conversa"] = conversa
+    app.session_state["mensagens_visiveis"] = visiveis
+    app.run()  # 1º run: carrega base, cliente e agendador (cache_resource)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    amostras = []
+    for _ in range(reruns):
+        inicio = time.perf_counter()
+        app.run()
+        amostras.append((time.perf_counter() - inicio) * 1e3)
+    renderizadas = len(app.chat_message)
+    p50, p95 = np.percentile(amostras, [50, 95])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "mensagens_renderizadas": renderizadas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de rerun x tamanho do histórico")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[30, 300, 3000], help="mensagens na conversa")
+    parser.add_argument("--visiveis", type=int, default=MENSAGENS_VISIVEIS_PADRAO)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")  # nenhuma chamada ao LLM é feita
+    original = os.getcwd()
+    relatorio = {"visiveis": args.visiveis, "tamanhos": {}}
+    with tempfile.TemporaryDirectory() as temporario:
+        destino = Path(temporario)
+        caminho_sqlite = preparar_diretorio(destino, args.visiveis)
+        os.chdir(destino)
+        try:
+            armazem = ArmazemConversas(caminho_sqlite)
+            for tamanho in args.tamanhos:
+                conversa = gravar_conversa(armazem, tamanho)
+                janela = medir_reruns(conversa, args.visiveis, args.reruns, args.timeout)
+                tudo = medir_reruns(conversa, tamanho, args.reruns, args.timeout)
+                relatorio["tamanhos"][str(tamanho)] = {"janela_ms": janela, "tudo_ms": tudo}
+                print(f"💬 {tamanho:6d} mensagens  janela p50 {janela['p50']:9.2f} ms "
+                      f"({janela['mensagens_renderizadas']} balões)  tudo p50 {tudo['p50']:9.2f} ms "
+                      f"({tudo['mensagens_renderizadas']} balões)")
+            armazem.fechar()
+        finally:
+            os.chdir(original)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Benchmark do índice em disco (indice_disco.py): abertura e fidelidade ao índice em memória
+
+Para cada escala do corpus sintético (corpus_sintetico.py), grava o índice
+binário e mede quanto custa abri-lo (tempo e memória alocada pelo Python
+durante abrir_indice(), via tracemalloc), comparando com montar a base
+em memória. Depois confere que o top-k de cada pergunta rotulada
+(relevância e id de cada trecho, com e sem o atalho do FAQ) é idêntico nas
+duas bases para cada motor; qualquer diferença encerra com código 1.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_indice_disco.py [--escalas 1 30 300] [--motores bm25 similaridade] [--saida indice.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import montar_base, buscar_trechos
+from indice_disco import gravar_indice, abrir_indice
+from corpus_sintetico import gerar_corpus
+
+DIRETORIO = Path(__file__).resolve().parent
+
+
+def _medir_abertura(funcao):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    tempo_ms = (time.perf_counter() - inicio) * 1e3
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, {"ms": round(tempo_ms, 2), "pico_kb": round(pico / 1024, 1)}
+
+
+def _top_k(base, perguntas, motor, max_resultados, faq):
+    return [
+        [(relevancia, registro['id']) for relevancia, registro in buscar_trechos(p, base, max_resultados, motor, faq)]
+        for p in perguntas
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Abertura do índice em disco x base em memória")
+    parser.add_argument("--base", default="conhecimento/base_conhecimento.txt")
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 30, 300])
+    parser.add_argument("--motores", nargs="+", choices=["bm25", "similaridade"], default=["bm25", "similaridade"])
+    parser.add_argument("--limite-similaridade", type=int, default=5000,
+                        help="acima desse número de trechos o motor similaridade não é conferido (lento)")
+    parser.add_argument("--max-resultados", type=int, default=5)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        original = f.read()
+    with open(args.perguntas, 'r', encoding='utf-8') as f:
+        perguntas = [item["pergunta"] for item in json.load(f)["perguntas"]]
+
+    relatorio = {}
+    divergencias = 0
+    with tempfile.TemporaryDirectory() as temporario:
+        for escala in args.escalas:
+            conteudo = gerar_corpus(original, escala)
+            memoria, montagem = _medir_abertura(lambda: montar_base(conteudo))
+            caminho = os.path.join(temporario, f"base_{escala:g}.idx")
+            gravar_indice(memoria, caminho)
+            mapeada, abertura = _medir_abertura(lambda: abrir_indice(caminho))
+
+            resultado = {
+                "trechos": len(memoria['registros']),
+                "montar_em_memoria": montagem,
+                "abrir_indice": abertura,
+                "top_k_identico": {},
+            }
+            for motor in args.motores:
+                if motor == "similaridade" and len(memoria['registros']) > args.limite_similaridade:
+                    continue
+                for faq in (True, False):
+                    identico = (_top_k(mapeada, perguntas, motor, args.max_resultados, faq)
+                                == _top_k(memoria, perguntas, motor, args.max_resultados, faq))
+                    resultado["top_k_identico"][f"{motor}{'+faq' if faq else ''}"] = identico
+                    divergencias += not identico
+            resultado["hashes_identicos"] = (
+                set(mapeada['hashes']) == set(memoria['hashes'])
+                and all(h in mapeada['hashes'] for h in memoria['hashes'])
+            )
+            divergencias += not resultado["hashes_identicos"]
+
+            relatorio[f"{escala:g}x"] = resultado
+            print(f"📚 {escala:g}x: {resultado['trechos']} trechos  "
+                  f"montar {montagem['ms']:9.1f} ms / {montagem['pico_kb']:10.1f} KB  "
+                  f"abrir {abertura['ms']:7.2f} ms / {abertura['pico_kb']:7.1f} KB")
+            for nome, identico in resultado["top_k_identico"].items():
+                print(f"   {nome:18s} top-k {'idêntico' if identico else 'DIFERENTE'}")
+            print(f"   hashes            {'idênticos' if resultado['hashes_identicos'] else 'DIFERENTES'}")
+            mapeada['arquivo_indice'] = None
+            del mapeada, memoria
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+    return 1 if divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: custo por consulta do motor 'similaridade'
+antes (renormaliza trechos e pergunta a cada comparação) e
+depois (registros pré-normalizados em montar_base).
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_normalizacao.py [caminho_base] [repeticoes]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import (
+    LIMIAR_BLOCO, LIMIAR_SENTENCA, TAMANHO_MINIMO_SENTENCA,
+    calcular_similaridade, montar_base, buscar_trechos, vetorizar_perguntas,
+)
+
+PERGUNTAS = [
+    "Como faço para sair do programa?",
+    "Quero adicionar um novo usuário",
+    "Como funcionam os 30 dias de gratuidade?",
+    "Posso trocar o número do whatsapp?",
+    "Como gerar cartazes de oferta",
+    "Tenho direito a reembolso?",
+]
+
+
+def busca_antes(pergunta, base):
+    """Loop original: normaliza pergunta e trecho em toda comparação"""
+    resultados = []
+    for bloco in base['blocos']:
+        similaridade = calcular_similaridade(pergunta, bloco)
+        if similaridade > LIMIAR_BLOCO:
+            resultados.append((similaridade, bloco, 'bloco'))
+    for sentenca in base['sentencas']:
+        if len(sentenca) > TAMANHO_MINIMO_SENTENCA:
+            similaridade = calcular_similaridade(pergunta, sentenca)
+            if similaridade > LIMIAR_SENTENCA:
+                resultados.append((similaridade, sentenca, 'sentenca'))
+    resultados.sort(key=lambda x: x[0], reverse=True)
+    return resultados[:3]
+
+
+def busca_depois(pergunta, base):
+    return [
+        (sim, registro['texto'], registro['tipo'])
+        for sim, registro in buscar_trechos(pergunta, base, 3, motor="similaridade", faq=False)
+    ]
+
+
+def medir(funcao, base, repeticoes):
+    tempo = timeit.timeit(lambda: [funcao(p, base) for p in PERGUNTAS], number=repeticoes)
+    return tempo / (repeticoes * len(PERGUNTAS)) * 1e3
+
+
+def main():
+    caminho = sys.argv[1] if len(sys.argv) > 1 else "conhecimento/base_conhecimento.txt"
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with open(caminho, 'r', encoding='utf-8') as f:
+        base = montar_base(f.read())
+
+    # As duas versões precisam devolver exatamente os mesmos trechos
+    for pergunta in PERGUNTAS:
+        assert busca_antes(pergunta, base) == busca_depois(pergunta, base), pergunta
+
+    antes = medir(busca_antes, base, repeticoes)
+    depois = medir(busca_depois, base, repeticoes)
+    bm25 = medir(lambda p, b: buscar_trechos(p, b, 3, motor="bm25", faq=False), base, repeticoes)
+    perguntas = medir(lambda p, b: buscar_trechos(p, b, 3, motor="bm25"), base, repeticoes)
+
+    print(f"Trechos indexados: {len(base['registros'])}")
+    print(f"similaridade (antes):  {antes:8.3f} ms/consulta")
+    print(f"similaridade (depois): {depois:8.3f} ms/consulta  ({antes / depois:.2f}x)")
+    print(f"bm25:                  {bm25:8.3f} ms/consulta")
+    if 'faq' in base:
+        print(f"perguntas do FAQ:      {perguntas:8.3f} ms/consulta  ({len(base['faq'])} perguntas)")
+        vetorizar_perguntas(base)
+        atalho = medir(lambda p, b: buscar_trechos(p, b, 3, motor="bm25"), base, repeticoes)
+        print(f"atalho vetorial (FAQ): {atalho:8.3f} ms/consulta")
+
+
+if __name__ == "__main__":
+    main()
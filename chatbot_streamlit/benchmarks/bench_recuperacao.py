@@ -0,0 +1,203 @@
+"""
+Benchmark de recuperação: qualidade e custo de cada motor de busca
+
+Para cada escala do corpus (base original e versões sintéticas 10x, 100x,
+1000x de corpus_sintetico.py) e cada motor, roda as perguntas rotuladas
+(perguntas_rotuladas.json) e mede:
+    - recall@k (k = 1, 3, 5, 10) e MRR da entrada esperada do FAQ
+    - latência por consulta: p50 / p95 / p99 (ms)
+    - pico de memória alocada durante as consultas (tracemalloc)
+e também o tempo e o pico de memória da montagem da base.
+
+Um trecho conta como acerto se for o bloco da entrada esperada ou uma
+sentença contida nele. O resultado vai para um JSON com chaves ordenadas,
+para comparar (diff) entre commits.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_recuperacao.py [--escalas 1 10 100 1000] [--motores bm25 vetorial faq]
+                                           [--repeticoes 3] [--saida benchmarks/resultados_recuperacao.json]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import montar_base, buscar_trechos, vetorizar_perguntas
+from rag_vetorial import criar_vetorizador
+from corpus_sintetico import gerar_corpus
+
+DIRETORIO = Path(__file__).resolve().parent
+KS = (1, 3, 5, 10)
+
+# nome -> (motor de buscar_trechos, usa o índice de perguntas do FAQ)
+MOTORES = {
+    "bm25": ("bm25", False),
+    "similaridade": ("similaridade", False),
+    "vetorial": ("vetorial", False),
+    "faq": ("bm25", True),
+}
+
+# A varredura com SequenceMatcher é O(trechos x tamanho); acima disso é pulada
+MAX_TRECHOS_SIMILARIDADE = 2000
+
+
+def carregar_perguntas(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)["perguntas"]
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=DIRETORIO
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentis(amostras_ms):
+    p50, p95, p99 = np.percentile(amostras_ms, [50, 95, 99])
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+
+
+def _acertou(registro, bloco_esperado):
+    if registro['tipo'] == 'bloco':
+        return registro['texto'] == bloco_esperado
+    return registro['texto'] in bloco_esperado
+
+# ═══════════════════════════════════════════════════════
+# MEDIÇÕES
+# ═══════════════════════════════════════════════════════
+
+def montar(conteudo, config_embeddings):
+    """Monta a base medindo tempo e pico de memória"""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    base = montar_base(conteudo, criar_vetorizador(config_embeddings))
+    vetorizar_perguntas(base)
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return base, {"construcao_s": round(duracao, 3), "memoria_construcao_mb": round(pico / 2**20, 2)}
+
+
+def avaliar_qualidade(base, perguntas, motor, faq):
+    blocos_por_entrada = {e['id']: base['blocos'][e['bloco']] for e in base['faq']}
+    acertos = {k: 0 for k in KS}
+    reciprocos = 0.0
+    for item in perguntas:
+        esperado = blocos_por_entrada[item["entrada"]]
+        resultados = buscar_trechos(item["pergunta"], base, max(KS), motor, faq)
+        posicao = next(
+            (i for i, (_, registro) in enumerate(resultados, 1) if _acertou(registro, esperado)), None
+        )
+        if posicao is not None:
+            reciprocos += 1 / posicao
+            for k in KS:
+                acertos[k] += posicao <= k
+    total = len(perguntas)
+    qualidade = {f"recall@{k}": round(acertos[k] / total, 4) for k in KS}
+    qualidade["mrr"] = round(reciprocos / total, 4)
+    return qualidade
+
+
+def medir_latencia(base, perguntas, motor, faq, repeticoes):
+    # Aquecimento: a primeira consulta paga caches do tokenizador e do NumPy
+    for item in perguntas:
+        buscar_trechos(item["pergunta"], base, max(KS), motor, faq)
+    amostras = []
+    for _ in range(repeticoes):
+        for item in perguntas:
+            inicio = time.perf_counter()
+            buscar_trechos(item["pergunta"], base, max(KS), motor, faq)
+            amostras.append((time.perf_counter() - inicio) * 1e3)
+    return _percentis(amostras)
+
+
+def medir_memoria(base, perguntas, motor, faq):
+    """Pico de memória alocada acima do que já existia, durante uma passada das perguntas"""
+    tracemalloc.start()
+    inicial, _ = tracemalloc.get_traced_memory()
+    for item in perguntas:
+        buscar_trechos(item["pergunta"], base, max(KS), motor, faq)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round((pico - inicial) / 1024, 1)
+
+# ═══════════════════════════════════════════════════════
+# EXECUÇÃO
+# ═══════════════════════════════════════════════════════
+
+def executar(caminho_base, perguntas, escalas, motores, repeticoes, config_embeddings):
+    with open(caminho_base, 'r', encoding='utf-8') as f:
+        original = f.read()
+
+    resultados = {}
+    for escala in escalas:
+        base, construcao = montar(gerar_corpus(original, escala), config_embeddings)
+        resultado_escala = {
+            **construcao,
+            "trechos": len(base['registros']),
+            "entradas_faq": len(base.get('faq', [])),
+            "motores": {},
+        }
+        print(f"\n📚 {escala:g}x: {resultado_escala['trechos']} trechos, "
+              f"montagem {construcao['construcao_s']:.2f}s / {construcao['memoria_construcao_mb']:.1f} MB")
+
+        for nome in motores:
+            motor, faq = MOTORES[nome]
+            if nome == "similaridade" and len(base['registros']) > MAX_TRECHOS_SIMILARIDADE:
+                resultado_escala["motores"][nome] = {"pulado": f"mais de {MAX_TRECHOS_SIMILARIDADE} trechos"}
+                print(f"   {nome:13s} pulado")
+                continue
+            medicao = avaliar_qualidade(base, perguntas, motor, faq)
+            medicao["latencia_ms"] = medir_latencia(base, perguntas, motor, faq, repeticoes)
+            medicao["memoria_pico_kb"] = medir_memoria(base, perguntas, motor, faq)
+            resultado_escala["motores"][nome] = medicao
+            print(
+                f"   {nome:13s} R@1 {medicao['recall@1']:.2f}  R@5 {medicao['recall@5']:.2f}  "
+                f"MRR {medicao['mrr']:.3f}  p50 {medicao['latencia_ms']['p50']:8.3f} ms  "
+                f"p99 {medicao['latencia_ms']['p99']:8.3f} ms  mem {medicao['memoria_pico_kb']:8.1f} KB"
+            )
+        resultados[f"{escala:g}x"] = resultado_escala
+        del base
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de recuperação com perguntas rotuladas")
+    parser.add_argument("--base", default="conhecimento/base_conhecimento.txt")
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--motores", nargs="+", choices=list(MOTORES), default=list(MOTORES))
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--dimensao", type=int, default=512, help="dimensão dos vetores (hashing)")
+    parser.add_argument("--saida", default=str(DIRETORIO / "resultados_recuperacao.json"))
+    args = parser.parse_args(argv)
+
+    perguntas = carregar_perguntas(args.perguntas)
+    config_embeddings = {"tipo": "hashing", "dimensao": args.dimensao}
+    relatorio = {
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "perguntas": len(perguntas),
+        "repeticoes": args.repeticoes,
+        "embeddings": config_embeddings,
+        "escalas": executar(args.base, perguntas, args.escalas, args.motores, args.repeticoes, config_embeddings),
+    }
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+    print(f"\n✅ Resultados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
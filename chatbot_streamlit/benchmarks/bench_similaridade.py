@@ -0,0 +1,109 @@
+"""
+Benchmark do motor 'similaridade': varredura completa x poda com top-k
+
+Compara, em cada escala do corpus (corpus_sintetico.py), a varredura
+original (SequenceMatcher.ratio() de todos os trechos, depois heapq.nlargest)
+com ComparadorSimilaridade (heap dos k melhores, poda por
+real_quick_ratio()/quick_ratio() e set_seq2 guardado por trecho).
+
+Antes de medir, confere que o top-k (relevância exata e id de cada trecho,
+na mesma ordem) é idêntico para todas as perguntas rotuladas e para cada k;
+qualquer diferença encerra com código 1.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/bench_similaridade.py [--escalas 1 10 30] [--ks 1 3 10] [--saida similaridade.json]
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import montar_base, buscar_trechos, limiar_por_tipo, preparar_consulta, similaridade_normalizada
+from corpus_sintetico import gerar_corpus
+
+DIRETORIO = Path(__file__).resolve().parent
+
+
+def varredura_completa(pergunta, base, max_resultados):
+    """Implementação anterior: ratio() de todos os trechos e top-k no fim"""
+    consulta = preparar_consulta(pergunta)
+    resultados = []
+    for registro in base['registros']:
+        similaridade = similaridade_normalizada(consulta['normalizado'], registro['normalizado'])
+        if similaridade > limiar_por_tipo(registro['tipo']):
+            resultados.append((similaridade, registro))
+    melhores = heapq.nlargest(max_resultados, resultados, key=lambda x: (x[0], -x[1]['id']))
+    return [(similaridade, registro['id']) for similaridade, registro in melhores]
+
+
+def com_poda(pergunta, base, max_resultados):
+    return [
+        (similaridade, registro['id'])
+        for similaridade, registro in buscar_trechos(pergunta, base, max_resultados, "similaridade", faq=False)
+    ]
+
+
+def medir(funcao, base, perguntas, max_resultados, repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        for pergunta in perguntas:
+            inicio = time.perf_counter()
+            funcao(pergunta, base, max_resultados)
+            amostras.append((time.perf_counter() - inicio) * 1e3)
+    p50, p95 = np.percentile(amostras, [50, 95])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Varredura completa x poda no motor de similaridade")
+    parser.add_argument("--base", default="conhecimento/base_conhecimento.txt")
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 10, 30])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--repeticoes", type=int, default=2)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        original = f.read()
+    with open(args.perguntas, 'r', encoding='utf-8') as f:
+        perguntas = [item["pergunta"] for item in json.load(f)["perguntas"]]
+
+    relatorio = {}
+    divergencias = 0
+    for escala in args.escalas:
+        base = montar_base(gerar_corpus(original, escala))
+        print(f"\n📚 {escala:g}x: {len(base['registros'])} trechos, {len(perguntas)} perguntas")
+        resultado = {"trechos": len(base['registros']), "ks": {}}
+        for k in args.ks:
+            # 1ª passada da poda: compara e já monta os SequenceMatcher de cada trecho
+            diferentes = [p for p in perguntas if com_poda(p, base, k) != varredura_completa(p, base, k)]
+            divergencias += len(diferentes)
+            antes = medir(varredura_completa, base, perguntas, k, args.repeticoes)
+            depois = medir(com_poda, base, perguntas, k, args.repeticoes)
+            resultado["ks"][str(k)] = {
+                "top_k_identico": not diferentes,
+                "completa_ms": antes,
+                "poda_ms": depois,
+                "ganho_p50": round(antes["p50"] / depois["p50"], 2) if depois["p50"] else None,
+            }
+            print(f"   k={k:<3d} completa p50 {antes['p50']:9.3f} ms  poda p50 {depois['p50']:9.3f} ms  "
+                  f"({resultado['ks'][str(k)]['ganho_p50']}x)  top-k "
+                  f"{'idêntico' if not diferentes else f'DIFERENTE em {len(diferentes)} perguntas'}")
+        relatorio[f"{escala:g}x"] = resultado
+        del base
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+    return 1 if divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Versões maiores da base de conhecimento para o benchmark de recuperação
+
+A base original fica intacta no início (as perguntas rotuladas continuam
+apontando para as mesmas entradas) e recebe entradas de FAQ sintéticas,
+numeradas em sequência, até atingir fator x o tamanho original.
+
+As entradas sintéticas sorteiam palavras do próprio vocabulário da base
+(na mesma frequência) e seguem os tamanhos de pergunta/resposta das
+entradas reais; uma fração de palavras inventadas faz o vocabulário crescer
+com o corpus, como numa base real. São distratores plausíveis para o BM25
+e para os vetores, sem repetir nenhuma resposta verdadeira.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/corpus_sintetico.py 100 [saida.txt]
+"""
+import random
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_busca import dividir_faq, extrair_faq
+
+SEMENTE_PADRAO = 42
+FRACAO_PALAVRAS_NOVAS = 0.08
+_SILABAS = ("ba", "ca", "de", "fi", "go", "la", "me", "no", "pa", "qui", "ra", "so", "ta", "ve", "xu", "za")
+_PALAVRAS = re.compile(r"\w+")
+
+
+def _palavra_nova(sorteio):
+    return ''.join(sorteio.choice(_SILABAS) for _ in range(sorteio.randint(2, 4)))
+
+
+def _frase(sorteio, vocabulario, tamanho):
+    palavras = [
+        _palavra_nova(sorteio) if sorteio.random() < FRACAO_PALAVRAS_NOVAS else sorteio.choice(vocabulario)
+        for _ in range(max(1, tamanho))
+    ]
+    return ' '.join(palavras)
+
+
+def entradas_sinteticas(conteudo, semente=SEMENTE_PADRAO):
+    """Gera (sem fim) textos de entradas de FAQ numeradas a partir da última entrada real"""
+    entradas = extrair_faq(dividir_faq(conteudo) or [])
+    if not entradas:
+        raise ValueError("A base não parece um FAQ numerado")
+
+    sorteio = random.Random(semente)
+    vocabulario = _PALAVRAS.findall(conteudo)
+    tamanhos_pergunta = [len(_PALAVRAS.findall(e['pergunta'])) for e in entradas]
+    linhas_resposta = [
+        [len(_PALAVRAS.findall(linha)) for linha in e['resposta'].split('\n') if linha.strip()] or [10]
+        for e in entradas
+    ]
+
+    numero = max(e['id'] for e in entradas)
+    while True:
+        numero += 1
+        pergunta = _frase(sorteio, vocabulario, sorteio.choice(tamanhos_pergunta))
+        linhas = [_frase(sorteio, vocabulario, tamanho) for tamanho in sorteio.choice(linhas_resposta)]
+        yield f"{numero} - {pergunta.capitalize()}?\nResposta: " + '\n'.join(linhas) + "\n"
+
+
+def gerar_corpus(conteudo, fator, semente=SEMENTE_PADRAO):
+    """Base original + entradas sintéticas até ~fator x o tamanho (fator 1 devolve a própria base)"""
+    if fator <= 1:
+        return conteudo
+    partes = [conteudo.rstrip('\n') + '\n']
+    alvo = int(len(conteudo) * fator)
+    tamanho = len(partes[0])
+    for entrada in entradas_sinteticas(conteudo, semente):
+        if tamanho >= alvo:
+            break
+        partes.append(entrada)
+        tamanho += len(entrada) + 1
+    return '\n'.join(partes)
+
+
+def main():
+    fator = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    saida = sys.argv[2] if len(sys.argv) > 2 else f"conhecimento/base_sintetica_{fator:g}x.txt"
+    with open("conhecimento/base_conhecimento.txt", 'r', encoding='utf-8') as f:
+        corpus = gerar_corpus(f.read(), fator)
+    with open(saida, 'w', encoding='utf-8') as f:
+        f.write(corpus)
+    print(f"✅ {saida}: {len(corpus) / 1024:.0f} KB ({fator:g}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Servidor local que imita o endpoint de chat da OpenAI, para testes de carga
+
+Atende POST /v1/chat/completions (com e sem stream=True, em SSE) e
+POST /v1/embeddings, sem gastar cota. O comportamento é configurável:
+    --latencia           segundos até o primeiro token
+    --tokens-por-segundo ritmo de geração da resposta
+    --tokens-resposta    tamanho da resposta
+    --taxa-erro          fração das requisições que falham
+    --status-erro        status dessas falhas (429 manda Retry-After)
+
+Imita também o cache de prompt da OpenAI: um prompt de 1024 tokens ou
+mais cujo prefixo (em blocos de 128 tokens) já foi visto volta com esses
+tokens em usage.prompt_tokens_details.cached_tokens. Serve para conferir
+que as mensagens começam por um prefixo fixo.
+
+GET /estatisticas devolve requisições, erros, conexões, tokens de prompt
+(e quantos em cache), CPU e memória do servidor.
+
+Os bots apontam para ele pelo base_url (config/bot_config.json):
+    "base_url": "http://127.0.0.1:8765/v1"
+ou pela variável de ambiente OPENAI_BASE_URL.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/servidor_openai_falso.py --porta 8765 --latencia 0.3 --tokens-por-segundo 80
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import resource
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PALAVRAS_RESPOSTA = (
+    "Para isso acesse a plataforma com seu login e senha e abra o menu marketing "
+    "no canto esquerdo da tela inicial depois clique em começar e siga os passos indicados"
+).split()
+
+
+class ConfiguracaoFalsa:
+    def __init__(self, latencia=0.2, tokens_por_segundo=50.0, tokens_resposta=60, taxa_erro=0.0,
+                 status_erro=500, semente=None):
+        self.latencia = latencia
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_resposta = tokens_resposta
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.sorteio = random.Random(semente)
+
+
+MINIMO_CACHE_PREFIXO = 1024
+BLOCO_CACHE_PREFIXO = 128
+MAX_PREFIXOS = 50_000
+
+
+class CachePrefixos:
+    """Prefixos de prompt já vistos, como o cache de prompt da OpenAI (LRU)"""
+
+    def __init__(self, capacidade=MAX_PREFIXOS):
+        self.capacidade = capacidade
+        self._vistos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consultar_e_guardar(self, tokens):
+        """Tokens do prompt -> quantos vêm do cache; guarda os prefixos deste prompt"""
+        resumo = hashlib.sha1()
+        prefixos = []
+        for posicao, token in enumerate(tokens, 1):
+            resumo.update(token.encode('utf-8') + b"\0")
+            if posicao >= MINIMO_CACHE_PREFIXO and posicao % BLOCO_CACHE_PREFIXO == 0:
+                prefixos.append((posicao, resumo.digest()))
+        em_cache = 0
+        with self._lock:
+            for posicao, chave in prefixos:
+                if chave in self._vistos:
+                    self._vistos.move_to_end(chave)
+                    em_cache = posicao
+                else:
+                    self._vistos[chave] = True
+            while len(self._vistos) > self.capacidade:
+                self._vistos.popitem(last=False)
+        return em_cache
+
+
+class EstatisticasServidor:
+    def __init__(self):
+        self.inicio = time.time()
+        self.requisicoes = 0
+        self.tokens_prompt = 0
+        self.tokens_em_cache = 0
+        self.erros_injetados = 0
+        self.conexoes = 0
+        self.em_andamento = 0
+        self.pico_em_andamento = 0
+        self._lock = threading.Lock()
+
+    def entrar(self):
+        with self._lock:
+            self.requisicoes += 1
+            self.em_andamento += 1
+            self.pico_em_andamento = max(self.pico_em_andamento, self.em_andamento)
+
+    def sair(self):
+        with self._lock:
+            self.em_andamento -= 1
+
+    def contar_prompt(self, tokens, em_cache):
+        with self._lock:
+            self.tokens_prompt += tokens
+            self.tokens_em_cache += em_cache
+
+    def como_dict(self):
+        uso = resource.getrusage(resource.RUSAGE_SELF)
+        with self._lock:
+            return {
+                "requisicoes": self.requisicoes,
+                "tokens_prompt": self.tokens_prompt,
+                "tokens_em_cache": self.tokens_em_cache,
+                "erros_injetados": self.erros_injetados,
+                "conexoes": self.conexoes,
+                "pico_em_andamento": self.pico_em_andamento,
+                "cpu_s": round(uso.ru_utime + uso.ru_stime, 3),
+                "memoria_max_mb": round(uso.ru_maxrss / 1024, 1),   # ru_maxrss em KB no Linux
+                "uptime_s": round(time.time() - self.inicio, 1),
+            }
+
+
+def _tokens(texto):
+    return re.findall(r"\w+|[^\w\s]", texto)
+
+
+def _contar_tokens(texto):
+    return len(_tokens(texto))
+
+
+def _vetor_falso(texto, dimensao=64):
+    """Embedding determinístico (hash das palavras), só para o formato bater"""
+    vetor = [0.0] * dimensao
+    for palavra in texto.lower().split():
+        vetor[zlib.crc32(palavra.encode('utf-8')) % dimensao] += 1.0
+    norma = sum(v * v for v in vetor) ** 0.5 or 1.0
+    return [v / norma for v in vetor]
+
+# ═══════════════════════════════════════════════════════
+# HANDLER
+# ═══════════════════════════════════════════════════════
+
+class ManipuladorOpenAI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive: o pool do cliente reaproveita conexões
+    configuracao = None
+    estatisticas = None
+    cache_prefixos = None
+
+    def setup(self):
+        super().setup()
+        with self.estatisticas._lock:
+            self.estatisticas.conexoes += 1
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') == "/estatisticas":
+            self._json(200, self.estatisticas.como_dict())
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+        self.estatisticas.entrar()
+        try:
+            if self._injetar_erro():
+                return
+            if self.path.endswith("/chat/completions"):
+                self._chat(corpo)
+            elif self.path.endswith("/embeddings"):
+                self._embeddings(corpo)
+            else:
+                self._json(404, {"error": {"message": f"rota desconhecida: {self.path}"}})
+        finally:
+            self.estatisticas.sair()
+
+    # ───────────────────────────────────────────────────
+    # Respostas
+    # ───────────────────────────────────────────────────
+
+    def _injetar_erro(self):
+        configuracao = self.configuracao
+        if configuracao.taxa_erro <= 0 or configuracao.sorteio.random() >= configuracao.taxa_erro:
+            return False
+        with self.estatisticas._lock:
+            self.estatisticas.erros_injetados += 1
+        cabecalhos = {"Retry-After": "1"} if configuracao.status_erro == 429 else {}
+        self._json(configuracao.status_erro, {
+            "error": {"message": "erro injetado pelo servidor falso", "type": "server_error"}
+        }, cabecalhos)
+        return True
+
+    def _chat(self, corpo):
+        configuracao = self.configuracao
+        modelo = corpo.get("model", "gpt-4o")
+        # O papel entra no prefixo: mesma fala com outro role não aproveita o cache
+        tokens_prompt = [
+            token for m in corpo.get("messages", [])
+            for token in [str(m.get("role", ""))] + _tokens(str(m.get("content", "")))
+        ]
+        em_cache = self.cache_prefixos.consultar_e_guardar(tokens_prompt)
+        self.estatisticas.contar_prompt(len(tokens_prompt), em_cache)
+        limite = min(configuracao.tokens_resposta, corpo.get("max_tokens") or configuracao.tokens_resposta)
+        tokens = [PALAVRAS_RESPOSTA[i % len(PALAVRAS_RESPOSTA)] for i in range(limite)]
+        uso = {
+            "prompt_tokens": len(tokens_prompt),
+            "completion_tokens": len(tokens),
+            "total_tokens": len(tokens_prompt) + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": em_cache},
+        }
+        identificador = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        criado = int(time.time())
+        intervalo = 1.0 / configuracao.tokens_por_segundo if configuracao.tokens_por_segundo > 0 else 0.0
+
+        time.sleep(configuracao.latencia)
+        if not corpo.get("stream"):
+            time.sleep(intervalo * len(tokens))
+            self._json(200, {
+                "id": identificador, "object": "chat.completion", "created": criado, "model": modelo,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(tokens)}}],
+                "usage": uso,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def pedaco(delta, finish_reason=None, usage=None):
+            evento = {"id": identificador, "object": "chat.completion.chunk", "created": criado, "model": modelo,
+                      "choices": [] if delta is None else
+                      [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage is not None:
+                evento["usage"] = usage
+            self._enviar_pedaco(f"data: {json.dumps(evento, ensure_ascii=False)}\n\n")
+
+        pedaco({"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            pedaco({"content": token if i == 0 else " " + token})
+            time.sleep(intervalo)
+        pedaco({}, finish_reason="stop")
+        if (corpo.get("stream_options") or {}).get("include_usage"):
+            pedaco(None, usage=uso)
+        self._enviar_pedaco("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _embeddings(self, corpo):
+        entradas = corpo.get("input", [])
+        if isinstance(entradas, str):
+            entradas = [entradas]
+        time.sleep(self.configuracao.latencia)
+        self._json(200, {
+            "object": "list", "model": corpo.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": _vetor_falso(texto)}
+                     for i, texto in enumerate(entradas)],
+            "usage": {"prompt_tokens": sum(_contar_tokens(t) for t in entradas), "total_tokens": 0},
+        })
+
+    def _enviar_pedaco(self, texto):
+        dados = texto.encode('utf-8')
+        self.wfile.write(f"{len(dados):X}\r\n".encode('ascii') + dados + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+# ═══════════════════════════════════════════════════════
+# SERVIDOR
+# ═══════════════════════════════════════════════════════
+
+def criar_servidor(host="127.0.0.1", porta=8765, configuracao=None):
+    """Servidor pronto para serve_forever(); porta 0 escolhe uma livre (servidor.server_port)"""
+    manipulador = type("Manipulador", (ManipuladorOpenAI,), {
+        "configuracao": configuracao or ConfiguracaoFalsa(),
+        "estatisticas": EstatisticasServidor(),
+        "cache_prefixos": CachePrefixos(),
+    })
+    servidor = ThreadingHTTPServer((host, porta), manipulador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor falso compatível com a API de chat da OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--tokens-resposta", type=int, default=60)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de requisições com erro (0 a 1)")
+    parser.add_argument("--status-erro", type=int, default=500)
+    parser.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    configuracao = ConfiguracaoFalsa(
+        args.latencia, args.tokens_por_segundo, args.tokens_resposta, args.taxa_erro, args.status_erro, args.semente
+    )
+    servidor = criar_servidor(args.host, args.porta, configuracao)
+    print(f"🧪 Servidor falso em http://{args.host}:{servidor.server_port}/v1", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
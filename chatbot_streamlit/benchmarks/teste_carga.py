@@ -0,0 +1,194 @@
+"""
+Teste de carga ponta a ponta dos bots Streamlit contra o servidor falso da OpenAI
+
+Sobe servidor_openai_falso.py num subprocesso (ou usa --base-url de um já
+rodando) e simula N sessões de chat simultâneas com o AppTest do Streamlit:
+cada sessão é um AppTest próprio (session_state próprio) e os recursos
+@st.cache_resource (cliente, índices, caches) são compartilhados, como
+num servidor real. Cada turno é medido do envio da pergunta até o fim do
+rerun (busca + streaming da resposta + renderização).
+
+Relatório: turnos/s, latência p50/p95/p99 por turno, erros, e CPU/memória
+do processo dos bots (este) e do servidor falso.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/teste_carga.py --script bot5_rag.py --sessoes 8 --turnos 5 \
+        --latencia 0.3 --tokens-por-segundo 80 [--taxa-erro 0.05] [--saida carga.json]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+DIRETORIO = Path(__file__).resolve().parent
+
+
+def carregar_perguntas(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return [item["pergunta"] for item in json.load(f)["perguntas"]]
+
+
+def iniciar_servidor(args):
+    """Sobe o servidor falso numa porta livre; devolve (processo, base_url)"""
+    comando = [
+        sys.executable, str(DIRETORIO / "servidor_openai_falso.py"), "--porta", "0",
+        "--latencia", str(args.latencia), "--tokens-por-segundo", str(args.tokens_por_segundo),
+        "--tokens-resposta", str(args.tokens_resposta), "--taxa-erro", str(args.taxa_erro),
+        "--status-erro", str(args.status_erro),
+    ]
+    processo = subprocess.Popen(comando, stdout=subprocess.PIPE, text=True)
+    linha = processo.stdout.readline()
+    if "http://" not in linha:
+        processo.kill()
+        raise RuntimeError(f"Servidor falso não subiu: {linha!r}")
+    return processo, linha[linha.index("http://"):].strip()
+
+
+def estatisticas_servidor(base_url):
+    raiz = base_url.rsplit("/v1", 1)[0]
+    try:
+        with urllib.request.urlopen(f"{raiz}/estatisticas", timeout=5) as resposta:
+            return json.load(resposta)
+    except OSError:
+        return None
+
+
+def _percentis(amostras):
+    if not amostras:
+        return None
+    p50, p95, p99 = np.percentile(amostras, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+# ═══════════════════════════════════════════════════════
+# SESSÕES
+# ═══════════════════════════════════════════════════════
+
+def simular_sessao(indice, script, perguntas, turnos, unicas, timeout):
+    """Uma sessão de chat: abre o app e faz `turnos` perguntas; devolve [(segundos, erro)]"""
+    from streamlit.testing.v1 import AppTest
+
+    sorteio = random.Random(indice)
+    medicoes = []
+    app = AppTest.from_file(script, default_timeout=timeout).run()
+    for turno in range(turnos):
+        pergunta = sorteio.choice(perguntas)
+        if unicas:
+            # Pergunta inédita: não cai no cache de buscas nem no de respostas
+            pergunta = f"{pergunta} (sessão {indice}, turno {turno})"
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            app.chat_input[0].set_value(pergunta).run()
+            falhas = [str(e.value) for e in app.exception] + [str(e.value) for e in app.error]
+            if falhas:
+                erro = falhas[0][:200]
+        except Exception as e:     # timeout do AppTest, script quebrado...
+            erro = f"{type(e).__name__}: {e}"[:200]
+        medicoes.append((time.perf_counter() - inicio, erro))
+    return medicoes
+
+
+def executar(args, base_url):
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-teste-carga")
+    perguntas = carregar_perguntas(args.perguntas)
+    script = str(Path(args.script).resolve())
+
+    # Primeira sessão sozinha: monta índices e clientes (@st.cache_resource) fora da medição
+    simular_sessao(-1, script, perguntas, 0, args.unicas, args.timeout)
+
+    uso_antes = resource.getrusage(resource.RUSAGE_SELF)
+    servidor_antes = estatisticas_servidor(base_url) or {}
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessoes, thread_name_prefix="sessao") as executor:
+        futuros = [
+            executor.submit(simular_sessao, i, script, perguntas, args.turnos, args.unicas, args.timeout)
+            for i in range(args.sessoes)
+        ]
+        medicoes = [m for futuro in futuros for m in futuro.result()]
+    duracao = time.perf_counter() - inicio
+    uso_depois = resource.getrusage(resource.RUSAGE_SELF)
+    servidor_depois = estatisticas_servidor(base_url) or {}
+
+    latencias = [segundos for segundos, erro in medicoes if erro is None]
+    erros = [erro for _, erro in medicoes if erro is not None]
+    cpu_bots = (uso_depois.ru_utime + uso_depois.ru_stime) - (uso_antes.ru_utime + uso_antes.ru_stime)
+    return {
+        "script": args.script,
+        "sessoes": args.sessoes,
+        "turnos_por_sessao": args.turnos,
+        "duracao_s": round(duracao, 3),
+        "turnos": len(medicoes),
+        "turnos_por_segundo": round(len(medicoes) / duracao, 3) if duracao else None,
+        "latencia_turno_s": _percentis(latencias),
+        "erros": len(erros),
+        "exemplos_erros": sorted(set(erros))[:5],
+        "bots": {
+            "cpu_s": round(cpu_bots, 3),
+            "cpu_percentual": round(100 * cpu_bots / duracao, 1) if duracao else None,
+            "memoria_max_mb": round(uso_depois.ru_maxrss / 1024, 1),
+        },
+        "servidor": {
+            "requisicoes": servidor_depois.get("requisicoes", 0) - servidor_antes.get("requisicoes", 0),
+            "erros_injetados": servidor_depois.get("erros_injetados", 0) - servidor_antes.get("erros_injetados", 0),
+            "conexoes": servidor_depois.get("conexoes", 0) - servidor_antes.get("conexoes", 0),
+            "pico_em_andamento": servidor_depois.get("pico_em_andamento"),
+            "cpu_s": round(servidor_depois.get("cpu_s", 0) - servidor_antes.get("cpu_s", 0), 3),
+            "memoria_max_mb": servidor_depois.get("memoria_max_mb"),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga dos bots com o servidor falso da OpenAI")
+    parser.add_argument("--script", default="bot5_rag.py")
+    parser.add_argument("--sessoes", type=int, default=8)
+    parser.add_argument("--turnos", type=int, default=5)
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--unicas", action="store_true", help="torna cada pergunta única (sem acertos de cache)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="segundos por rerun do AppTest")
+    parser.add_argument("--base-url", help="usa um servidor já rodando em vez de subir o falso")
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--tokens-resposta", type=int, default=60)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--status-erro", type=int, default=500)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    processo = None
+    base_url = args.base_url
+    if base_url is None:
+        processo, base_url = iniciar_servidor(args)
+    try:
+        relatorio = executar(args, base_url)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait(timeout=10)
+
+    latencia = relatorio["latencia_turno_s"] or {}
+    print(f"🧪 {relatorio['sessoes']} sessões x {relatorio['turnos_por_sessao']} turnos em {relatorio['duracao_s']:.1f}s")
+    print(f"   vazão: {relatorio['turnos_por_segundo']} turnos/s  erros: {relatorio['erros']}")
+    print(f"   latência por turno: p50 {latencia.get('p50')}s  p95 {latencia.get('p95')}s  p99 {latencia.get('p99')}s")
+    print(f"   bots: CPU {relatorio['bots']['cpu_percentual']}%  memória máx {relatorio['bots']['memoria_max_mb']} MB")
+    print(f"   servidor: {relatorio['servidor']['requisicoes']} requisições em {relatorio['servidor']['conexoes']} conexões, "
+          f"CPU {relatorio['servidor']['cpu_s']}s, memória máx {relatorio['servidor']['memoria_max_mb']} MB")
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Teste de carga da API do RAG (api_rag.py) contra o servidor falso da OpenAI
+
+Sobe o servidor falso e a API em subprocessos (ou usa --url-api de uma API
+já rodando) e dispara N requisições simultâneas, em rajadas, com perguntas
+rotuladas. Mede vazão, latência p50/p95/p99, tempo até o primeiro token
+(no modo --stream) e erros, e lê de /saude a fila do agendador da API
+(pico de pedidos esperando, espera p50/p95, novas tentativas).
+
+Por padrão a API usa os limites por minuto do config/bot_config.json
+(agendador.limites), então a vazão mostra o tráfego já moldado pelos
+limites; --sem-limites tira os limites para medir só a capacidade da API.
+
+Uso (dentro de chatbot_streamlit/):
+    python benchmarks/teste_carga_api.py --simultaneas 300 --rodadas 3 [--stream] \
+        --latencia 0.5 --tokens-por-segundo 50 [--processos 2] [--sem-limites] [--saida api.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import httpx
+
+from teste_carga import carregar_perguntas, iniciar_servidor, estatisticas_servidor, _percentis
+
+DIRETORIO = Path(__file__).resolve().parent
+RAIZ = DIRETORIO.parent
+
+
+def estatisticas_api(url):
+    try:
+        with urllib.request.urlopen(f"{url}/saude", timeout=5) as resposta:
+            return json.load(resposta)
+    except OSError:
+        return {}
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _config_sem_limites():
+    """Cópia do config do app sem agendador.limites (só a concorrência continua valendo)"""
+    with open(RAIZ / "config" / "bot_config.json", 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config.setdefault("agendador", {})["limites"] = {}
+    arquivo = tempfile.NamedTemporaryFile('w', suffix=".json", delete=False, encoding='utf-8')
+    with arquivo:
+        json.dump(config, arquivo)
+    return arquivo.name
+
+
+def iniciar_api(base_url, processos, caminho_config=None, timeout=60):
+    """Sobe api_rag.py apontando para base_url; devolve (processo, url da API)"""
+    porta = _porta_livre()
+    ambiente = {**os.environ, "OPENAI_BASE_URL": base_url}
+    ambiente.setdefault("OPENAI_API_KEY", "sk-teste-carga")
+    comando = [sys.executable, "api_rag.py", "--porta", str(porta), "--processos", str(processos)]
+    if caminho_config:
+        comando += ["--config", caminho_config]
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=ambiente)
+    url = f"http://127.0.0.1:{porta}"
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(f"{url}/saude", timeout=1):
+                return processo, url
+        except OSError:
+            if processo.poll() is not None:
+                raise RuntimeError("A API terminou durante a subida")
+            time.sleep(0.2)
+    processo.kill()
+    raise RuntimeError("A API não respondeu em /saude")
+
+# ═══════════════════════════════════════════════════════
+# REQUISIÇÕES
+# ═══════════════════════════════════════════════════════
+
+async def _requisitar(cliente, url, pergunta, stream):
+    """Uma requisição; devolve (segundos, segundos até o 1º token, erro)"""
+    inicio = time.perf_counter()
+    try:
+        if not stream:
+            resposta = await cliente.post(f"{url}/v1/respostas", json={"pergunta": pergunta})
+            erro = None if resposta.status_code == 200 else f"HTTP {resposta.status_code}"
+            return time.perf_counter() - inicio, None, erro
+
+        primeiro = None
+        erro = None
+        evento = None
+        async with cliente.stream("POST", f"{url}/v1/respostas/stream", json={"pergunta": pergunta}) as resposta:
+            if resposta.status_code != 200:
+                return time.perf_counter() - inicio, None, f"HTTP {resposta.status_code}"
+            async for linha in resposta.aiter_lines():
+                if linha.startswith("event: "):
+                    evento = linha[7:]
+                    if evento == "token" and primeiro is None:
+                        primeiro = time.perf_counter() - inicio
+                elif linha.startswith("data: ") and evento == "erro":
+                    erro = json.loads(linha[6:])["mensagem"][:200]
+        return time.perf_counter() - inicio, primeiro, erro
+    except httpx.HTTPError as e:
+        return time.perf_counter() - inicio, None, f"{type(e).__name__}: {e}"[:200]
+
+
+async def disparar(url, perguntas, simultaneas, rodadas, stream, timeout):
+    sorteio = random.Random(0)
+    limites = httpx.Limits(max_connections=simultaneas, max_keepalive_connections=simultaneas)
+    medicoes = []
+    async with httpx.AsyncClient(limits=limites, timeout=timeout) as cliente:
+        # Aquecimento: caches de busca e conexões fora da medição
+        await _requisitar(cliente, url, perguntas[0], stream)
+        inicio = time.perf_counter()
+        for _ in range(rodadas):
+            tarefas = [
+                _requisitar(cliente, url, sorteio.choice(perguntas), stream) for _ in range(simultaneas)
+            ]
+            medicoes.extend(await asyncio.gather(*tarefas))
+        duracao = time.perf_counter() - inicio
+    return medicoes, duracao
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga da API HTTP do RAG")
+    parser.add_argument("--simultaneas", type=int, default=200)
+    parser.add_argument("--rodadas", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="usa /v1/respostas/stream (SSE)")
+    parser.add_argument("--processos", type=int, default=1, help="processos da API")
+    parser.add_argument("--perguntas", default=str(DIRETORIO / "perguntas_rotuladas.json"))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--url-api", help="usa uma API já rodando (e o servidor que ela já usa)")
+    parser.add_argument("--sem-limites", action="store_true", help="API sem os limites por minuto do agendador")
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--tokens-resposta", type=int, default=60)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--status-erro", type=int, default=500)
+    parser.add_argument("--saida", help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    processos = []
+    base_url = None
+    url = args.url_api
+    caminho_config = _config_sem_limites() if args.sem_limites and url is None else None
+    try:
+        if url is None:
+            servidor, base_url = iniciar_servidor(args)
+            processos.append(servidor)
+            api, url = iniciar_api(base_url, args.processos, caminho_config)
+            processos.append(api)
+        servidor_antes = (estatisticas_servidor(base_url) if base_url else None) or {}
+        medicoes, duracao = asyncio.run(disparar(
+            url, carregar_perguntas(args.perguntas), args.simultaneas, args.rodadas, args.stream, args.timeout
+        ))
+        servidor_depois = (estatisticas_servidor(base_url) if base_url else None) or {}
+        agendador = estatisticas_api(url).get("agendador") or {}
+    finally:
+        for processo in reversed(processos):
+            processo.terminate()
+            processo.wait(timeout=10)
+        if caminho_config:
+            os.unlink(caminho_config)
+
+    latencias = [segundos for segundos, _, erro in medicoes if erro is None]
+    primeiros = [primeiro for _, primeiro, erro in medicoes if erro is None and primeiro is not None]
+    erros = [erro for _, _, erro in medicoes if erro is not None]
+    relatorio = {
+        "modo": "stream" if args.stream else "json",
+        "simultaneas": args.simultaneas,
+        "rodadas": args.rodadas,
+        "processos_api": args.processos,
+        "limites": not args.sem_limites,
+        "requisicoes": len(medicoes),
+        "duracao_s": round(duracao, 3),
+        "requisicoes_por_segundo": round(len(medicoes) / duracao, 2) if duracao else None,
+        "latencia_s": _percentis(latencias),
+        "primeiro_token_s": _percentis(primeiros),
+        "erros": len(erros),
+        "exemplos_erros": sorted(set(erros))[:5],
+        "servidor": {
+            "requisicoes": servidor_depois.get("requisicoes", 0) - servidor_antes.get("requisicoes", 0),
+            "pico_em_andamento": servidor_depois.get("pico_em_andamento"),
+        },
+        "agendador": agendador,
+    }
+
+    latencia = relatorio["latencia_s"] or {}
+    print(f"🧪 {relatorio['requisicoes']} requisições ({args.simultaneas} simultâneas x {args.rodadas}) "
+          f"em {relatorio['duracao_s']:.1f}s: {relatorio['requisicoes_por_segundo']}/s, {relatorio['erros']} erros")
+    print(f"   latência: p50 {latencia.get('p50')}s  p95 {latencia.get('p95')}s  p99 {latencia.get('p99')}s")
+    if relatorio["primeiro_token_s"]:
+        primeiro = relatorio["primeiro_token_s"]
+        print(f"   1º token: p50 {primeiro['p50']}s  p95 {primeiro['p95']}s  p99 {primeiro['p99']}s")
+    print(f"   servidor falso: pico de {relatorio['servidor']['pico_em_andamento']} chamadas simultâneas")
+    if agendador:
+        espera = agendador.get("espera_s") or {}
+        print(f"   agendador: pico de {agendador['pico_fila']} na fila, até {agendador['max_simultaneas']} em andamento, "
+              f"espera p50 {espera.get('p50')}s p95 {espera.get('p95')}s, {agendador['novas_tentativas']} novas tentativas")
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import os
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
+from cliente_openai import criar_cliente
+from agendador_llm import AgendadorLLM
 
 # Carrega variáveis do 
 load_dotenv()
@@ -14,8 +16,20 @@ if not OPENAI_API_KEY:
     st.error("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
     st.stop()
 
-# Instancia o cliente usando a chave do ambiente (sem expor no código)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Cliente compartilhado pelo processo: o pool de conexões sobrevive aos reruns
+@st.cache_resource
+def obter_cliente_openai(api_key):
+    return criar_cliente(api_key)
+
+client, conexoes = obter_cliente_openai(OPENAI_API_KEY)
+
+@st.cache_resource
+def obter_agendador():
+    """Agendador único por processo: limites por modelo, fila justa e novas tentativas"""
+    return AgendadorLLM()
+
+agendador = obter_agendador()
+id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
 
 st.write("## ChatBot com IA - Suporte")
 
@@ -35,14 +49,20 @@ if mensagem_usuario:
     st.session_state["lista_mensagens"].append({"role": "user", "content": mensagem_usuario})
     st.chat_message("user").write(mensagem_usuario)
 
-    # Chamada ao modelo
-    resposta = client.chat.completions.create(
-        model="gpt-4o",
-        messages=st.session_state["lista_mensagens"],
-        #prompt = " Voce é um assitente de suporte de uma empresa de software. Responda de forma clara e objetiva.",
-        #temperature=0.2,
-        #max_tokens=300,
-    )
+    # Chamada ao modelo (pelo agendador: fila justa, limites e novas tentativas)
+    try:
+        resposta = agendador.criar(
+            client,
+            sessao=id_sessao,
+            model="gpt-4o",
+            messages=st.session_state["lista_mensagens"],
+            #prompt = " Voce é um assitente de suporte de uma empresa de software. Responda de forma clara e objetiva.",
+            #temperature=0.2,
+            #max_tokens=300,
+        )
+    except TimeoutError:
+        st.warning("⏳ Muitas perguntas ao mesmo tempo: tente de novo em alguns instantes.")
+        st.stop()
 
     resposta_ia = resposta.choices[0].message.content
 
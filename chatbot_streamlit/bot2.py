@@ -1,7 +1,10 @@
 import os
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
+from cliente_openai import criar_cliente
+from historico_conversa import GerenciadorHistorico, criar_resumidor
+from agendador_llm import AgendadorLLM
 
 # Carrega variáveis do 
 load_dotenv()
@@ -14,8 +17,27 @@ if not OPENAI_API_KEY:
     st.error("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
     st.stop()
 
-# Instancia o cliente usando a chave do ambiente (sem expor no código)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Cliente compartilhado pelo processo: o pool de conexões sobrevive aos reruns
+@st.cache_resource
+def obter_cliente_openai(api_key):
+    return criar_cliente(api_key)
+
+client, conexoes = obter_cliente_openai(OPENAI_API_KEY)
+
+@st.cache_resource
+def obter_agendador():
+    """Agendador único por processo: limites por modelo, fila justa e novas tentativas"""
+    return AgendadorLLM()
+
+agendador = obter_agendador()
+id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
+
+# Janela da conversa: últimos turnos dentro do orçamento + resumo dos antigos
+if "historico" not in st.session_state:
+    st.session_state["historico"] = GerenciadorHistorico(
+        modelo="gpt-4o", resumidor=criar_resumidor(client, "gpt-4o", agendador=agendador, sessao=id_sessao)
+    )
+historico = st.session_state["historico"]
 
 st.write("## ChatBot com IA - Suporte")
 
@@ -23,13 +45,10 @@ st.write("## ChatBot com IA - Suporte")
 if "lista_mensagens" not in st.session_state:
     st.session_state["lista_mensagens"] = []
 
-# Função para incluir system message
+# Função para incluir system message (com a conversa limitada ao orçamento de tokens)
 def obter_mensagens_com_sistema():
-    system_message = {
-        "role": "system", 
-        "content": "Você é um assistente de suporte de uma empresa de software. Responda de forma clara, objetiva e profissional. Seja prestativo e técnico quando necessário."
-    }
-    return [system_message] + st.session_state["lista_mensagens"]
+    system_message = "Você é um assistente de suporte de uma empresa de software. Responda de forma clara, objetiva e profissional. Seja prestativo e técnico quando necessário."
+    return historico.montar_mensagens(st.session_state["lista_mensagens"], system_message)
 
 # Exibe histórico
 for msg in st.session_state["lista_mensagens"]:
@@ -43,16 +62,23 @@ if mensagem_usuario:
     st.session_state["lista_mensagens"].append({"role": "user", "content": mensagem_usuario})
     st.chat_message("user").write(mensagem_usuario)
 
-    # Chamada ao modelo COM system message
-    resposta = client.chat.completions.create(
-        model="gpt-4o",
-        messages=obter_mensagens_com_sistema(),  # ← AQUI USA O SYSTEM MESSAGE
-        temperature=0.2,
-        max_tokens=300,
-    )
+    # Chamada ao modelo COM system message (pelo agendador: fila justa, limites e novas tentativas)
+    try:
+        resposta = agendador.criar(
+            client,
+            sessao=id_sessao,
+            model="gpt-4o",
+            messages=obter_mensagens_com_sistema(),  # ← AQUI USA O SYSTEM MESSAGE
+            temperature=0.2,
+            max_tokens=300,
+        )
+    except TimeoutError:
+        st.warning("⏳ Muitas perguntas ao mesmo tempo: tente de novo em alguns instantes.")
+        st.stop()
 
     resposta_ia = resposta.choices[0].message.content
 
     # Guarda e mostra a resposta da IA
     st.chat_message("assistant").write(resposta_ia)
+    st.caption(f"🧮 prompt: {historico.tokens_ultimo_turno} tokens")
     st.session_state["lista_mensagens"].append({"role": "assistant", "content": resposta_ia})
\ No newline at end of file
@@ -1,9 +1,14 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
 import json
+import uuid
 from pathlib import Path
+from streaming_llm import MedicaoTurno, registrar_latencia
+from cliente_openai import criar_cliente
+from observador_arquivos import ObservadorArquivos, ler_texto, ler_json, gravar_atomico
+from historico_conversa import GerenciadorHistorico, criar_resumidor
+from agendador_llm import AgendadorLLM
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -14,7 +19,6 @@ load_dotenv()
 # FUNÇÃO PARA CARREGAR PROMPTS DE ARQUIVOS EXTERNOS
 # ═══════════════════════════════════════════════════════
 
-@st.cache_data
 def carregar_prompt_do_arquivo(caminho_arquivo="prompt.txt"):
     """
     Carrega o prompt do sistema de um arquivo externo
@@ -45,18 +49,14 @@ Instruções específicas:
                 f.write(prompt_padrao)
             st.info(f"📄 Arquivo de prompt criado em: {caminho_arquivo}")
         
-        # Lê o conteúdo do arquivo
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            prompt = f.read().strip()
-            
-        return prompt
+        # Versão atual do arquivo (o observador recarrega quando ele muda)
+        return observador.obter(caminho_arquivo, ler_texto)
         
     except Exception as e:
         st.error(f"❌ Erro ao carregar prompt: {str(e)}")
         # Retorna prompt básico como fallback
         return "Você é um assistente de suporte técnico. Responda de forma clara e objetiva."
 
-@st.cache_data
 def carregar_configuracao_json(caminho_arquivo="config/bot_config.json"):
     """
     Carrega configurações do bot de um arquivo JSON
@@ -73,22 +73,55 @@ def carregar_configuracao_json(caminho_arquivo="config/bot_config.json"):
                     "suporte_tecnico": "prompts/prompt_suporte.txt",
                     "assistente_comercial": "prompts/prompt_comercial.txt",
                     "mentor_codigo": "prompts/prompt_mentor.txt"
-                }
+                },
+                "base_url": None,  # ex.: servidor falso local (benchmarks/servidor_openai_falso.py)
+                "cliente_http": {
+                    "max_conexoes": 20,
+                    "max_keepalive": 10,
+                    "keepalive_segundos": 60,
+                    "timeout_segundos": 60,
+                    "timeout_conexao_segundos": 5,
+                    "http2": True
+                },
+                "historico": {
+                    "orcamento_tokens": 2000,
+                    "turnos_recentes": 6,
+                    "resumo_max_tokens": 300
+                },
+                "agendador": {"max_simultaneas": 16, "tentativas": 3, "limites": {}}  # limites por modelo (RPM/TPM)
             }
             
             with open(caminho_arquivo, 'w', encoding='utf-8') as f:
                 json.dump(config_padrao, f, indent=2, ensure_ascii=False)
             st.info(f"⚙️ Arquivo de configuração criado em: {caminho_arquivo}")
         
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            
-        return config
+        return observador.obter(caminho_arquivo, ler_json)
         
     except Exception as e:
         st.error(f"❌ Erro ao carregar configuração: {str(e)}")
         return {"temperatura_padrao": 0.2, "max_tokens_padrao": 400, "modelo_padrao": "gpt-4o"}
 
+@st.cache_resource
+def obter_observador():
+    """Observador de prompts/ e config/ (uma thread por processo)"""
+    return ObservadorArquivos()
+
+@st.cache_resource
+def obter_cliente_openai(api_key, config_http=None, base_url=None):
+    """
+    Cliente OpenAI único por processo: o pool HTTP (keep-alive, TLS)
+    sobrevive aos reruns e é compartilhado entre sessões
+    """
+    return criar_cliente(api_key, base_url=base_url, config_http=config_http)
+
+@st.cache_resource
+def obter_agendador(config_agendador=None):
+    """
+    Agendador único por processo: limites por modelo, fila justa entre
+    sessões e novas tentativas para 429/5xx/timeout
+    """
+    return AgendadorLLM.de_config(config_agendador)
+
 # ═══════════════════════════════════════════════════════
 # VALIDAÇÃO E CONFIGURAÇÃO INICIAL
 # ═══════════════════════════════════════════════════════
@@ -99,9 +132,6 @@ if not OPENAI_API_KEY:
     st.error("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
     st.stop()
 
-# Instancia o cliente
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 # Configuração da página
 st.set_page_config(
     page_title="ChatBot IA - Suporte",
@@ -110,9 +140,15 @@ st.set_page_config(
 )
 
 # Carrega configurações e prompts
+observador = obter_observador()
 config = carregar_configuracao_json()
 prompt_sistema_arquivo = carregar_prompt_do_arquivo()
 
+# Cliente compartilhado (pool de conexões reaproveitado entre reruns)
+client, conexoes = obter_cliente_openai(OPENAI_API_KEY, config.get("cliente_http"), config.get("base_url"))
+agendador = obter_agendador(config.get("agendador"))
+id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
+
 # Título principal
 st.write("## 🤖 ChatBot com IA - Suporte Técnico")
 
@@ -161,12 +197,11 @@ if editar_prompt:
             elif tipo_prompt == "Mentor de Código":
                 arquivo_atual = "prompts/prompt_mentor.txt"
                 
-            with open(arquivo_atual, 'w', encoding='utf-8') as f:
-                f.write(prompt_editado)
+            gravar_atomico(arquivo_atual, prompt_editado)
             
             st.sidebar.success("✅ Prompt salvo no arquivo!")
-            # Limpa cache para recarregar
-            st.cache_data.clear()
+            # Recarrega só este arquivo (os demais caches continuam valendo)
+            observador.verificar(arquivo_atual)
             st.rerun()
             
         except Exception as e:
@@ -207,11 +242,12 @@ col1, col2 = st.sidebar.columns(2)
 with col1:
     if st.button("🗑️ Limpar", use_container_width=True):
         st.session_state["lista_mensagens"] = []
+        st.session_state.pop("historico", None)
         st.rerun()
 
 with col2:
     if st.button("🔄 Recarregar", use_container_width=True):
-        st.cache_data.clear()  # Limpa cache dos arquivos
+        observador.verificar(forcar=True)  # Recarrega só os arquivos que mudaram
         st.rerun()
 
 # ═══════════════════════════════════════════════════════
@@ -225,8 +261,39 @@ st.sidebar.write("### 📊 Status")
 if "lista_mensagens" not in st.session_state:
     st.session_state["lista_mensagens"] = []
 
+# Janela da conversa: últimos turnos dentro do orçamento + resumo dos antigos
+config_historico = config.get("historico", {})
+if "historico" not in st.session_state:
+    st.session_state["historico"] = GerenciadorHistorico(
+        config_historico.get("orcamento_tokens", 2000),
+        config_historico.get("turnos_recentes", 6)
+    )
+historico = st.session_state["historico"]
+historico.modelo = modelo
+historico.resumidor = criar_resumidor(
+    client, modelo, config_historico.get("resumo_max_tokens", 300), agendador, id_sessao
+)
+
 total_mensagens = len(st.session_state["lista_mensagens"])
 st.sidebar.metric("💬 Mensagens", total_mensagens)
+estatisticas_conexoes = conexoes.como_dict()
+st.sidebar.metric(
+    "🔌 Conexões reutilizadas",
+    f"{estatisticas_conexoes['reutilizadas']}/{estatisticas_conexoes['requisicoes']}",
+    help=f"{estatisticas_conexoes['conexoes_novas']} conexões abertas com a API (todas as sessões)"
+)
+estatisticas_agendador = agendador.estatisticas()
+espera_fila = estatisticas_agendador['espera_s'] or {}
+st.sidebar.metric(
+    "🚦 Fila do modelo",
+    f"{estatisticas_agendador['na_fila']} na fila • {estatisticas_agendador['em_andamento']}/{estatisticas_agendador['max_simultaneas']}",
+    help=f"Espera p95: {espera_fila.get('p95', 0)}s • {estatisticas_agendador['novas_tentativas']} novas tentativas (todas as sessões)"
+)
+st.sidebar.metric(
+    "🧮 Tokens do prompt",
+    historico.tokens_ultimo_turno,
+    help=f"Orçamento: {historico.orcamento_tokens} • {historico.resumidos_ate} mensagens resumidas"
+)
 
 # Mostra arquivo sendo usado
 st.sidebar.write("### 📁 Arquivos")
@@ -238,9 +305,8 @@ st.sidebar.caption("⚙️ Config: config/bot_config.json")
 # ═══════════════════════════════════════════════════════
 
 def obter_mensagens_completas():
-    """Inclui o system message no início da lista de mensagens"""
-    system_msg = {"role": "system", "content": prompt_sistema.strip()}
-    return [system_msg] + st.session_state["lista_mensagens"]
+    """System message + resumo dos turnos antigos + turnos recentes dentro do orçamento de tokens"""
+    return historico.montar_mensagens(st.session_state["lista_mensagens"], prompt_sistema.strip())
 
 # ═══════════════════════════════════════════════════════
 # INTERFACE PRINCIPAL DO CHAT
@@ -272,28 +338,41 @@ if mensagem_usuario:
     
     # Processa resposta da IA
     with st.chat_message("assistant"): #, avatar="🤖"):
-        with st.spinner("🤔 Pensando..."):
-            try:
-                resposta = client.chat.completions.create(
+        stream = None
+        try:
+            medicao = MedicaoTurno()
+            with st.spinner("🤔 Pensando..."):
+                stream = agendador.criar(
+                    client,
+                    sessao=id_sessao,
                     model=modelo,
                     messages=obter_mensagens_completas(),
                     temperature=temperatura,
                     max_tokens=max_tokens,
                     top_p=0.9,
-                    frequency_penalty=0.1
+                    frequency_penalty=0.1,
+                    stream=True
                 )
-                
-                resposta_ia = resposta.choices[0].message.content
-                st.write(resposta_ia)
-                
-                # Adiciona ao histórico
-                st.session_state["lista_mensagens"].append({
-                    "role": "assistant", 
-                    "content": resposta_ia
-                })
-                
-            except Exception as e:
-                st.error(f"❌ Erro na API: {str(e)}")
+            
+            # Exibe a resposta conforme os tokens chegam
+            resposta_ia = st.write_stream(medicao.transmitir(stream))
+            registrar_latencia(st.session_state, medicao)
+            st.caption(f"{medicao.resumo()} • 🧮 prompt: {historico.tokens_ultimo_turno} tokens")
+            
+            # Adiciona ao histórico
+            st.session_state["lista_mensagens"].append({
+                "role": "assistant", 
+                "content": resposta_ia
+            })
+            
+        except TimeoutError:
+            st.warning("⏳ Muitas perguntas ao mesmo tempo: tente de novo em alguns instantes.")
+        except Exception as e:
+            st.error(f"❌ Erro na API: {str(e)}")
+        finally:
+            # Rerun/stop entre o create() e o fim do write_stream: devolve a vaga do agendador já
+            if stream is not None:
+                stream.close()
 
 # ═══════════════════════════════════════════════════════
 # RODAPÉ
@@ -1,11 +1,23 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-from openai import OpenAI
 import json
+import time
+import uuid
 from pathlib import Path
-import re
-from difflib import SequenceMatcher
+from rag_busca import (
+    montar_base, cache_busca, formatar_contexto, normalizar_pergunta, MOTORES_BUSCA,
+)
+from streaming_llm import MedicaoTurno, registrar_latencia
+from cache_respostas import CacheRespostas, versao_prompt
+from cliente_openai import criar_cliente
+from observador_arquivos import ObservadorArquivos, ler_texto, ler_json
+from motor_rag import construir_base, montar_mensagens, mensagem_sistema
+from contexto_rag import empacotar_contexto, hashes_trechos, ORCAMENTO_CONTEXTO_PADRAO, MAX_CANDIDATOS_PADRAO, QUEDA_RELEVANCIA_PADRAO, MAX_RESULTADOS_REFERENCIA
+from metricas import Metricas, PORTA_PADRAO
+from agendador_llm import AgendadorLLM
+from cascata_modelos import escolher_modelo, resumo_decisao, MODELO_AUTOMATICO
+from armazem_conversas import ArmazemConversas, nova_conversa, MENSAGENS_VISIVEIS_PADRAO
 
 # Carrega variáveis do .env
 load_dotenv()
@@ -16,10 +28,11 @@ load_dotenv()
 # FUNÇÕES RAG - RETRIEVAL AUGMENTED GENERATION
 # ═══════════════════════════════════════════════════════
 
-@st.cache_data
-def carregar_base_conhecimento(caminho_arquivo="conhecimento/base_conhecimento.txt"):
+def carregar_base_conhecimento(caminho_arquivo="conhecimento/base_conhecimento.txt", config_embeddings=None, caminho_indice=None, config_ingestao=None, config_faq=None, config_paralelo=None, cliente=None):
     """
-    Carrega e processa a base de conhecimento de um arquivo .txt
+    Carrega e processa a base de conhecimento (arquivo .txt ou diretório de documentos)
+    O índice fica compartilhado entre sessões e é refeito pelo observador
+    apenas quando o arquivo muda
     """
     try:
         Path(caminho_arquivo).parent.mkdir(parents=True, exist_ok=True)
@@ -96,81 +109,60 @@ AWS/GCP - para produção escalável
                 f.write(conteudo_exemplo)
             st.info(f"📚 Base de conhecimento criada em: {caminho_arquivo}")
         
-        # Lê e processa o conteúdo
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            conteudo = f.read()
-        
-        # Divide em blocos (parágrafos)
-        blocos = [bloco.strip() for bloco in conteudo.split('\n\n') if bloco.strip()]
-        
-        # Divide em sentenças também
-        sentencas = []
-        for bloco in blocos:
-            # Remove numeração e formatação
-            bloco_limpo = re.sub(r'^\d+\.\s*', '', bloco)
-            # Divide em sentenças
-            sents = [s.strip() for s in bloco_limpo.split('\n') if s.strip()]
-            sentencas.extend(sents)
-        
-        return {
-            'blocos': blocos,
-            'sentencas': sentencas,
-            'texto_completo': conteudo
-        }
+        return observador.obter(caminho_arquivo, construir_base_medida, config_embeddings, caminho_indice, config_ingestao, config_faq, config_paralelo, cliente)
         
     except Exception as e:
         st.error(f"❌ Erro ao carregar base de conhecimento: {str(e)}")
-        return {'blocos': [], 'sentencas': [], 'texto_completo': ''}
+        return montar_base('')
 
-def calcular_similaridade(texto1, texto2):
-    """Calcula similaridade entre dois textos usando SequenceMatcher"""
-    # Converte para minúsculas e remove caracteres especiais
-    t1 = re.sub(r'[^\w\s]', '', texto1.lower())
-    t2 = re.sub(r'[^\w\s]', '', texto2.lower())
-    
-    return SequenceMatcher(None, t1, t2).ratio()
-
-def buscar_contexto_relevante(pergunta, base_conhecimento, max_resultados=3):
+def construir_base_medida(*argumentos, **extras):
     """
-    Busca os trechos mais relevantes na base de conhecimento
-    usando similaridade de texto simples
+    construir_base dentro da etapa carregar_base_conhecimento: mede cada
+    carga real, inclusive as recargas na thread do observador (não o acerto)
     """
-    if not base_conhecimento['blocos']:
-        return "Nenhuma informação disponível na base de conhecimento."
-    
-    resultados = []
-    
-    # Busca em blocos (parágrafos)
-    for bloco in base_conhecimento['blocos']:
-        similaridade = calcular_similaridade(pergunta, bloco)
-        if similaridade > 0.1:  # Threshold mínimo
-            resultados.append((similaridade, bloco, 'bloco'))
-    
-    # Busca em sentenças individuais
-    for sentenca in base_conhecimento['sentencas']:
-        if len(sentenca) > 20:  # Ignora sentenças muito curtas
-            similaridade = calcular_similaridade(pergunta, sentenca)
-            if similaridade > 0.15:  # Threshold um pouco maior para sentenças
-                resultados.append((similaridade, sentenca, 'sentenca'))
-    
-    # Ordena por similaridade (maior primeiro)
-    resultados.sort(key=lambda x: x[0], reverse=True)
-    
-    # Pega os melhores resultados
-    contexto_relevante = []
-    for i, (sim, texto, tipo) in enumerate(resultados[:max_resultados]):
-        contexto_relevante.append(f"[Relevância: {sim:.2f}] {texto}")
-    
-    if contexto_relevante:
-        return "\n\n".join(contexto_relevante)
-    else:
-        return "Não foi encontrada informação relevante na base de conhecimento para esta pergunta."
+    with metricas.etapa("carregar_base_conhecimento"):
+        return construir_base(*argumentos, **extras)
+
+@st.cache_resource
+def obter_cache_respostas(capacidade=512, ttl_segundos=86400, caminho_sqlite=None):
+    """Cache de respostas compartilhado por todas as sessões do servidor"""
+    return CacheRespostas(capacidade, ttl_segundos, caminho_sqlite)
+
+@st.cache_resource
+def obter_armazem_conversas(caminho_sqlite=None):
+    """Histórico das conversas (SQLite só com acréscimos), compartilhado por todas as sessões"""
+    return ArmazemConversas(caminho_sqlite)
+
+@st.cache_resource
+def obter_observador():
+    """Observador de conhecimento/, prompts/ e config/ (uma thread por processo)"""
+    return ObservadorArquivos()
+
+@st.cache_resource
+def obter_cliente_openai(api_key, config_http=None, base_url=None):
+    """
+    Cliente OpenAI único por processo: o pool HTTP (keep-alive, TLS)
+    sobrevive aos reruns e é compartilhado entre sessões
+    """
+    return criar_cliente(api_key, base_url=base_url, config_http=config_http)
+
+@st.cache_resource
+def obter_metricas(ativo=False, porta=PORTA_PADRAO, arquivo_jsonl=None):
+    """Métricas do processo; ligadas, servem /metrics numa porta local"""
+    metricas = Metricas(ativo, arquivo_jsonl)
+    if ativo and porta:
+        metricas.iniciar_servidor(porta=porta)
+    return metricas
+
+@st.cache_resource
+def obter_agendador(config_agendador=None, _metricas=None):
+    """Agendador das chamadas ao modelo, um por processo: a fila e os limites valem para todas as sessões"""
+    return AgendadorLLM.de_config(config_agendador, _metricas)
 
 # ═══════════════════════════════════════════════════════
 # FUNÇÕES DE CONFIGURAÇÃO (mantidas do código anterior)
 # ═══════════════════════════════════════════════════════
 
-@st.cache_data
 def carregar_prompt_do_arquivo(caminho_arquivo="prompts/prompt_sistema.txt"):
     """Carrega o prompt do sistema de um arquivo externo"""
     try:
@@ -194,16 +186,12 @@ Formato de resposta:
             with open(caminho_arquivo, 'w', encoding='utf-8') as f:
                 f.write(prompt_padrao)
         
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            prompt = f.read().strip()
-            
-        return prompt
+        return observador.obter(caminho_arquivo, ler_texto)
         
     except Exception as e:
         st.error(f"❌ Erro ao carregar prompt: {str(e)}")
         return "Você é um assistente técnico. Use sempre o contexto fornecido para responder."
 
-@st.cache_data
 def carregar_configuracao_json(caminho_arquivo="config/bot_config.json"):
     """Carrega configurações do bot de um arquivo JSON"""
     try:
@@ -214,17 +202,56 @@ def carregar_configuracao_json(caminho_arquivo="config/bot_config.json"):
                 "temperatura_padrao": 0.1,  # Mais baixa para RAG
                 "max_tokens_padrao": 500,   # Maior para respostas com contexto
                 "modelo_padrao": "gpt-4o",
-                "max_contexto_rag": 3,
-                "threshold_similaridade": 0.15
+                "contexto_rag": {"orcamento_tokens": 800, "max_candidatos": 10, "queda_relevancia": 0.5},
+                "threshold_similaridade": 0.15,
+                "motor_busca": "bm25",
+                "embeddings": {"tipo": "hashing", "dimensao": 512},  # hashing | tfidf | openai
+                "base_conhecimento": "conhecimento/base_conhecimento.txt",  # arquivo .txt ou diretório
+                "ingestao": {"processos": None, "tamanho_maximo_trecho": 2000},
+                "busca_paralela": {"ativo": True, "processos": None, "minimo_trechos": 20000},  # fatias num pool de processos
+                "indice_arquivo": "conhecimento/base_conhecimento.idx",
+                "faq": {
+                    "atalho_vetorial": True,
+                    "limiar_confianca": 0.6,
+                    "arquivo_vetores": "conhecimento/base_conhecimento.perguntas.npz"
+                },
+                "cache_respostas": {
+                    "ativo": True,
+                    "capacidade": 512,
+                    "ttl_segundos": 86400,
+                    "sqlite": "cache/respostas.sqlite"
+                },
+                "conversas": {"sqlite": "cache/conversas.sqlite", "mensagens_visiveis": 30},  # histórico persistente
+                "base_url": None,  # ex.: servidor falso local (benchmarks/servidor_openai_falso.py)
+                "metricas": {"ativo": False, "porta": 9464, "arquivo_jsonl": None},  # /metrics e eventos JSON lines
+                "agendador": {"max_simultaneas": 16, "tentativas": 3, "limites": {}},  # limites por modelo (RPM/TPM)
+                "cascata": {  # modo automático: modelo rápido quando a busca é confiável
+                    "ativo": False,
+                    "modelo_rapido": "gpt-4.1-nano",
+                    "modelo_completo": "gpt-4o",
+                    "limiares": {  # por origem dos escores: atalho do FAQ, índice de perguntas ou motor
+                        "faq_vetorial": {"confianca_minima": 0.60, "margem_minima": 0.10},
+                        "faq_perguntas": {"confianca_minima": 0.40, "margem_minima": 0.10},
+                        "bm25": {"confianca_minima": 0.35, "margem_minima": 0.10},
+                        "similaridade": {"confianca_minima": 0.70, "margem_minima": 0.10},
+                        "vetorial": {"confianca_minima": 0.60, "margem_minima": 0.10}
+                    },
+                    "max_trechos_rapido": 2
+                },
+                "cliente_http": {
+                    "max_conexoes": 20,
+                    "max_keepalive": 10,
+                    "keepalive_segundos": 60,
+                    "timeout_segundos": 60,
+                    "timeout_conexao_segundos": 5,
+                    "http2": True
+                }
             }
             
             with open(caminho_arquivo, 'w', encoding='utf-8') as f:
                 json.dump(config_padrao, f, indent=2, ensure_ascii=False)
         
-        with open(caminho_arquivo, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            
-        return config
+        return observador.obter(caminho_arquivo, ler_json)
         
     except Exception as e:
         st.error(f"❌ Erro ao carregar configuração: {str(e)}")
@@ -240,9 +267,6 @@ if not OPENAI_API_KEY:
     st.error("OPENAI_API_KEY não encontrada. Crie um arquivo .env com OPENAI_API_KEY=suachave")
     st.stop()
 
-# Instancia o cliente
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 # Configuração da página
 st.set_page_config(
     page_title="ChatBot RAG - Suporte",
@@ -250,10 +274,55 @@ st.set_page_config(
     layout="wide"
 )
 
-# Carrega dados
+# Carrega dados (versão atual de cada arquivo; o observador recarrega o que mudar)
+observador = obter_observador()
 config = carregar_configuracao_json()
+
+# Cliente compartilhado (pool de conexões reaproveitado entre reruns)
+client, conexoes = obter_cliente_openai(OPENAI_API_KEY, config.get("cliente_http"), config.get("base_url"))
+
+# Latência por etapa, tokens e relevância (desligadas, não custam nada)
+config_metricas = config.get("metricas", {})
+metricas = obter_metricas(
+    config_metricas.get("ativo", False),
+    config_metricas.get("porta", PORTA_PADRAO),
+    config_metricas.get("arquivo_jsonl")
+)
+
+# Limites por modelo, fila justa entre sessões e novas tentativas (429, 5xx, timeout)
+agendador = obter_agendador(config.get("agendador"), metricas)
+id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
+
 prompt_sistema = carregar_prompt_do_arquivo()
-base_conhecimento = carregar_base_conhecimento()
+base_conhecimento = carregar_base_conhecimento(
+    config.get("base_conhecimento", "conhecimento/base_conhecimento.txt"),
+    config_embeddings=config.get("embeddings"),
+    caminho_indice=config.get("indice_arquivo"),
+    config_ingestao=config.get("ingestao"),
+    config_faq=config.get("faq"),
+    config_paralelo=config.get("busca_paralela"),
+    cliente=client
+)
+
+# Cache de respostas: descarta apenas respostas de trechos que mudaram na base
+config_cache = config.get("cache_respostas", {})
+cache_respostas = None
+if config_cache.get("ativo", False):
+    cache_respostas = obter_cache_respostas(
+        config_cache.get("capacidade", 512),
+        config_cache.get("ttl_segundos", 86400),
+        config_cache.get("sqlite")
+    )
+    cache_respostas.sincronizar_base(base_conhecimento['versao'], base_conhecimento['hashes'])
+
+# Histórico persistente: o id da conversa na URL sobrevive a recarregar a página e reiniciar o processo
+config_conversas = config.get("conversas", {})
+armazem_conversas = obter_armazem_conversas(config_conversas.get("sqlite"))
+passo_historico = config_conversas.get("mensagens_visiveis", MENSAGENS_VISIVEIS_PADRAO)
+id_conversa = st.query_params.get("conversa")
+if not id_conversa:
+    id_conversa = nova_conversa()
+    st.query_params["conversa"] = id_conversa
 
 # Título principal
 st.write("## 🤖 ChatBot com RAG - Suporte Técnico")
@@ -270,13 +339,54 @@ total_sentencas = len(base_conhecimento['sentencas'])
 
 st.sidebar.metric("📚 Blocos de conhecimento", total_blocos)
 st.sidebar.metric("📝 Sentenças disponíveis", total_sentencas)
+if 'vetores_perguntas' in base_conhecimento:
+    st.sidebar.caption(
+        f"❓ Atalho do FAQ: {len(base_conhecimento['faq'])} perguntas "
+        f"(confiança ≥ {base_conhecimento['vetores_perguntas'].limiar_confianca:.2f})"
+    )
+if cache_respostas is not None:
+    estatisticas_cache = cache_respostas.estatisticas()
+    st.sidebar.metric(
+        "⚡ Cache de respostas",
+        f"{estatisticas_cache['acertos']}/{estatisticas_cache['acertos'] + estatisticas_cache['falhas']}",
+        help=f"{estatisticas_cache['entradas']} respostas guardadas"
+    )
+estatisticas_busca = cache_busca.estatisticas()
+st.sidebar.metric(
+    "🔁 Cache de buscas",
+    f"{estatisticas_busca['acertos']}/{estatisticas_busca['acertos'] + estatisticas_busca['falhas']}",
+    help=f"{estatisticas_busca['entradas']} buscas memorizadas (todas as sessões)"
+)
+estatisticas_conexoes = conexoes.como_dict()
+st.sidebar.metric(
+    "🔌 Conexões reutilizadas",
+    f"{estatisticas_conexoes['reutilizadas']}/{estatisticas_conexoes['requisicoes']}",
+    help=f"{estatisticas_conexoes['conexoes_novas']} conexões abertas com a API (todas as sessões)"
+)
+estatisticas_agendador = agendador.estatisticas()
+espera_fila = estatisticas_agendador['espera_s'] or {}
+st.sidebar.metric(
+    "🚦 Fila do modelo",
+    f"{estatisticas_agendador['na_fila']} na fila • {estatisticas_agendador['em_andamento']}/{estatisticas_agendador['max_simultaneas']}",
+    help=f"Espera p95: {espera_fila.get('p95', 0)}s • {estatisticas_agendador['novas_tentativas']} novas tentativas (todas as sessões)"
+)
 
 # Configurações do RAG
-max_contexto = st.sidebar.slider(
-    "🔍 Máx. resultados RAG:",
-    1, 5, 
-    config.get("max_contexto_rag", 3),
-    help="Quantos trechos relevantes incluir no contexto"
+config_contexto = config.get("contexto_rag", {})
+orcamento_contexto = st.sidebar.slider(
+    "🔍 Orçamento do contexto (tokens):",
+    100, 2000,
+    config_contexto.get("orcamento_tokens", ORCAMENTO_CONTEXTO_PADRAO),
+    step=50,
+    help="Trechos entram por relevância até preencher o orçamento (sem repetir o que já está num bloco)"
+)
+
+motor_padrao = config.get("motor_busca", "bm25")
+motor_busca = st.sidebar.selectbox(
+    "🧮 Motor de busca:",
+    MOTORES_BUSCA,
+    index=MOTORES_BUSCA.index(motor_padrao) if motor_padrao in MOTORES_BUSCA else 0,
+    help="bm25 = índice invertido; similaridade = SequenceMatcher (varredura completa); vetorial = embeddings"
 )
 
 # Parâmetros do modelo
@@ -297,11 +407,15 @@ max_tokens = st.sidebar.number_input(
     50
 )
 
+config_cascata = config.get("cascata", {})
 modelo = st.sidebar.selectbox(
     "🧠 Modelo:",
-    ["gpt-4o", "gpt-4", "gpt-3.5-turbo"],
-    index=0
+    [MODELO_AUTOMATICO, "gpt-4o", "gpt-4", "gpt-3.5-turbo"],
+    index=0 if config_cascata.get("ativo", False) else 1,
+    help="automático = modelo rápido quando a busca acha o trecho com confiança, o completo nos demais casos"
 )
+# Contagem de tokens do contexto: no automático, pelo tokenizer do modelo padrão
+modelo_contagem = config.get("modelo_padrao", "gpt-4o") if modelo == MODELO_AUTOMATICO else modelo
 
 # ═══════════════════════════════════════════════════════
 # AÇÕES DA SIDEBAR
@@ -312,12 +426,15 @@ st.sidebar.write("### 🛠️ Ações")
 col1, col2 = st.sidebar.columns(2)
 with col1:
     if st.button("🗑️ Limpar", use_container_width=True):
-        st.session_state["lista_mensagens"] = []
+        # A conversa antiga fica no SQLite; a tela passa a mostrar uma nova
+        st.query_params["conversa"] = nova_conversa()
+        st.session_state["mensagens_visiveis"] = passo_historico
         st.rerun()
 
 with col2:
     if st.button("🔄 Recarregar", use_container_width=True):
-        st.cache_data.clear()
+        # Confere os arquivos agora: só o que mudou é recarregado
+        observador.verificar(forcar=True)
         st.rerun()
 
 # ═══════════════════════════════════════════════════════
@@ -326,9 +443,19 @@ with col2:
 
 st.sidebar.write("---")
 st.sidebar.write("### 📁 Arquivos RAG")
-st.sidebar.caption("📚 Base: conhecimento/base_conhecimento.txt")
+st.sidebar.caption(f"📚 Base: {config.get('base_conhecimento', 'conhecimento/base_conhecimento.txt')}")
 st.sidebar.caption("📄 Prompt: prompts/prompt_sistema.txt")
 st.sidebar.caption("⚙️ Config: config/bot_config.json")
+if 'arquivo_indice' in base_conhecimento:
+    st.sidebar.caption(f"🗂️ Índice (mmap): {base_conhecimento['arquivo_indice'].caminho}")
+estatisticas_observador = observador.estatisticas()
+if estatisticas_observador["ultima_recarga"]:
+    arquivo_recarregado, instante = estatisticas_observador["ultima_recarga"]
+    st.sidebar.caption(
+        f"🔄 Recarregado: {Path(arquivo_recarregado).name} às {time.strftime('%H:%M:%S', time.localtime(instante))}"
+    )
+if metricas.servidor is not None:
+    st.sidebar.caption(f"📈 Métricas: http://127.0.0.1:{metricas.servidor.server_port}/metrics")
 
 # Opção para visualizar base de conhecimento
 if st.sidebar.checkbox("👀 Ver Base de Conhecimento"):
@@ -348,46 +475,49 @@ def gerar_resposta_com_rag(pergunta_usuario):
     """Gera resposta usando RAG - busca contexto relevante antes de responder"""
     
     # 1. RETRIEVAL - Busca informação relevante
-    contexto_relevante = buscar_contexto_relevante(
-        pergunta_usuario, 
-        base_conhecimento, 
-        max_contexto
-    )
-    
-    # 2. AUGMENTATION - Constrói prompt com contexto
-    mensagem_com_contexto = f"""CONTEXTO DA BASE DE CONHECIMENTO:
-{contexto_relevante}
-
-PERGUNTA DO USUÁRIO: {pergunta_usuario}
-
-Instruções: Responda a pergunta usando EXCLUSIVAMENTE as informações do CONTEXTO acima. Se a informação não estiver no contexto, diga que não possui essa informação na base de conhecimento atual."""
+    with metricas.etapa("buscar_contexto_relevante"):
+        candidatos, origem_busca = cache_busca.buscar_com_origem(
+            pergunta_usuario,
+            base_conhecimento,
+            config_contexto.get("max_candidatos", MAX_CANDIDATOS_PADRAO),
+            motor_busca
+        )
+        # Sem duplicatas bloco/sentença, sentenças vizinhas juntas, até o orçamento de tokens
+        trechos_usados, estatisticas_contexto = empacotar_contexto(
+            candidatos,
+            orcamento_contexto,
+            config_contexto.get("queda_relevancia", QUEDA_RELEVANCIA_PADRAO),
+            modelo_contagem
+        )
+        contexto_relevante = formatar_contexto(trechos_usados)
     
-    # 3. GENERATION - Gera resposta com o contexto
-    mensagens_completas = [
-        {"role": "system", "content": prompt_sistema},
-        {"role": "user", "content": mensagem_com_contexto}
-    ]
+    # 2. AUGMENTATION - Constrói prompt com contexto (o mesmo de motor_rag.py, usado em lote)
+    mensagens_completas = montar_mensagens(prompt_sistema, contexto_relevante, pergunta_usuario)
     
-    return mensagens_completas, contexto_relevante
+    return mensagens_completas, contexto_relevante, trechos_usados, estatisticas_contexto, origem_busca
 
 # ═══════════════════════════════════════════════════════
 # INTERFACE PRINCIPAL DO CHAT
 # ═══════════════════════════════════════════════════════
 
-# Inicializa mensagens
-if "lista_mensagens" not in st.session_state:
-    st.session_state["lista_mensagens"] = []
-
-# Exibe histórico
-for msg in st.session_state["lista_mensagens"]:
-    if msg["role"] == "user":
-        st.chat_message("user", avatar="👤").write(msg["content"])
-    elif msg["role"] == "assistant":
-        st.chat_message("assistant", avatar="🤖").write(msg["content"])
-    elif msg["role"] == "context":
-        # Exibe contexto usado (opcional)
-        with st.expander("🔍 Contexto RAG utilizado"):
-            st.text(msg["content"])
+def mostrar_mensagens_anteriores():
+    st.session_state["mensagens_visiveis"] += passo_historico
+
+# Exibe só as últimas mensagens: o custo do rerun não cresce com o histórico
+mensagens_visiveis = st.session_state.setdefault("mensagens_visiveis", passo_historico)
+with metricas.etapa("renderizar_historico"):
+    historico, ha_anteriores = armazem_conversas.ultimas(id_conversa, mensagens_visiveis)
+    if ha_anteriores:
+        st.button("⬆️ Carregar mensagens anteriores", on_click=mostrar_mensagens_anteriores)
+    for msg in historico:
+        if msg["role"] == "user":
+            st.chat_message("user", avatar="👤").write(msg["content"])
+        elif msg["role"] == "assistant":
+            st.chat_message("assistant", avatar="🤖").write(msg["content"])
+        elif msg["role"] == "context":
+            # Exibe contexto usado (opcional)
+            with st.expander("🔍 Contexto RAG utilizado"):
+                st.text(msg["content"])
 
 # Entrada do usuário
 mensagem_usuario = st.chat_input("💭 Faça sua pergunta sobre Streamlit...")
@@ -399,52 +529,94 @@ mensagem_usuario = st.chat_input("💭 Faça sua pergunta sobre Streamlit...")
 if mensagem_usuario:
     # Exibe mensagem do usuário
     st.chat_message("user", avatar="👤").write(mensagem_usuario)
-    st.session_state["lista_mensagens"].append({
-        "role": "user", 
-        "content": mensagem_usuario
-    })
+    armazem_conversas.acrescentar(id_conversa, "user", mensagem_usuario)
     
     # Processa com RAG
     with st.chat_message("assistant", avatar="🤖"):
-        with st.spinner("🔍 Buscando na base de conhecimento..."):
-            try:
+        stream = None
+        try:
+            medicao = MedicaoTurno()
+            with st.spinner("🔍 Buscando na base de conhecimento..."):
                 # Gera resposta com RAG
-                mensagens_rag, contexto_usado = gerar_resposta_com_rag(mensagem_usuario)
+                with metricas.etapa("gerar_resposta_com_rag"):
+                    mensagens_rag, contexto_usado, trechos_usados, estatisticas_contexto, origem_busca = gerar_resposta_com_rag(mensagem_usuario)
+                relevancias = [relevancia for relevancia, _ in trechos_usados]
                 
-                # Chamada à API
-                resposta = client.chat.completions.create(
-                    model=modelo,
-                    messages=mensagens_rag,
-                    temperature=temperatura,
-                    max_tokens=max_tokens,
-                    top_p=0.9
-                )
+                # Modo automático: a confiança da busca decide o modelo deste turno
+                roteamento = None
+                modelo_turno = modelo
+                if modelo == MODELO_AUTOMATICO:
+                    roteamento = escolher_modelo(trechos_usados, config_cascata, config.get("modelo_padrao"), origem_busca)
+                    modelo_turno = roteamento["modelo"]
                 
-                resposta_ia = resposta.choices[0].message.content
+                # Pergunta repetida com os mesmos trechos: reaproveita a resposta
+                dependencias = hashes_trechos(trechos_usados)
+                chave_cache = CacheRespostas.chave(
+                    normalizar_pergunta(mensagem_usuario),
+                    dependencias,
+                    versao_prompt(mensagem_sistema(prompt_sistema)),
+                    modelo_turno,
+                    temperatura,
+                    max_tokens
+                )
+                resposta_ia = cache_respostas.obter(chave_cache) if cache_respostas is not None else None
                 
-                # Exibe resposta
+                if resposta_ia is None:
+                    # Chamada à API em streaming
+                    stream = agendador.criar(
+                        client,
+                        sessao=id_sessao,
+                        model=modelo_turno,
+                        messages=mensagens_rag,
+                        temperature=temperatura,
+                        max_tokens=max_tokens,
+                        top_p=0.9,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+            
+            if stream is None:
                 st.write(resposta_ia)
-                
-                # Salva no histórico
-                st.session_state["lista_mensagens"].append({
-                    "role": "assistant", 
-                    "content": resposta_ia
-                })
-                
-                # Opcionalmente salva o contexto usado
-                st.session_state["lista_mensagens"].append({
-                    "role": "context",
-                    "content": contexto_usado
-                })
-                
-            except Exception as e:
-                st.error(f"❌ Erro na API: {str(e)}")
+                st.caption("⚡ Resposta do cache")
+                metricas.registrar_resposta(modelo_turno, escores=relevancias, origem="cache")
+            else:
+                # Exibe a resposta conforme os tokens chegam
+                resposta_ia = st.write_stream(medicao.transmitir(stream))
+                registrar_latencia(st.session_state, medicao)
+                # Do create() ao último pedaço do stream
+                metricas.observar_etapa("chat_completions", medicao.tempo_total)
+                metricas.registrar_resposta(
+                    medicao.modelo or modelo_turno, medicao.uso, relevancias, medicao.tempo_primeiro_token
+                )
+                resumo_turno = (
+                    f"{medicao.resumo()} • 📦 contexto: {estatisticas_contexto['tokens_depois']} tokens "
+                    f"({-estatisticas_contexto['tokens_economizados']:+d} vs. top-{MAX_RESULTADOS_REFERENCIA})"
+                )
+                if roteamento is not None:
+                    metricas.registrar_roteamento(roteamento, medicao.tempo_total, medicao.tempo_primeiro_token)
+                    resumo_turno += f" • {resumo_decisao(roteamento)}"
+                st.caption(resumo_turno)
+                if cache_respostas is not None:
+                    cache_respostas.guardar(chave_cache, resposta_ia, dependencias)
+            
+            # Salva no histórico (com o contexto usado)
+            armazem_conversas.acrescentar(id_conversa, "assistant", resposta_ia)
+            armazem_conversas.acrescentar(id_conversa, "context", contexto_usado)
+            
+        except TimeoutError:
+            st.warning("⏳ Muitas perguntas ao mesmo tempo: tente de novo em alguns instantes.")
+        except Exception as e:
+            st.error(f"❌ Erro na API: {str(e)}")
+        finally:
+            # Rerun/stop entre o create() e o fim do write_stream: devolve a vaga do agendador já
+            if stream is not None:
+                stream.close()
 
 # ═══════════════════════════════════════════════════════
 # INFORMAÇÕES INICIAIS
 # ═══════════════════════════════════════════════════════
 
-if len(st.session_state["lista_mensagens"]) == 0:
+if not historico and not mensagem_usuario:
     st.info("🤖 Olá! Sou seu assistente RAG especializado em Streamlit. Faça perguntas sobre desenvolvimento, componentes, configurações e muito mais!")
     
     # Exemplos de perguntas
@@ -0,0 +1,328 @@
+"""
+Busca em fatias: pontuação de bases grandes num pool de processos
+
+As varreduras de _buscar_no_texto (SequenceMatcher e BM25 do índice em
+memória) são Python puro e presas ao GIL: numa base grande, uma consulta
+ocupa um núcleo inteiro enquanto os outros ficam parados. A partir de
+minimo_trechos, os registros da base são divididos em fatias contíguas,
+uma por processo, e cada consulta vai para todas as fatias ao mesmo tempo:
+cada processo devolve o top-k da sua fatia e o processo principal junta.
+
+    - Os textos normalizados, os tipos e as normas do BM25 ficam num bloco
+      de memória compartilhada (multiprocessing.shared_memory), escrito
+      uma vez por versão da base. Na primeira consulta da versão, cada
+      trabalhador abre o bloco e lê os textos da sua fatia direto dele, sem
+      copiá-los (cada texto é decodificado quando usado); guarda só offsets,
+      normas e, para o BM25, os postings locais. As consultas seguintes
+      mandam só a pergunta.
+    - Cada fatia tem o seu ProcessPoolExecutor de um processo, criado na
+      primeira consulta e mantido pelo processo inteiro: a fatia i cai
+      sempre no mesmo trabalhador, que guarda apenas ela.
+    - IDF e normas são os da base inteira (vindos do IndiceBM25), somados
+      na mesma ordem: a relevância de cada trecho e o top-k (inclusive os
+      desempates pelo id) são os mesmos da busca num processo só.
+
+Abaixo do limite, ou se um trabalhador cair, a busca segue no próprio
+processo como antes.
+
+Uso:
+    base = ativar_busca_paralela(base, {"processos": 4, "minimo_trechos": 20000})
+    buscar_trechos(pergunta, base, motor="similaridade")   # usa base['fatias']
+"""
+import atexit
+import heapq
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rag_busca import limiar_por_tipo, tokenizar_normalizado, ComparadorSimilaridade
+
+logger = logging.getLogger(__name__)
+
+MINIMO_TRECHOS_PADRAO = 20000
+TIPOS_TRECHO = ("bloco", "sentenca")
+MAX_FATIAS_POR_TRABALHADOR = 2      # a versão atual e a anterior, durante a troca
+
+# ═══════════════════════════════════════════════════════
+# BLOCO COMPARTILHADO
+# ═══════════════════════════════════════════════════════
+# Layout (int64 alinhado): n | offsets[n + 1] | normas[n] (float64) | tipos[n] (u8) | textos UTF-8
+
+def _alinhar(posicao, alinhamento=8):
+    return (posicao + alinhamento - 1) // alinhamento * alinhamento
+
+
+def _secoes(n):
+    """Offsets (em bytes) de cada seção do bloco para n registros"""
+    offsets = 8
+    normas = offsets + 8 * (n + 1)
+    tipos = normas + 8 * n
+    textos = _alinhar(tipos + n)
+    return offsets, normas, tipos, textos
+
+
+def _escrever_bloco(registros, normas):
+    """Cria o bloco compartilhado com os registros da base; devolve o SharedMemory"""
+    codificados = []
+    tipos = np.empty(len(registros), dtype=np.uint8)
+    for i, registro in enumerate(registros):
+        codificados.append(registro['normalizado'].encode('utf-8'))
+        tipos[i] = TIPOS_TRECHO.index(registro['tipo'])
+    n = len(codificados)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in codificados], out=offsets[1:])
+
+    secao_offsets, secao_normas, secao_tipos, secao_textos = _secoes(n)
+    bloco = shared_memory.SharedMemory(create=True, size=max(1, secao_textos + int(offsets[-1])))
+    try:
+        np.ndarray(1, np.int64, bloco.buf)[0] = n
+        np.ndarray(n + 1, np.int64, bloco.buf, secao_offsets)[:] = offsets
+        np.ndarray(n, np.float64, bloco.buf, secao_normas)[:] = normas if normas is not None else 0.0
+        np.ndarray(n, np.uint8, bloco.buf, secao_tipos)[:] = tipos
+        bloco.buf[secao_textos:secao_textos + int(offsets[-1])] = b"".join(codificados)
+    except BaseException:
+        bloco.close()
+        bloco.unlink()
+        raise
+    return bloco
+
+
+def _liberar_bloco(bloco):
+    try:
+        bloco.close()
+        bloco.unlink()
+    except FileNotFoundError:
+        pass
+
+# ═══════════════════════════════════════════════════════
+# TRABALHADOR
+# ═══════════════════════════════════════════════════════
+
+# (nome do bloco, início, fim) -> fatia já lida; vive no processo trabalhador
+_fatias_locais = OrderedDict()
+
+
+class _TextosDoBloco:
+    """
+    Textos [inicio, fim) lidos direto do bloco compartilhado: nada é copiado,
+    cada texto é decodificado quando usado. Mantém o bloco aberto enquanto
+    a fatia estiver no trabalhador (o SharedMemory fecha ao ser coletado).
+    """
+
+    def __init__(self, bloco, secao_textos, offsets):
+        self._bloco = bloco
+        self._secao_textos = secao_textos
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, posicao):
+        inicio = self._secao_textos + self._offsets[posicao]
+        fim = self._secao_textos + self._offsets[posicao + 1]
+        return str(self._bloco.buf[inicio:fim], 'utf-8')
+
+    def __iter__(self):
+        return (self[posicao] for posicao in range(len(self)))
+
+
+class _FatiaLocal:
+    """Pedaço [inicio, fim) da base, lido do bloco compartilhado pelo trabalhador"""
+
+    def __init__(self, nome, inicio, fim):
+        bloco = shared_memory.SharedMemory(name=nome)
+        try:
+            n = int(np.ndarray(1, np.int64, bloco.buf)[0])
+            secao_offsets, secao_normas, secao_tipos, secao_textos = _secoes(n)
+            # Cópias pequenas (8 bytes por trecho): nenhuma view fica presa ao bloco
+            offsets = np.ndarray(n + 1, np.int64, bloco.buf, secao_offsets)[inicio:fim + 1].copy()
+            self.normas = np.ndarray(n, np.float64, bloco.buf, secao_normas)[inicio:fim].tolist()
+            tipos = np.ndarray(n, np.uint8, bloco.buf, secao_tipos)[inicio:fim].tolist()
+        except BaseException:
+            bloco.close()
+            raise
+
+        self.inicio = inicio
+        self.textos = _TextosDoBloco(bloco, secao_textos, offsets)
+        self.limiares = [limiar_por_tipo(TIPOS_TRECHO[tipo]) for tipo in tipos]
+        self.comparador = ComparadorSimilaridade(self.textos, self.limiares)
+        self._postings = None
+
+    @property
+    def postings(self):
+        """Postings locais do BM25 (termo -> [(posição na fatia, frequência)]), montados na 1ª consulta"""
+        if self._postings is None:
+            postings = defaultdict(list)
+            for posicao, texto in enumerate(self.textos):
+                for termo, frequencia in Counter(tokenizar_normalizado(texto)).items():
+                    postings[termo].append((posicao, frequencia))
+            self._postings = dict(postings)
+        return self._postings
+
+
+def _fatia(nome, inicio, fim):
+    chave = (nome, inicio, fim)
+    fatia = _fatias_locais.get(chave)
+    if fatia is None:
+        fatia = _fatias_locais[chave] = _FatiaLocal(nome, inicio, fim)
+        while len(_fatias_locais) > MAX_FATIAS_POR_TRABALHADOR:
+            _fatias_locais.popitem(last=False)
+    else:
+        _fatias_locais.move_to_end(chave)
+    return fatia
+
+
+def _pontuar_fatia(nome, inicio, fim, motor, consulta, max_resultados):
+    """
+    Top-k [(relevância, id do registro)] da fatia, com os mesmos limiares e
+    desempate de rag_busca._buscar_no_texto. No BM25, consulta traz
+    (pesos [(termo, idf)], k1, máximo teórico) calculados na base inteira.
+    """
+    fatia = _fatia(nome, inicio, fim)
+    if motor == "similaridade":
+        return fatia.comparador.top_k(consulta, max_resultados, inicio)
+
+    achados = []
+    pesos, k1, maximo_teorico = consulta
+    k1_mais_1 = k1 + 1
+    postings = fatia.postings
+    normas = fatia.normas
+    pontuacoes = defaultdict(float)
+    for termo, idf in pesos:
+        for posicao, frequencia in postings.get(termo, ()):
+            pontuacoes[posicao] += idf * frequencia * k1_mais_1 / (frequencia + normas[posicao])
+    for posicao, pontuacao in pontuacoes.items():
+        relevancia = pontuacao / maximo_teorico
+        if relevancia > fatia.limiares[posicao]:
+            achados.append((relevancia, inicio + posicao))
+    return heapq.nlargest(max_resultados, achados, key=lambda x: (x[0], -x[1]))
+
+# ═══════════════════════════════════════════════════════
+# POOL E FATIAS DA BASE
+# ═══════════════════════════════════════════════════════
+
+class PoolFatias:
+    """Um ProcessPoolExecutor de um processo por fatia, compartilhado pelo processo principal"""
+
+    def __init__(self, processos):
+        self.processos = processos
+        self._lock = threading.Lock()
+        self._executores = None
+
+    def executores(self):
+        with self._lock:
+            if self._executores is None:
+                # forkserver (ou spawn), como em ingestao.py: o pool nasce dentro do
+                # servidor, com outras threads vivas, onde um fork() pode herdar um
+                # lock preso. _pontuar_fatia é importável deste módulo.
+                metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                contexto = multiprocessing.get_context(metodo)
+                self._executores = [
+                    ProcessPoolExecutor(max_workers=1, mp_context=contexto) for _ in range(self.processos)
+                ]
+            return self._executores
+
+    def reiniciar(self):
+        """Descarta os processos (ex.: um deles caiu); os próximos são criados sob demanda"""
+        with self._lock:
+            executores, self._executores = self._executores, None
+        for executor in executores or ():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def fechar(self):
+        self.reiniciar()
+
+
+_pools = {}
+_lock_pools = threading.Lock()
+
+
+def obter_pool(processos):
+    """Pool do processo para esse número de fatias (criado uma vez)"""
+    with _lock_pools:
+        pool = _pools.get(processos)
+        if pool is None:
+            pool = _pools[processos] = PoolFatias(processos)
+        return pool
+
+
+@atexit.register
+def _fechar_pools():
+    for pool in list(_pools.values()):
+        pool.fechar()
+
+
+class FatiasBase:
+    """
+    Base de conhecimento dividida em fatias; fica em base['fatias'] e é
+    consultada por rag_busca._buscar_no_texto. O bloco compartilhado é
+    liberado quando a base sai de uso (recarga pelo observador).
+    """
+
+    def __init__(self, base, pool):
+        registros = base['registros']
+        indice = base['indice']
+        # BM25 em fatias só para o índice em memória (o do mmap já soma com NumPy)
+        self.bm25 = hasattr(indice, 'pesos_consulta')
+        self.indice = indice if self.bm25 else None
+        self.registros = registros
+        self.pool = pool
+
+        self._bloco = _escrever_bloco(registros, indice.normas if self.bm25 else None)
+        self._finalizador = weakref.finalize(self, _liberar_bloco, self._bloco)
+        total = len(registros)
+        limites = [total * i // pool.processos for i in range(pool.processos + 1)]
+        self.intervalos = [(inicio, fim) for inicio, fim in zip(limites, limites[1:]) if fim > inicio]
+
+    def buscar(self, consulta, max_resultados, motor):
+        """Top-k [(relevância, registro)] juntando as fatias; None se o motor não usa fatias"""
+        if motor == "similaridade":
+            dados_consulta = consulta['normalizado']
+        elif self.bm25:
+            pesos, maximo_teorico = self.indice.pesos_consulta(consulta['tokens'])
+            if not pesos:
+                return []
+            dados_consulta = (pesos, self.indice.k1, maximo_teorico)
+        else:
+            return None
+
+        try:
+            futuros = [
+                executor.submit(_pontuar_fatia, self._bloco.name, inicio, fim, motor, dados_consulta, max_resultados)
+                for executor, (inicio, fim) in zip(self.pool.executores(), self.intervalos)
+            ]
+            achados = [achado for futuro in futuros for achado in futuro.result()]
+        except BrokenProcessPool:
+            logger.warning("Um processo da busca em fatias caiu; esta consulta segue no processo principal")
+            self.pool.reiniciar()
+            return None
+
+        # Em empate, o trecho que vem antes na base (blocos primeiro) ganha
+        melhores = heapq.nlargest(max_resultados, achados, key=lambda x: (x[0], -x[1]))
+        return [(relevancia, self.registros[doc_id]) for relevancia, doc_id in melhores]
+
+    def fechar(self):
+        self._finalizador()
+
+
+def ativar_busca_paralela(base, config_paralelo=None):
+    """
+    Liga a busca em fatias se a base tiver ao menos minimo_trechos registros
+    (config "busca_paralela": ativo, processos, minimo_trechos). Devolve a base.
+    """
+    config_paralelo = config_paralelo or {}
+    processos = config_paralelo.get("processos") or os.cpu_count() or 1
+    minimo = config_paralelo.get("minimo_trechos", MINIMO_TRECHOS_PADRAO)
+    if not config_paralelo.get("ativo", True) or processos < 2 or len(base['registros']) < minimo:
+        return base
+    base['fatias'] = FatiasBase(base, obter_pool(processos))
+    logger.info("Busca em fatias: %d trechos em %d processos", len(base['registros']), processos)
+    return base
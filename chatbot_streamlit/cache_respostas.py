@@ -0,0 +1,176 @@
+"""
+Cache de respostas do LLM para perguntas repetidas do FAQ
+
+A chave combina a pergunta normalizada, os trechos recuperados (hash do
+conteúdo de cada um), a versão do prompt, o modelo, a temperatura e o
+limite de tokens. Cada entrada guarda de quais trechos depende: editar um
+item do FAQ invalida apenas as respostas construídas a partir dele.
+
+Despejo por LRU (capacidade) e TTL; persistência opcional em SQLite.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def versao_prompt(prompt_sistema):
+    """Identificador curto do conteúdo do prompt do sistema"""
+    return hashlib.sha256(prompt_sistema.encode('utf-8')).hexdigest()[:12]
+
+
+class CacheRespostas:
+    """LRU + TTL em memória, com escrita direta opcional em SQLite"""
+
+    def __init__(self, capacidade=512, ttl_segundos=24 * 3600, caminho_sqlite=None):
+        self.capacidade = capacidade
+        self.ttl_segundos = ttl_segundos
+        self.acertos = 0
+        self.falhas = 0
+        self.versao_base = None
+
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()     # chave -> (resposta, dependências, criado_em)
+        self._por_trecho = {}              # hash do trecho -> {chaves}
+        self._conexao = None
+
+        if caminho_sqlite:
+            Path(caminho_sqlite).parent.mkdir(parents=True, exist_ok=True)
+            self._conexao = sqlite3.connect(caminho_sqlite, check_same_thread=False)
+            self._conexao.execute(
+                "CREATE TABLE IF NOT EXISTS respostas ("
+                " chave TEXT PRIMARY KEY, resposta TEXT NOT NULL,"
+                " dependencias TEXT NOT NULL, criado_em REAL NOT NULL)"
+            )
+            self._conexao.commit()
+            self._carregar_sqlite()
+
+    # ───────────────────────────────────────────────────
+    # Chave
+    # ───────────────────────────────────────────────────
+
+    @staticmethod
+    def chave(pergunta_normalizada, ids_trechos, versao_prompt, modelo, temperatura, max_tokens=None):
+        bruto = json.dumps(
+            [pergunta_normalizada, list(ids_trechos), versao_prompt, modelo, round(float(temperatura), 3), max_tokens],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+    # ───────────────────────────────────────────────────
+    # Leitura e escrita
+    # ───────────────────────────────────────────────────
+
+    def obter(self, chave):
+        """Resposta em cache ou None (conta acerto/falha)"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and self._expirada(entrada):
+                self._remover(chave)
+                entrada = None
+            if entrada is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[0]
+
+    def guardar(self, chave, resposta, dependencias):
+        """Guarda a resposta junto com os hashes dos trechos usados para gerá-la"""
+        dependencias = tuple(dependencias)
+        criado_em = time.time()
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._inserir(chave, resposta, dependencias, criado_em)
+            if self._conexao is not None:
+                self._conexao.execute(
+                    "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?)",
+                    (chave, resposta, json.dumps(dependencias), criado_em),
+                )
+                self._conexao.commit()
+            while len(self._entradas) > self.capacidade:
+                self._remover(next(iter(self._entradas)))
+
+    # ───────────────────────────────────────────────────
+    # Invalidação
+    # ───────────────────────────────────────────────────
+
+    def invalidar_trechos(self, hashes_trechos):
+        """Remove apenas as respostas que dependem dos trechos informados"""
+        with self._lock:
+            chaves = set()
+            for hash_trecho in hashes_trechos:
+                chaves |= self._por_trecho.get(hash_trecho, set())
+            for chave in chaves:
+                self._remover(chave)
+            return len(chaves)
+
+    def sincronizar_base(self, versao_base, hashes_atuais):
+        """
+        Chamado quando a base muda: invalida respostas que usaram trechos
+        que não existem mais (editados ou removidos). Barato se a versão não mudou.
+        hashes_atuais só precisa de 'in' (base['hashes']): o custo é o das
+        entradas do cache, não o do tamanho da base.
+        """
+        if versao_base == self.versao_base:
+            return 0
+        with self._lock:
+            obsoletos = [h for h in self._por_trecho if h not in hashes_atuais]
+        removidas = self.invalidar_trechos(obsoletos)
+        self.versao_base = versao_base
+        return removidas
+
+    def limpar(self):
+        with self._lock:
+            for chave in list(self._entradas):
+                self._remover(chave)
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "entradas": len(self._entradas),
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+        }
+
+    # ───────────────────────────────────────────────────
+    # Internos (chamados com o lock adquirido)
+    # ───────────────────────────────────────────────────
+
+    def _expirada(self, entrada):
+        return self.ttl_segundos is not None and time.time() - entrada[2] > self.ttl_segundos
+
+    def _inserir(self, chave, resposta, dependencias, criado_em):
+        self._entradas[chave] = (resposta, dependencias, criado_em)
+        for hash_trecho in dependencias:
+            self._por_trecho.setdefault(hash_trecho, set()).add(chave)
+
+    def _remover(self, chave):
+        _, dependencias, _ = self._entradas.pop(chave)
+        for hash_trecho in dependencias:
+            chaves = self._por_trecho.get(hash_trecho)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._por_trecho[hash_trecho]
+        if self._conexao is not None:
+            self._conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+            self._conexao.commit()
+
+    def _carregar_sqlite(self):
+        """Recarrega as entradas mais recentes ainda válidas (até a capacidade)"""
+        limite = time.time() - self.ttl_segundos if self.ttl_segundos is not None else 0
+        with self._lock:
+            self._conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (limite,))
+            self._conexao.commit()
+            linhas = self._conexao.execute(
+                "SELECT chave, resposta, dependencias, criado_em FROM respostas"
+                " ORDER BY criado_em DESC LIMIT ?", (self.capacidade,)
+            ).fetchall()
+            for chave, resposta, dependencias, criado_em in reversed(linhas):
+                self._inserir(chave, resposta, tuple(json.loads(dependencias)), criado_em)
@@ -0,0 +1,110 @@
+"""
+Cascata de modelos: pergunta de FAQ vai para o modelo rápido, o resto sobe
+
+Com um modelo fixo por sessão, perguntas que a busca resolve sozinha (o
+atalho do FAQ devolve a entrada certa) pagam a latência do gpt-4o. No modo
+automático o modelo é escolhido a cada turno pela confiança da recuperação:
+
+    - melhor trecho com relevância >= confianca_minima,
+    - margem clara sobre o segundo trecho (>= margem_minima) e
+    - no máximo max_trechos_rapido trechos no contexto
+        -> modelo_rapido (padrão: modelo_padrao do config, se não for o
+           próprio modelo_completo; senão gpt-4.1-nano)
+    - qualquer outro caso (sem contexto, confiança baixa, empate, resposta
+      que precisa juntar vários trechos)
+        -> modelo_completo
+
+A margem é medida nos trechos já empacotados (contexto_rag.py): sentenças
+do mesmo bloco já foram removidas, então o segundo colocado é de fato outra
+passagem. Cada decisão vai para as métricas com o motivo, a relevância, a
+margem e a latência do turno, para calibrar os limiares (config "cascata").
+
+Os limiares dependem de quem pontuou os trechos (rag_busca.buscar_trechos_com_origem):
+o atalho vetorial do FAQ (cosseno com as perguntas), o índice de perguntas
+(BM25 só das perguntas) ou, sem acerto no FAQ, o motor de busca (BM25
+normalizado, SequenceMatcher ou cosseno). Cada um tem a sua escala, então
+os limiares são por origem (config "cascata.limiares.<origem>"): um acerto
+do índice de perguntas (>= 0.4) não é julgado pelo 0.70 do SequenceMatcher.
+Os padrões foram calibrados nas perguntas rotuladas (benchmarks/): em cada
+origem, todo turno mandado ao modelo rápido tinha o trecho certo em 1º.
+Na falta de "limiares", confianca_minima/margem_minima no nível de cima
+do bloco valem para o bm25 (onde foram calibrados antes).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODELO_AUTOMATICO = "automático"
+
+MODELO_RAPIDO_PADRAO = "gpt-4.1-nano"
+MODELO_COMPLETO_PADRAO = "gpt-4o"
+MAX_TRECHOS_RAPIDO_PADRAO = 2
+
+# Por origem das relevâncias: cada caminho da busca pontua numa escala diferente
+LIMIARES_PADRAO = {
+    "faq_vetorial": {"confianca_minima": 0.60, "margem_minima": 0.10},
+    "faq_perguntas": {"confianca_minima": 0.40, "margem_minima": 0.10},
+    "bm25": {"confianca_minima": 0.35, "margem_minima": 0.10},
+    "similaridade": {"confianca_minima": 0.70, "margem_minima": 0.10},
+    "vetorial": {"confianca_minima": 0.60, "margem_minima": 0.10},
+}
+
+
+def limiares_da_origem(config_cascata, origem="bm25"):
+    """(confianca_minima, margem_minima) da origem: config 'limiares.<origem>' > padrão da origem"""
+    padrao = dict(LIMIARES_PADRAO.get(origem, LIMIARES_PADRAO["bm25"]))
+    if origem == "bm25" and "limiares" not in config_cascata:
+        # Config antigo, de antes dos limiares por origem
+        padrao.update({chave: config_cascata[chave] for chave in padrao if chave in config_cascata})
+    limiares = {**padrao, **config_cascata.get("limiares", {}).get(origem, {})}
+    return limiares["confianca_minima"], limiares["margem_minima"]
+
+
+def escolher_modelo(trechos, config_cascata=None, modelo_padrao=None, origem="bm25"):
+    """
+    Decide o nível do turno a partir dos trechos empacotados [(relevância, registro)]
+    e da origem das relevâncias (faq_vetorial, faq_perguntas ou o motor de busca)
+    Retorna {'modelo', 'nivel' ('rapido' ou 'completo'), 'motivo', 'origem', 'melhor', 'margem', 'trechos'}
+    """
+    config_cascata = config_cascata or {}
+    modelo_completo = config_cascata.get("modelo_completo", MODELO_COMPLETO_PADRAO)
+    if modelo_padrao == modelo_completo:
+        # Mesmo modelo nos dois níveis: a cascata não faria nada
+        modelo_padrao = None
+    modelo_rapido = config_cascata.get("modelo_rapido") or modelo_padrao or MODELO_RAPIDO_PADRAO
+    confianca_minima, margem_minima = limiares_da_origem(config_cascata, origem)
+
+    relevancias = [float(relevancia) for relevancia, _ in trechos]
+    melhor = relevancias[0] if relevancias else 0.0
+    margem = melhor - (relevancias[1] if len(relevancias) > 1 else 0.0)
+
+    if not relevancias:
+        motivo = "sem_contexto"
+    elif melhor < confianca_minima:
+        motivo = "confianca_baixa"
+    elif margem < margem_minima:
+        motivo = "margem_pequena"
+    elif len(relevancias) > config_cascata.get("max_trechos_rapido", MAX_TRECHOS_RAPIDO_PADRAO):
+        motivo = "varios_trechos"
+    else:
+        motivo = "confiante"
+
+    nivel = "rapido" if motivo == "confiante" else "completo"
+    decisao = {
+        "modelo": modelo_rapido if nivel == "rapido" else modelo_completo,
+        "nivel": nivel,
+        "motivo": motivo,
+        "origem": origem,
+        "melhor": round(melhor, 4),
+        "margem": round(margem, 4),
+        "trechos": len(relevancias),
+    }
+    logger.info("Cascata: %s (%s, %s, melhor %.3f, margem %.3f, %d trechos)",
+                decisao["modelo"], origem, motivo, melhor, margem, len(relevancias))
+    return decisao
+
+
+def resumo_decisao(decisao):
+    """Texto curto para exibir abaixo da resposta"""
+    icone = "⚡" if decisao["nivel"] == "rapido" else "🧠"
+    return f"{icone} {decisao['modelo']} ({decisao['motivo']}: {decisao['melhor']:.2f}, margem {decisao['margem']:.2f})"
@@ -0,0 +1,114 @@
+"""
+Cliente OpenAI compartilhado pelo processo
+
+Criar OpenAI() a cada rerun do Streamlit descarta o pool HTTP e, com ele,
+as conexões keep-alive e as sessões TLS já negociadas. Os scripts guardam
+o cliente criado aqui com @st.cache_resource: uma instância por processo,
+reaproveitada por todas as sessões.
+
+O pool (tamanho, keep-alive, timeouts, HTTP/2) vem da chave "cliente_http"
+do config/bot_config.json. HTTP/2 só é ativado se o pacote h2 estiver
+instalado (pip install "httpx[http2]"); sem ele, fica HTTP/1.1 com keep-alive.
+
+criar_cliente_assincrono monta o AsyncOpenAI com o mesmo pool, para quem
+dispara várias chamadas ao mesmo tempo num event loop (responder_lote.py).
+"""
+import importlib.util
+import threading
+
+from openai import (
+    DEFAULT_CONNECTION_LIMITS, AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI, Timeout,
+)
+
+# Mesma classe Limits do transporte usado pelo pacote openai
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+CONFIG_HTTP_PADRAO = {
+    "max_conexoes": 20,
+    "max_keepalive": 10,
+    "keepalive_segundos": 60,
+    "timeout_segundos": 60,
+    "timeout_conexao_segundos": 5,
+    "http2": True,
+}
+
+
+class EstatisticasConexoes:
+    """Conta requisições e conexões TCP novas; o resto foi reaproveitado do pool"""
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.conexoes_novas = 0
+        self._lock = threading.Lock()
+
+    def ao_enviar(self, requisicao):
+        """Event hook do httpx: registra a requisição e acompanha os eventos de conexão"""
+        with self._lock:
+            self.requisicoes += 1
+        requisicao.extensions["trace"] = self._rastrear
+
+    def _rastrear(self, evento, informacoes):
+        if evento == "connection.connect_tcp.complete":
+            with self._lock:
+                self.conexoes_novas += 1
+
+    @property
+    def reutilizadas(self):
+        return max(self.requisicoes - self.conexoes_novas, 0)
+
+    def como_dict(self):
+        return {
+            "requisicoes": self.requisicoes,
+            "conexoes_novas": self.conexoes_novas,
+            "reutilizadas": self.reutilizadas,
+            "taxa_reuso": self.reutilizadas / self.requisicoes if self.requisicoes else 0.0,
+        }
+
+
+def http2_disponivel():
+    return importlib.util.find_spec("h2") is not None
+
+
+def _parametros_pool(config_http):
+    """Limites, timeouts e HTTP/2 do pool, comuns ao cliente síncrono e ao assíncrono"""
+    config_http = {**CONFIG_HTTP_PADRAO, **(config_http or {})}
+    return {
+        "limits": Limits(
+            max_connections=config_http["max_conexoes"],
+            max_keepalive_connections=config_http["max_keepalive"],
+            keepalive_expiry=config_http["keepalive_segundos"],
+        ),
+        "timeout": Timeout(
+            config_http["timeout_segundos"],
+            connect=config_http["timeout_conexao_segundos"],
+        ),
+        "http2": bool(config_http["http2"]) and http2_disponivel(),
+    }
+
+
+def criar_cliente(api_key, base_url=None, config_http=None):
+    """
+    Cria o cliente OpenAI com um pool HTTP configurado
+
+    Retorna (cliente, estatísticas de conexões).
+    """
+    estatisticas = EstatisticasConexoes()
+    http_client = DefaultHttpxClient(
+        **_parametros_pool(config_http),
+        event_hooks={"request": [estatisticas.ao_enviar]},
+    )
+
+    cliente = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+    return cliente, estatisticas
+
+
+def criar_cliente_assincrono(api_key, base_url=None, config_http=None):
+    """
+    AsyncOpenAI com o mesmo pool; max_conexoes limita as requisições em voo.
+    Deve ser criado (e usado) dentro do event loop que fará as chamadas.
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=DefaultAsyncHttpxClient(**_parametros_pool(config_http)),
+    )
@@ -0,0 +1,167 @@
+"""
+Empacotamento do contexto do RAG dentro de um orçamento de tokens
+
+A busca devolve blocos e sentenças numa única lista ordenada, e é comum o
+top-k trazer um bloco seguido de sentenças copiadas dele mesmo. Antes de
+ir para o prompt, os resultados passam por:
+    1. corte onde a relevância despenca em relação ao trecho anterior
+    2. descarte de trechos já contidos num bloco mais bem colocado
+    3. fusão de sentenças vizinhas (registros consecutivos do mesmo bloco)
+       numa só passagem
+    4. preenchimento do orçamento de tokens, em ordem de relevância
+
+Uma passagem fundida guarda em 'partes' os registros de origem, para que o
+cache de respostas continue dependendo dos hashes reais da base.
+
+A economia informada compara com o que ia para o prompt antes do
+empacotador: os MAX_RESULTADOS_REFERENCIA primeiros trechos da busca.
+"""
+import logging
+
+from historico_conversa import contar_tokens
+from rag_busca import formatar_contexto, hash_conteudo
+
+logger = logging.getLogger(__name__)
+
+ORCAMENTO_CONTEXTO_PADRAO = 800
+MAX_CANDIDATOS_PADRAO = 10          # trechos pedidos à busca antes de empacotar
+QUEDA_RELEVANCIA_PADRAO = 0.5       # corta no primeiro trecho com menos da metade da relevância do anterior
+MAX_RESULTADOS_REFERENCIA = 3       # trechos enviados antes do empacotador (antigo "max_contexto_rag")
+
+# ═══════════════════════════════════════════════════════
+# ETAPAS
+# ═══════════════════════════════════════════════════════
+
+def _cortar_na_queda(resultados, queda_relevancia):
+    for i in range(1, len(resultados)):
+        if resultados[i][0] < resultados[i - 1][0] * queda_relevancia:
+            return resultados[:i]
+    return resultados
+
+
+def _remover_contidos(resultados):
+    """
+    Descarta trechos cujo texto já está num bloco mais bem colocado.
+    Um bloco que contém sentenças mais bem colocadas assume a posição da
+    melhor delas e as demais saem.
+    """
+    mantidos = []
+    for relevancia, registro in resultados:
+        texto = registro['texto']
+        if any(r['tipo'] == 'bloco' and texto in r['texto'] for _, r in mantidos):
+            continue
+        if registro['tipo'] == 'bloco':
+            contidos = [i for i, (_, r) in enumerate(mantidos) if r['texto'] in texto]
+            if contidos:
+                posicao = contidos[0]
+                relevancia = max(relevancia, mantidos[posicao][0])
+                mantidos = [item for i, item in enumerate(mantidos) if i not in contidos]
+                mantidos.insert(posicao, (relevancia, registro))
+                continue
+        mantidos.append((relevancia, registro))
+    return mantidos
+
+
+def _fundir_vizinhas(resultados):
+    """
+    Junta sentenças de registros consecutivos numa passagem (na posição da
+    mais relevante); só do mesmo bloco, para não colar textos de blocos ou
+    arquivos diferentes
+    """
+    passagens = []          # [relevância, [registros]]
+    por_id = {}             # id do registro -> passagem onde ele está
+    for relevancia, registro in resultados:
+        if registro['tipo'] != 'sentenca':
+            passagens.append([relevancia, [registro]])
+            continue
+        vizinhas = []
+        for vizinho in (registro['id'] - 1, registro['id'] + 1):
+            passagem = por_id.get(vizinho)
+            if (passagem is not None and passagem[1][0]['tipo'] == 'sentenca'
+                    and passagem[1][0]['bloco'] == registro['bloco'] and passagem not in vizinhas):
+                vizinhas.append(passagem)
+        if not vizinhas:
+            passagem = [relevancia, [registro]]
+            passagens.append(passagem)
+        else:
+            # Entra na primeira vizinha; se ligar duas passagens, a segunda é absorvida
+            passagem = vizinhas[0]
+            passagem[1].append(registro)
+            for outra in vizinhas[1:]:
+                passagem[0] = max(passagem[0], outra[0])
+                passagem[1].extend(outra[1])
+                for r in outra[1]:
+                    por_id[r['id']] = passagem
+                passagens = [p for p in passagens if p is not outra]
+        por_id[registro['id']] = passagem
+
+    return [(relevancia, _registro_passagem(registros)) for relevancia, registros in passagens]
+
+
+def _registro_passagem(registros):
+    if len(registros) == 1:
+        return registros[0]
+    registros = sorted(registros, key=lambda r: r['id'])
+    texto = '\n'.join(r['texto'] for r in registros)
+    return {
+        'id': registros[0]['id'],
+        'hash': hash_conteudo(texto),
+        'tipo': 'sentenca',
+        'bloco': registros[0]['bloco'],
+        'texto': texto,
+        'partes': registros,
+    }
+
+
+def hashes_trechos(trechos):
+    """Hashes dos registros da base usados no contexto (abrindo as passagens fundidas)"""
+    return [
+        parte['hash']
+        for _, registro in trechos
+        for parte in registro.get('partes', (registro,))
+    ]
+
+# ═══════════════════════════════════════════════════════
+# EMPACOTADOR
+# ═══════════════════════════════════════════════════════
+
+def empacotar_contexto(resultados, orcamento_tokens=ORCAMENTO_CONTEXTO_PADRAO,
+                       queda_relevancia=QUEDA_RELEVANCIA_PADRAO, modelo="gpt-4o",
+                       max_resultados_referencia=MAX_RESULTADOS_REFERENCIA):
+    """
+    Seleciona, de [(relevância, registro)] ordenado, o que vai para o prompt.
+    O trecho mais relevante sempre entra; os seguintes entram enquanto
+    couberem no orçamento (um trecho grande demais é pulado, não encerra).
+
+    Retorna (trechos, estatísticas); 'tokens_economizados' compara com enviar
+    os max_resultados_referencia primeiros candidatos como vieram da busca
+    (negativo quando o orçamento deixa passar mais que isso).
+    """
+    def custo(trecho):
+        return contar_tokens(formatar_contexto([trecho]), modelo)
+
+    tokens_antes = sum(custo(trecho) for trecho in resultados[:max_resultados_referencia])
+    passagens = _fundir_vizinhas(_remover_contidos(_cortar_na_queda(resultados, queda_relevancia)))
+
+    trechos = []
+    usados = 0
+    for passagem in passagens:
+        tokens = custo(passagem)
+        if trechos and usados + tokens > orcamento_tokens:
+            continue
+        trechos.append(passagem)
+        usados += tokens
+
+    estatisticas = {
+        "candidatos": len(resultados),
+        "trechos": len(trechos),
+        "tokens_antes": tokens_antes,
+        "tokens_depois": usados,
+        "tokens_economizados": tokens_antes - usados,
+    }
+    logger.info(
+        "Contexto: %d candidatos -> %d trechos, %d -> %d tokens (%d economizados)",
+        estatisticas["candidatos"], estatisticas["trechos"],
+        tokens_antes, usados, estatisticas["tokens_economizados"]
+    )
+    return trechos, estatisticas
@@ -0,0 +1,231 @@
+"""
+Janela de conversa limitada por tokens, com resumo contínuo em segundo plano
+
+Em vez de enviar todo o st.session_state["lista_mensagens"] a cada turno,
+o prompt leva:
+    system + resumo dos turnos antigos + últimos turnos (literais, dentro do orçamento)
+
+Os turnos que saem da janela são dobrados no resumo por uma thread de
+fundo; o turno atual não espera por isso. Enquanto o resumo não fica
+pronto, os turnos recém-saídos simplesmente não são enviados.
+
+A contagem de tokens usa o tiktoken se estiver instalado (e com o BPE
+disponível localmente); senão, uma estimativa por pedaços de palavra.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+ORCAMENTO_TOKENS_PADRAO = 2000
+TURNOS_RECENTES_PADRAO = 6
+RESUMO_MAX_TOKENS_PADRAO = 300
+MAX_CONTAGENS = 8192
+
+# Custo fixo de cada mensagem no formato de chat (papel, separadores)
+TOKENS_POR_MENSAGEM = 4
+TOKENS_RESPOSTA = 3
+
+PROMPT_RESUMO = (
+    "Resuma a conversa abaixo entre um usuário e um assistente de suporte em português, "
+    "em no máximo 8 linhas. Preserve nomes, números, decisões e problemas ainda em aberto. "
+    "Se houver um resumo anterior, incorpore-o."
+)
+
+# Uma thread basta: resumos são raros e pequenos
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resumo-conversa")
+
+# ═══════════════════════════════════════════════════════
+# CONTAGEM DE TOKENS
+# ═══════════════════════════════════════════════════════
+
+_PEDACOS = re.compile(r"\w+|[^\w\s]")
+
+# (hash do texto, modelo) -> tokens: a memória não prende o texto das mensagens
+_contagens = OrderedDict()
+_lock_contagens = threading.Lock()
+_aviso_tiktoken = threading.Event()
+
+
+@lru_cache(maxsize=8)
+def _codificador(modelo):
+    """Codificador do tiktoken para o modelo, ou None se não houver tokenizer local"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Sem rede e sem o BPE em cache: cai na estimativa (avisa uma vez, não por modelo)
+        if not _aviso_tiktoken.is_set():
+            _aviso_tiktoken.set()
+            logger.warning("tiktoken indisponível (%s); usando estimativa de tokens", e)
+        return None
+
+
+def _contar(texto, modelo):
+    codificador = _codificador(modelo)
+    if codificador is not None:
+        return len(codificador.encode(texto))
+    # Estimativa: cada palavra ou pontuação vale ~1 token, palavras longas valem mais
+    return sum(1 + len(pedaco) // 5 for pedaco in _PEDACOS.findall(texto))
+
+
+def contar_tokens(texto, modelo="gpt-4o"):
+    """Tokens de um texto (memorizado pelo hash do texto: o histórico é recontado a cada turno)"""
+    chave = (hashlib.blake2b(texto.encode('utf-8'), digest_size=16).digest(), modelo)
+    with _lock_contagens:
+        tokens = _contagens.get(chave)
+        if tokens is not None:
+            _contagens.move_to_end(chave)
+            return tokens
+    tokens = _contar(texto, modelo)
+    with _lock_contagens:
+        _contagens[chave] = tokens
+        while len(_contagens) > MAX_CONTAGENS:
+            _contagens.popitem(last=False)
+    return tokens
+
+
+def contar_tokens_mensagens(mensagens, modelo="gpt-4o"):
+    """Tokens de prompt de uma lista de mensagens no formato de chat"""
+    return TOKENS_RESPOSTA + sum(
+        TOKENS_POR_MENSAGEM + contar_tokens(m["content"], modelo) for m in mensagens
+    )
+
+# ═══════════════════════════════════════════════════════
+# RESUMO
+# ═══════════════════════════════════════════════════════
+
+def criar_resumidor(client, modelo, max_tokens=RESUMO_MAX_TOKENS_PADRAO, agendador=None, sessao=None):
+    """
+    Função (resumo_anterior, mensagens) -> novo resumo, usando o próprio modelo do chat
+    Com um agendador (agendador_llm.py), o resumo entra na mesma fila da sessão
+    """
+
+    def resumir(resumo_anterior, mensagens):
+        transcricao = "\n".join(f"{m['role']}: {m['content']}" for m in mensagens)
+        if resumo_anterior:
+            transcricao = f"Resumo anterior:\n{resumo_anterior}\n\nNovos turnos:\n{transcricao}"
+        parametros = {
+            "model": modelo,
+            "messages": [
+                {"role": "system", "content": PROMPT_RESUMO},
+                {"role": "user", "content": transcricao},
+            ],
+            "temperature": 0,
+            "max_tokens": max_tokens,
+        }
+        if agendador is not None:
+            resposta = agendador.criar(client, sessao=sessao, **parametros)
+        else:
+            resposta = client.chat.completions.create(**parametros)
+        return resposta.choices[0].message.content.strip()
+
+    return resumir
+
+# ═══════════════════════════════════════════════════════
+# GERENCIADOR DE HISTÓRICO
+# ═══════════════════════════════════════════════════════
+
+class GerenciadorHistorico:
+    """Monta o prompt de cada turno dentro do orçamento de tokens (um por sessão)"""
+
+    def __init__(self, orcamento_tokens=ORCAMENTO_TOKENS_PADRAO, turnos_recentes=TURNOS_RECENTES_PADRAO,
+                 modelo="gpt-4o", resumidor=None):
+        self.orcamento_tokens = orcamento_tokens
+        self.turnos_recentes = turnos_recentes
+        self.modelo = modelo
+        self.resumidor = resumidor
+
+        self.resumo = ""
+        self.resumidos_ate = 0          # mensagens [0, resumidos_ate) já estão no resumo
+        self.tokens_por_turno = []      # tokens de prompt enviados em cada turno
+        self._pendente = None           # Future do resumo em andamento
+        self._geracao = 0               # muda ao reiniciar: descarta resumos em voo
+        self._lock = threading.Lock()
+
+    def montar_mensagens(self, mensagens, prompt_sistema=None):
+        """
+        Mensagens a enviar neste turno: system, resumo e os turnos mais recentes
+        que cabem no orçamento (a última mensagem do usuário sempre vai)
+        """
+        if self.resumidos_ate > len(mensagens):
+            # O histórico foi limpo sem reiniciar o gerenciador
+            self.reiniciar()
+
+        with self._lock:
+            resumo = self.resumo
+            resumidos_ate = self.resumidos_ate
+
+        fixas = []
+        if prompt_sistema:
+            fixas.append({"role": "system", "content": prompt_sistema})
+        if resumo:
+            fixas.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{resumo}"})
+
+        disponivel = self.orcamento_tokens - contar_tokens_mensagens(fixas, self.modelo)
+        limite_mensagens = self.turnos_recentes * 2
+
+        # Anda do fim para o começo até estourar o orçamento ou o número de turnos
+        corte = len(mensagens)
+        while corte > resumidos_ate and len(mensagens) - corte < limite_mensagens:
+            custo = TOKENS_POR_MENSAGEM + contar_tokens(mensagens[corte - 1]["content"], self.modelo)
+            if custo > disponivel and corte < len(mensagens):
+                break
+            disponivel -= custo
+            corte -= 1
+
+        if corte > resumidos_ate:
+            self._agendar_resumo(mensagens[resumidos_ate:corte], corte)
+
+        enviadas = fixas + list(mensagens[corte:])
+        self.tokens_por_turno.append(contar_tokens_mensagens(enviadas, self.modelo))
+        return enviadas
+
+    @property
+    def tokens_ultimo_turno(self):
+        return self.tokens_por_turno[-1] if self.tokens_por_turno else 0
+
+    def reiniciar(self):
+        """Limpa o resumo (ex.: botão "Limpar Chat")"""
+        with self._lock:
+            self.resumo = ""
+            self.resumidos_ate = 0
+            self._pendente = None
+            self._geracao += 1
+        self.tokens_por_turno = []
+
+    def _agendar_resumo(self, mensagens_antigas, novo_limite):
+        if self.resumidor is None:
+            # Sem resumidor, os turnos antigos são apenas descartados
+            with self._lock:
+                self.resumidos_ate = novo_limite
+            return
+        with self._lock:
+            if self._pendente is not None and not self._pendente.done():
+                return
+            self._pendente = _executor.submit(
+                self._resumir, self._geracao, self.resumo, list(mensagens_antigas), novo_limite
+            )
+
+    def _resumir(self, geracao, resumo_anterior, mensagens_antigas, novo_limite):
+        try:
+            novo_resumo = self.resumidor(resumo_anterior, mensagens_antigas)
+        except Exception as e:
+            # Tenta de novo no próximo turno; a conversa segue sem o resumo novo
+            logger.warning("Falha ao resumir a conversa: %s", e)
+            return
+        with self._lock:
+            if geracao == self._geracao:
+                self.resumo = novo_resumo
+                self.resumidos_ate = novo_limite
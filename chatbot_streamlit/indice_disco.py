@@ -0,0 +1,474 @@
+"""
+Índice da base de conhecimento em disco, aberto via mmap
+
+O comando build-index compila a base num arquivo binário versionado com
+os trechos (offsets de texto), os postings do BM25 e, opcionalmente, a
+matriz de embeddings. O app abre o arquivo com mmap: nada é copiado para
+a memória do processo na abertura, e vários processos do servidor no mesmo
+host compartilham as mesmas páginas do page cache.
+
+Uso (dentro de chatbot_streamlit/):
+    python indice_disco.py build-index
+    python indice_disco.py build-index --base conhecimento/base_conhecimento.txt \\
+        --saida conhecimento/base_conhecimento.idx --embeddings tfidf
+
+Abrir o índice não percorre a base: os hashes dos trechos, as entradas do
+FAQ e o índice BM25 das perguntas também ficam no arquivo, e cada registro
+só é decodificado quando uma busca o devolve. Os pesos do BM25 (idf,
+normas) são float64, os mesmos da base em memória: as duas dão o mesmo
+ranking para a mesma consulta.
+
+Formato (little-endian):
+    MAGICO (8 bytes) | versão (u32) | tamanho do cabeçalho (u32) | cabeçalho JSON
+    seções alinhadas em 8 bytes, descritas no cabeçalho como [offset, dtype, quantidade]
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from rag_busca import montar_base, tokenizar_normalizado, limiar_por_tipo, entrada_faq
+from rag_vetorial import IndiceVetorial, criar_vetorizador
+
+MAGICO = b"RAGIDX\x00\x00"
+VERSAO_FORMATO = 4          # 2: blocos por entrada do FAQ; 3: hashes, FAQ e pesos BM25 em float64; 4: bloco de origem
+TIPOS_TRECHO = ("bloco", "sentenca")
+TAMANHO_PREVIA = 500
+
+# ═══════════════════════════════════════════════════════
+# ESCRITA
+# ═══════════════════════════════════════════════════════
+
+def _blob_com_offsets(textos):
+    """Concatena textos UTF-8 e devolve (blob, offsets u64 com len+1 posições)"""
+    codificados = [texto.encode('utf-8') for texto in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype='<u8')
+    np.cumsum([len(c) for c in codificados], out=offsets[1:])
+    return b"".join(codificados), offsets
+
+
+def _assinatura_fonte(caminho_fonte):
+    estado = os.stat(caminho_fonte)
+    return {"tamanho": estado.st_size, "mtime_ns": estado.st_mtime_ns}
+
+
+def _secoes_bm25(indice, prefixo=""):
+    """Vocabulário ordenado (busca binária direto no arquivo), idf, normas e postings de um IndiceBM25"""
+    termos = sorted(indice.postings)
+    termos_blob, termos_offsets = _blob_com_offsets(termos)
+    postings_inicio = np.zeros(len(termos) + 1, dtype='<u8')
+    np.cumsum([len(indice.postings[t]) for t in termos], out=postings_inicio[1:])
+    postings_docs = np.fromiter(
+        (doc_id for t in termos for doc_id, _ in indice.postings[t]), dtype='<u4', count=int(postings_inicio[-1])
+    )
+    postings_freq = np.fromiter(
+        (freq for t in termos for _, freq in indice.postings[t]), dtype='<u4', count=int(postings_inicio[-1])
+    )
+    # float64, como no IndiceBM25: relevâncias idênticas às da base em memória
+    secoes = {
+        "normas": np.asarray(indice.normas, dtype='<f8'),
+        "termos": termos_blob,
+        "termos_offsets": termos_offsets,
+        "idf": np.array([indice.idf[t] for t in termos], dtype='<f8'),
+        "postings_inicio": postings_inicio,
+        "postings_docs": postings_docs,
+        "postings_freq": postings_freq,
+    }
+    return {prefixo + nome: dados for nome, dados in secoes.items()}
+
+
+def _parametros_bm25(indice):
+    return {"k1": indice.k1, "b": indice.b, "idf_ausente": indice.idf_ausente}
+
+
+def gravar_indice(base, caminho_saida, fonte=None, config_embeddings=None):
+    """Serializa uma base de montar_base() no formato binário mapeável"""
+    registros = base['registros']
+    indice = base['indice']
+
+    textos_blob, textos_offsets = _blob_com_offsets([r['texto'] for r in registros])
+    normalizados_blob, normalizados_offsets = _blob_com_offsets([r['normalizado'] for r in registros])
+    # hash_conteudo() tem 16 dígitos hexadecimais: cabe num u64
+    hashes = np.array([int(r['hash'], 16) for r in registros], dtype='<u8')
+
+    secoes = {
+        "textos": textos_blob,
+        "textos_offsets": textos_offsets,
+        "normalizados": normalizados_blob,
+        "normalizados_offsets": normalizados_offsets,
+        "tipos": np.array([TIPOS_TRECHO.index(r['tipo']) for r in registros], dtype='u1'),
+        "blocos_origem": np.array([r['bloco'] for r in registros], dtype='<u4'),
+        "hashes": hashes,
+        "hashes_ordenados": np.sort(hashes),
+        **_secoes_bm25(indice),
+    }
+
+    cabecalho = {
+        "versao": VERSAO_FORMATO,
+        "fonte": fonte,
+        "total_registros": len(registros),
+        "total_blocos": len(base['blocos']),
+        "total_sentencas": len(base['sentencas']),
+        "previa": base['texto_completo'][:TAMANHO_PREVIA + 1],
+        "bm25": _parametros_bm25(indice),
+        "bm25_perguntas": None,
+        "embeddings": None,
+    }
+
+    if 'faq' in base:
+        # Só a posição do bloco de cada entrada: pergunta e resposta saem do texto do bloco
+        secoes["faq_blocos"] = np.array([e['bloco'] for e in base['faq']], dtype='<u4')
+        secoes.update(_secoes_bm25(base['indice_perguntas'], "perguntas_"))
+        cabecalho["bm25_perguntas"] = _parametros_bm25(base['indice_perguntas'])
+
+    if 'indice_vetorial' in base:
+        vetorizador = base['vetorizador']
+        secoes["vetores"] = base['indice_vetorial'].matriz.astype('<f4', copy=False)
+        if hasattr(vetorizador, 'idf'):
+            secoes["vetorizador_idf"] = np.asarray(vetorizador.idf, dtype='<f4')
+        cabecalho["embeddings"] = dict(config_embeddings or {"tipo": vetorizador.tipo})
+        cabecalho["dimensao"] = int(secoes["vetores"].shape[1])
+
+    # Offsets das seções são relativos ao início da área de dados (logo após o cabeçalho)
+    descricao = {}
+    posicao = 0
+    for nome, dados in secoes.items():
+        if isinstance(dados, bytes):
+            descricao[nome] = [posicao, "u1", len(dados)]
+            tamanho = len(dados)
+        else:
+            descricao[nome] = [posicao, dados.dtype.str, int(dados.size)]
+            tamanho = dados.nbytes
+        posicao = _alinhar(posicao + tamanho)
+    cabecalho["secoes"] = descricao
+    bruto = json.dumps(cabecalho, ensure_ascii=False).encode('utf-8')
+    inicio_dados = _alinhar(len(MAGICO) + 8 + len(bruto))
+
+    # Grava em arquivo temporário e troca atomicamente: leitores nunca veem um arquivo parcial
+    temporario = f"{caminho_saida}.tmp"
+    with open(temporario, 'wb') as f:
+        f.write(MAGICO + struct.pack('<II', VERSAO_FORMATO, len(bruto)) + bruto)
+        for nome, dados in secoes.items():
+            f.write(b"\x00" * (inicio_dados + descricao[nome][0] - f.tell()))
+            f.write(dados if isinstance(dados, bytes) else dados.tobytes())
+    os.replace(temporario, caminho_saida)
+
+
+def _alinhar(posicao, alinhamento=8):
+    return (posicao + alinhamento - 1) // alinhamento * alinhamento
+
+
+def construir_arquivo_indice(caminho_fonte, caminho_saida, config_embeddings=None):
+    """Lê a base .txt, monta os índices e grava o arquivo binário"""
+    with open(caminho_fonte, 'r', encoding='utf-8') as f:
+        conteudo = f.read()
+    vetorizador = criar_vetorizador(config_embeddings) if config_embeddings else None
+    base = montar_base(conteudo, vetorizador)
+    fonte = _assinatura_fonte(caminho_fonte)
+    fonte["sha256"] = hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+    gravar_indice(base, caminho_saida, fonte, config_embeddings)
+    return base
+
+# ═══════════════════════════════════════════════════════
+# LEITURA (MMAP)
+# ═══════════════════════════════════════════════════════
+
+class _TextosMapeados:
+    """Sequência de strings decodificadas sob demanda a partir do mmap"""
+
+    def __init__(self, arquivo, blob, offsets, inicio=0, fim=None):
+        self._arquivo = arquivo
+        self._blob = blob
+        self._offsets = offsets
+        self._inicio = inicio
+        self._fim = len(offsets) - 1 if fim is None else fim
+
+    def __len__(self):
+        return self._fim - self._inicio
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        i += self._inicio
+        return self._arquivo.ler_texto(self._blob, int(self._offsets[i]), int(self._offsets[i + 1]))
+
+
+class _RegistroMapeado(dict):
+    """Registro lido do arquivo; 'tokens' só é calculado se alguém pedir"""
+
+    def __missing__(self, chave):
+        if chave != 'tokens':
+            raise KeyError(chave)
+        tokens = self['tokens'] = tokenizar_normalizado(self['normalizado'])
+        return tokens
+
+
+def _hash_texto(valor):
+    return f"{int(valor):016x}"
+
+
+class _RegistrosMapeados:
+    """Registros com as mesmas chaves de criar_registro(), montados sob demanda"""
+
+    def __init__(self, arquivo):
+        self._textos = _TextosMapeados(arquivo, "textos", arquivo.secao("textos_offsets"))
+        self._normalizados = _TextosMapeados(arquivo, "normalizados", arquivo.secao("normalizados_offsets"))
+        self._tipos = arquivo.secao("tipos")
+        self._blocos_origem = arquivo.secao("blocos_origem")
+        self._hashes = arquivo.secao("hashes")
+
+    def __len__(self):
+        return len(self._textos)
+
+    def __getitem__(self, i):
+        return _RegistroMapeado(
+            id=i,
+            hash=_hash_texto(self._hashes[i]),
+            tipo=TIPOS_TRECHO[self._tipos[i]],
+            bloco=int(self._blocos_origem[i]),
+            texto=self._textos[i],
+            normalizado=self._normalizados[i],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _HashesMapeados:
+    """Conjunto dos hashes dos trechos (só 'in', 'len' e iteração): busca binária na seção ordenada"""
+
+    def __init__(self, arquivo):
+        self._ordenados = arquivo.secao("hashes_ordenados")
+
+    def __len__(self):
+        return len(self._ordenados)
+
+    def __contains__(self, hash_trecho):
+        try:
+            valor = np.uint64(int(hash_trecho, 16))
+        except (TypeError, ValueError, OverflowError):
+            return False
+        posicao = int(np.searchsorted(self._ordenados, valor))
+        return posicao < len(self._ordenados) and self._ordenados[posicao] == valor
+
+    def __iter__(self):
+        return (_hash_texto(valor) for valor in self._ordenados)
+
+
+class _EntradasFaqMapeadas:
+    """Entradas do FAQ montadas sob demanda a partir do texto do bloco de cada uma"""
+
+    def __init__(self, arquivo, blocos):
+        self._blocos = blocos
+        self._posicoes = arquivo.secao("faq_blocos")
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        posicao = int(self._posicoes[i])
+        return entrada_faq(self._blocos[posicao], posicao)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class IndiceBM25Mapeado:
+    """Mesma interface de IndiceBM25.pontuar, lendo vocabulário e postings do mmap"""
+
+    def __init__(self, arquivo, prefixo="", chave_parametros="bm25"):
+        parametros = arquivo.cabecalho[chave_parametros]
+        self.k1 = parametros["k1"]
+        self.b = parametros["b"]
+        self.idf_ausente = parametros["idf_ausente"]
+        self.termos = _TextosMapeados(arquivo, prefixo + "termos", arquivo.secao(prefixo + "termos_offsets"))
+        self.idf = arquivo.secao(prefixo + "idf")
+        self.normas = arquivo.secao(prefixo + "normas")
+        self.postings_inicio = arquivo.secao(prefixo + "postings_inicio")
+        self.postings_docs = arquivo.secao(prefixo + "postings_docs")
+        self.postings_freq = arquivo.secao(prefixo + "postings_freq")
+
+    def _posicao_termo(self, termo):
+        posicao = bisect.bisect_left(self.termos, termo)
+        if posicao < len(self.termos) and self.termos[posicao] == termo:
+            return posicao
+        return None
+
+    def pontuar(self, tokens_consulta):
+        """Retorna {doc_id: relevância}; custo proporcional aos postings dos termos"""
+        termos = set(tokens_consulta)
+        if not termos:
+            return {}
+
+        k1_mais_1 = self.k1 + 1
+        maximo_teorico = 0.0
+        documentos, contribuicoes = [], []
+        for termo in termos:
+            posicao = self._posicao_termo(termo)
+            if posicao is None:
+                maximo_teorico += self.idf_ausente * k1_mais_1
+                continue
+            idf = float(self.idf[posicao])
+            maximo_teorico += idf * k1_mais_1
+            inicio, fim = self.postings_inicio[posicao], self.postings_inicio[posicao + 1]
+            docs = self.postings_docs[inicio:fim]
+            freq = self.postings_freq[inicio:fim].astype(np.float64)
+            documentos.append(docs)
+            contribuicoes.append(idf * freq * k1_mais_1 / (freq + self.normas[docs]))
+
+        if not documentos:
+            return {}
+
+        # Soma as contribuições por documento só sobre os postings tocados
+        unicos, inverso = np.unique(np.concatenate(documentos), return_inverse=True)
+        somas = np.bincount(inverso, weights=np.concatenate(contribuicoes))
+        return dict(zip(unicos.tolist(), (somas / maximo_teorico).tolist()))
+
+
+class ArquivoIndice:
+    """Arquivo de índice mapeado em memória (somente leitura)"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with open(caminho, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGICO)] != MAGICO:
+            raise ValueError(f"{caminho} não é um índice da base de conhecimento")
+        versao, tamanho = struct.unpack_from('<II', self._mmap, len(MAGICO))
+        if versao != VERSAO_FORMATO:
+            raise ValueError(f"Versão de índice {versao} incompatível (esperada {VERSAO_FORMATO})")
+        inicio = len(MAGICO) + 8
+        self.cabecalho = json.loads(self._mmap[inicio:inicio + tamanho].decode('utf-8'))
+        self._inicio_dados = _alinhar(inicio + tamanho)
+
+    def tem_secao(self, nome):
+        return nome in self.cabecalho["secoes"]
+
+    def secao(self, nome):
+        """Array NumPy apontando direto para o mmap (sem cópia)"""
+        offset, dtype, quantidade = self.cabecalho["secoes"][nome]
+        return np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=quantidade, offset=self._inicio_dados + offset)
+
+    def ler_texto(self, nome, inicio, fim):
+        offset = self._inicio_dados + self.cabecalho["secoes"][nome][0]
+        return self._mmap[offset + inicio:offset + fim].decode('utf-8')
+
+
+def abrir_indice(caminho_indice, cliente=None):
+    """
+    Abre o arquivo de índice e devolve uma base com as mesmas chaves de
+    montar_base(); textos e postings são lidos do mmap sob demanda
+    cliente: cliente OpenAI compartilhado, para os embeddings das consultas
+    """
+    arquivo = ArquivoIndice(caminho_indice)
+    cabecalho = arquivo.cabecalho
+    registros = _RegistrosMapeados(arquivo)
+    total_blocos = cabecalho["total_blocos"]
+
+    base = {
+        'versao': (cabecalho.get("fonte") or {}).get("sha256", "")[:16],
+        # Os blocos são sempre os primeiros registros
+        'blocos': _TextosMapeados(arquivo, "textos", arquivo.secao("textos_offsets"), 0, total_blocos),
+        'sentencas': _TextosMapeados(arquivo, "textos", arquivo.secao("textos_offsets"), total_blocos),
+        # Apenas o início do texto: o integral não é carregado para a memória
+        'texto_completo': cabecalho["previa"],
+        'registros': registros,
+        'hashes': _HashesMapeados(arquivo),
+        'indice': IndiceBM25Mapeado(arquivo),
+        'arquivo_indice': arquivo,
+    }
+
+    if cabecalho.get("bm25_perguntas"):
+        base['faq'] = _EntradasFaqMapeadas(arquivo, base['blocos'])
+        base['indice_perguntas'] = IndiceBM25Mapeado(arquivo, "perguntas_", "bm25_perguntas")
+
+    if arquivo.tem_secao("vetores"):
+        vetorizador = criar_vetorizador(cabecalho["embeddings"], cliente)
+        if arquivo.tem_secao("vetorizador_idf"):
+            vetorizador.idf = arquivo.secao("vetorizador_idf")
+        matriz = arquivo.secao("vetores").reshape(len(registros), cabecalho["dimensao"])
+        limiares = np.array([limiar_por_tipo(tipo) for tipo in TIPOS_TRECHO])[arquivo.secao("tipos")]
+        base['vetorizador'] = vetorizador
+        base['indice_vetorial'] = IndiceVetorial(matriz, limiares)
+
+    return base
+
+
+def abrir_indice_se_atual(caminho_indice, caminho_fonte, config_embeddings=None, cliente=None):
+    """
+    Abre o índice apenas se ele corresponde à base .txt atual (tamanho e mtime)
+    e aos embeddings configurados; caso contrário devolve None
+    """
+    if not caminho_indice or not os.path.exists(caminho_indice):
+        return None
+    try:
+        base = abrir_indice(caminho_indice, cliente)
+    except (OSError, ValueError):
+        return None
+
+    cabecalho = base['arquivo_indice'].cabecalho
+    fonte = cabecalho.get("fonte") or {}
+    if os.path.exists(caminho_fonte):
+        atual = _assinatura_fonte(caminho_fonte)
+        if (fonte.get("tamanho"), fonte.get("mtime_ns")) != (atual["tamanho"], atual["mtime_ns"]):
+            return None
+    if (config_embeddings or None) != cabecalho.get("embeddings"):
+        return None
+    return base
+
+# ═══════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════
+
+def _carregar_config_embeddings(caminho_config):
+    if not os.path.exists(caminho_config):
+        return None
+    with open(caminho_config, 'r', encoding='utf-8') as f:
+        return json.load(f).get("embeddings")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice em disco da base de conhecimento do RAG")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    build = comandos.add_parser("build-index", help="Compila a base .txt num índice binário mapeável")
+    build.add_argument("--base", default="conhecimento/base_conhecimento.txt")
+    build.add_argument("--saida", default="conhecimento/base_conhecimento.idx")
+    build.add_argument("--config", default="config/bot_config.json",
+                       help="Arquivo de onde vem a chave 'embeddings'")
+    build.add_argument("--embeddings", choices=["nenhum", "hashing", "tfidf", "openai"],
+                       help="Sobrescreve o vetorizador do config ('nenhum' = sem vetores)")
+
+    args = parser.parse_args(argv)
+
+    config_embeddings = _carregar_config_embeddings(args.config)
+    if args.embeddings == "nenhum":
+        config_embeddings = None
+    elif args.embeddings:
+        config_embeddings = {"tipo": args.embeddings}
+
+    base = construir_arquivo_indice(args.base, args.saida, config_embeddings)
+    tamanho = os.path.getsize(args.saida)
+    print(f"✅ Índice gravado em {args.saida} ({tamanho / 1024:.1f} KB)")
+    print(f"   {len(base['registros'])} trechos, {len(base['indice'].postings)} termos"
+          + (f", vetores {base['indice_vetorial'].matriz.shape}" if 'indice_vetorial' in base else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+Ingestão em streaming de um diretório de documentos (.txt, .md, .csv)
+
+Cada arquivo é lido linha a linha (linhas longas em pedaços limitados) e
+transformado em trechos à medida que é lido; nenhum arquivo é carregado
+inteiro. Diretórios grandes são lidos em paralelo por processos
+trabalhadores (forkserver/spawn), cada um com uma fila limitada de lotes:
+se quem consome for mais lento, os trabalhadores esperam. Os trechos saem
+na ordem dos arquivos, e a memória de pico da ingestão fica em
+processos x fila x lote x tamanho do trecho, independente do corpus.
+Já a base montada por montar_base_de_diretorio fica inteira em memória.
+
+Cada trecho é um dicionário:
+    {'fonte': caminho relativo, 'offset': byte inicial, 'tamanho': bytes,
+     'linha': primeira linha, 'texto': conteúdo}
+
+Uso:
+    for trecho in ingerir_diretorio("conhecimento/", processos=4):
+        ...
+    base = montar_base_de_diretorio("conhecimento/", vetorizador)
+"""
+import codecs
+import csv
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+
+from rag_busca import montar_base_de_blocos, numero_cabecalho_faq
+
+logger = logging.getLogger(__name__)
+
+EXTENSOES = (".txt", ".md", ".csv")
+TAMANHO_MAXIMO_TRECHO = 2000        # caracteres
+TAMANHO_MAXIMO_LINHA = 64 * 1024    # bytes lidos por vez (linhas enormes viram pedaços)
+TAMANHO_LOTE = 64                   # trechos por mensagem entre processos
+LOTES_POR_FILA = 4                  # lotes à espera por trabalhador
+MINIMO_BYTES_PARALELO = 8 * 2**20   # abaixo disso a ingestão roda na própria thread
+TAMANHO_PREVIA = 500
+
+# ═══════════════════════════════════════════════════════
+# LEITURA EM STREAMING
+# ═══════════════════════════════════════════════════════
+
+def listar_arquivos(diretorio, extensoes=EXTENSOES):
+    """Caminhos dos documentos do diretório (recursivo, em ordem estável)"""
+    with os.scandir(diretorio) as entradas:
+        entradas = sorted(entradas, key=lambda e: e.name)
+    for entrada in entradas:
+        if entrada.name.startswith('.'):
+            continue
+        if entrada.is_dir():
+            yield from listar_arquivos(entrada.path, extensoes)
+        elif entrada.name.lower().endswith(extensoes):
+            yield entrada.path
+
+
+def _linhas(caminho):
+    """Gera (offset em bytes, tamanho em bytes, número da linha, texto) sem ler o arquivo inteiro"""
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    offset = 0
+    numero = 1
+    with open(caminho, 'rb') as f:
+        for bruto in iter(lambda: f.readline(TAMANHO_MAXIMO_LINHA), b''):
+            yield offset, len(bruto), numero, decodificador.decode(bruto)
+            offset += len(bruto)
+            if bruto.endswith(b'\n'):
+                numero += 1
+
+
+def _novo_trecho(fonte, offset, linha, texto, fim):
+    return {'fonte': fonte, 'offset': offset, 'tamanho': fim - offset, 'linha': linha, 'texto': texto}
+
+
+def _dividir(texto, tamanho_maximo):
+    """Quebra um texto longo em pedaços de até tamanho_maximo (preferindo espaços)"""
+    while len(texto) > tamanho_maximo:
+        corte = texto.rfind(' ', 0, tamanho_maximo)
+        if corte <= 0:
+            corte = tamanho_maximo
+        yield texto[:corte].strip()
+        texto = texto[corte:]
+    if texto.strip():
+        yield texto.strip()
+
+
+def _parece_faq(caminho):
+    """O arquivo é um FAQ numerado para dividir_faq (dois cabeçalhos em sequência)? Para no segundo"""
+    ultimo_numero = 0
+    for _, _, _, linha in _linhas(caminho):
+        numero = numero_cabecalho_faq(linha, ultimo_numero)
+        if numero is not None:
+            if numero >= 2:
+                return True
+            ultimo_numero = numero
+    return False
+
+
+def trechos_texto(caminho, fonte=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO):
+    """
+    Parágrafos (separados por linha em branco) de um .txt/.md, como em montar_base.
+    Em Markdown, um título também começa um novo trecho.
+    Se o arquivo for um FAQ numerado, um trecho por entrada, como em dividir_faq
+    (cabeçalho + resposta, mesmo com linhas em branco no meio): uma primeira
+    leitura, também em streaming, só procura os cabeçalhos.
+    """
+    fonte = fonte or caminho
+    markdown = caminho.lower().endswith('.md')
+    faq = _parece_faq(caminho)
+    ultimo_numero = 0
+    linhas = []
+    inicio = linha_inicio = fim = 0
+    tamanho = 0
+
+    def emitir():
+        texto = '\n'.join(l.strip() for l in linhas) if faq else ''.join(linhas).strip()
+        for pedaco in _dividir(texto, tamanho_maximo):
+            yield _novo_trecho(fonte, inicio, linha_inicio, pedaco, fim)
+
+    for offset, tamanho_bruto, numero, linha in _linhas(caminho):
+        vazia = not linha.strip()
+        titulo = markdown and linha.startswith('#')
+        if faq:
+            # No FAQ a linha em branco não separa: a entrada vai até o próximo cabeçalho
+            numero_faq = numero_cabecalho_faq(linha, ultimo_numero)
+            if numero_faq is not None:
+                ultimo_numero = numero_faq
+            separa = numero_faq is not None or titulo
+        else:
+            separa = vazia or titulo
+        if linhas and (separa or tamanho + len(linha) > tamanho_maximo):
+            yield from emitir()
+            linhas, tamanho = [], 0
+        if vazia:
+            continue
+        if not linhas:
+            inicio, linha_inicio = offset, numero
+        linhas.append(linha)
+        tamanho += len(linha)
+        fim = offset + tamanho_bruto
+    if linhas:
+        yield from emitir()
+
+
+def trechos_csv(caminho, fonte=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO):
+    """Uma linha do CSV por trecho, no formato 'coluna: valor | coluna: valor'"""
+    fonte = fonte or caminho
+    posicao = {'linha': 1, 'fim': 0}
+
+    def linhas():
+        for offset, tamanho_bruto, _, linha in _linhas(caminho):
+            posicao['fim'] = offset + tamanho_bruto
+            yield linha
+
+    leitor = csv.reader(linhas())
+    cabecalho = None
+    while True:
+        inicio, linha_inicio = posicao['fim'], posicao['linha']
+        try:
+            campos = next(leitor)
+        except StopIteration:
+            return
+        posicao['linha'] = leitor.line_num + 1
+        if cabecalho is None:
+            cabecalho = [c.strip() for c in campos]
+            continue
+        partes = [
+            f"{cabecalho[i] if i < len(cabecalho) else i}: {valor.strip()}"
+            for i, valor in enumerate(campos) if valor.strip()
+        ]
+        for pedaco in _dividir(' | '.join(partes), tamanho_maximo):
+            yield _novo_trecho(fonte, inicio, linha_inicio, pedaco, posicao['fim'])
+
+
+def trechos_arquivo(caminho, fonte=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO):
+    if caminho.lower().endswith('.csv'):
+        return trechos_csv(caminho, fonte, tamanho_maximo)
+    return trechos_texto(caminho, fonte, tamanho_maximo)
+
+# ═══════════════════════════════════════════════════════
+# PROCESSOS TRABALHADORES
+# ═══════════════════════════════════════════════════════
+
+def _trabalhador(tarefas, fila):
+    """
+    Roda no processo filho: lê os arquivos recebidos, em ordem, e envia os
+    trechos de cada um em lotes pela sua própria fila, seguidos de ('fim', fonte).
+    A fila é limitada: se o consumidor estiver em outro arquivo, o filho espera.
+    """
+    for caminho, fonte, tamanho_maximo in tarefas:
+        lote = []
+        try:
+            for trecho in trechos_arquivo(caminho, fonte, tamanho_maximo):
+                lote.append(trecho)
+                if len(lote) >= TAMANHO_LOTE:
+                    fila.put(('lote', lote))
+                    lote = []
+            if lote:
+                fila.put(('lote', lote))
+        except Exception as e:
+            fila.put(('erro', fonte, str(e)))
+        fila.put(('fim', fonte))
+
+
+def _contexto_processos():
+    """
+    forkserver onde existir, senão spawn: o chamador costuma ser a thread do
+    observador num servidor com outras threads (logging, sqlite, httpx), e um
+    fork() nesse estado pode herdar um lock preso. Os filhos importam
+    _trabalhador deste módulo; o __main__ (CLI do streamlit, api_rag,
+    responder_lote) precisa do guarda if __name__ == "__main__", que já tem.
+    """
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+def _ler_em_linha(tarefas):
+    for caminho, fonte, tamanho in tarefas:
+        try:
+            yield from trechos_arquivo(caminho, fonte, tamanho)
+        except Exception as e:
+            logger.warning("Falha ao ler %s: %s", fonte, e)
+
+
+def ingerir_diretorio(diretorio, processos=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO, extensoes=EXTENSOES,
+                      minimo_bytes_paralelo=MINIMO_BYTES_PARALELO):
+    """Gera os trechos de todos os documentos do diretório (ver ingerir_arquivos)"""
+    return ingerir_arquivos(diretorio, listar_arquivos(diretorio, extensoes), processos, tamanho_maximo,
+                            minimo_bytes_paralelo)
+
+
+def ingerir_arquivos(diretorio, caminhos, processos=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO,
+                     minimo_bytes_paralelo=MINIMO_BYTES_PARALELO):
+    """
+    Gera os trechos dos arquivos (caminhos sob o diretório), na ordem
+    recebida e, dentro de cada um, na ordem do texto.
+    processos <= 1, ou arquivos somando menos de minimo_bytes_paralelo,
+    processa tudo na própria thread.
+
+    Com processos, o arquivo i vai para o trabalhador i % processos, cada
+    trabalhador tem a sua fila limitada e o consumidor lê as filas na ordem
+    dos arquivos: a memória de pico fica em processos x fila x lote, e a
+    saída já sai ordenada.
+    """
+    tarefas = [
+        (caminho, os.path.relpath(caminho, diretorio), tamanho_maximo)
+        for caminho in caminhos
+    ]
+    if processos is None:
+        processos = min(len(tarefas), os.cpu_count() or 1)
+    processos = min(processos, len(tarefas))
+    if processos > 1 and sum(os.path.getsize(caminho) for caminho, _, _ in tarefas) < minimo_bytes_paralelo:
+        # Corpus pequeno: subir processos custa mais do que ler
+        processos = 1
+
+    if processos <= 1:
+        yield from _ler_em_linha(tarefas)
+        return
+
+    contexto = _contexto_processos()
+    filas = [contexto.Queue(maxsize=LOTES_POR_FILA) for _ in range(processos)]
+    trabalhadores = [
+        contexto.Process(target=_trabalhador, args=(tarefas[k::processos], filas[k]), daemon=True)
+        for k in range(processos)
+    ]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    try:
+        for i in range(len(tarefas)):
+            fila, trabalhador = filas[i % processos], trabalhadores[i % processos]
+            while True:
+                try:
+                    mensagem = fila.get(timeout=1)
+                except queue.Empty:
+                    if not trabalhador.is_alive() and fila.empty():
+                        raise RuntimeError(f"Processo de ingestão terminou com código {trabalhador.exitcode}")
+                    continue
+                if mensagem[0] == 'lote':
+                    yield from mensagem[1]
+                elif mensagem[0] == 'erro':
+                    logger.warning("Falha ao ler %s: %s", mensagem[1], mensagem[2])
+                else:
+                    break
+    finally:
+        # Também encerra os trabalhadores se o consumidor parar no meio
+        for trabalhador in trabalhadores:
+            if trabalhador.is_alive():
+                trabalhador.terminate()
+            trabalhador.join()
+        for fila in filas:
+            fila.cancel_join_thread()
+            fila.close()
+
+# ═══════════════════════════════════════════════════════
+# BASE A PARTIR DE UM DIRETÓRIO
+# ═══════════════════════════════════════════════════════
+
+def _estado_arquivo(caminho):
+    estado = os.stat(caminho)
+    return estado.st_mtime_ns, estado.st_size
+
+
+def _blocos_reaproveitaveis(base_anterior, arquivos, tamanho_maximo):
+    """
+    fonte -> registros de bloco da base anterior, para cada arquivo com o
+    mesmo (mtime, tamanho) de quando ela foi montada (e o mesmo tamanho de trecho)
+    """
+    if not base_anterior or base_anterior.get('tamanho_maximo_trecho') != tamanho_maximo:
+        return {}
+    anteriores = base_anterior.get('arquivos', {})
+    iguais = {fonte for fonte, estado in arquivos.items() if anteriores.get(fonte) == estado}
+    blocos = {fonte: [] for fonte in iguais}   # arquivo sem trechos também conta
+    for registro in base_anterior['registros']:
+        if registro['tipo'] == 'bloco' and registro.get('fonte') in iguais:
+            blocos[registro['fonte']].append(registro)
+    return blocos
+
+
+def montar_base_de_diretorio(diretorio, vetorizador=None, processos=None, tamanho_maximo=TAMANHO_MAXIMO_TRECHO,
+                             base_anterior=None):
+    """
+    Mesma estrutura de montar_base, mas a partir dos trechos ingeridos, que
+    já chegam em ordem (fonte, offset): nada é reordenado nem guardado além
+    do texto e dos metadados de cada bloco.
+    Com base_anterior (recarga pelo observador), os arquivos com o mesmo
+    (mtime, tamanho) reaproveitam os blocos dela e só os demais são lidos;
+    os índices são refeitos sobre o conjunto, como numa montagem do zero.
+    O texto completo não é guardado: 'texto_completo' traz só uma prévia.
+    Só a leitura tem memória limitada: a base montada (blocos, registros,
+    BM25 e vetores) fica inteira em memória e cresce com o corpus.
+    Arquivos .txt/.md em formato de FAQ saem um bloco por entrada
+    (trechos_texto), e o índice de perguntas (indexar_perguntas) é montado
+    sobre os blocos de todos os arquivos.
+    """
+    # (mtime, tamanho) lidos antes do conteúdo: se o arquivo mudar durante a
+    # leitura, a próxima recarga o lê de novo
+    fontes = [(caminho, os.path.relpath(caminho, diretorio)) for caminho in listar_arquivos(diretorio)]
+    arquivos = {fonte: _estado_arquivo(caminho) for caminho, fonte in fontes}
+    reaproveitados = _blocos_reaproveitaveis(base_anterior, arquivos, tamanho_maximo)
+    if base_anterior is not None:
+        logger.info("Ingestão incremental: %d de %d arquivos lidos de novo",
+                    len(fontes) - len(reaproveitados), len(fontes))
+    novos = ingerir_arquivos(
+        diretorio, [caminho for caminho, fonte in fontes if fonte not in reaproveitados], processos, tamanho_maximo
+    )
+
+    # Versão: hash incremental de fonte + conteúdo de cada trecho
+    resumo = hashlib.sha256()
+    blocos = []
+    metadados = []
+    previa = []
+    tamanho_previa = 0
+
+    def acrescentar(trecho):
+        nonlocal tamanho_previa
+        resumo.update(trecho['fonte'].encode('utf-8'))
+        resumo.update(trecho['texto'].encode('utf-8'))
+        if tamanho_previa < TAMANHO_PREVIA:
+            previa.append(trecho['texto'])
+            tamanho_previa += len(trecho['texto'])
+        blocos.append(trecho['texto'])
+        metadados.append({'fonte': trecho['fonte'], 'offset': trecho['offset'], 'linha': trecho['linha']})
+
+    # Os arquivos lidos de novo saem na mesma ordem de 'fontes': intercala com os reaproveitados
+    proximo = next(novos, None)
+    for _, fonte in fontes:
+        if fonte in reaproveitados:
+            for registro in reaproveitados[fonte]:
+                acrescentar(registro)
+            continue
+        while proximo is not None and proximo['fonte'] == fonte:
+            acrescentar(proximo)
+            proximo = next(novos, None)
+
+    base = montar_base_de_blocos(
+        blocos,
+        vetorizador,
+        versao=resumo.hexdigest()[:16],
+        texto_completo='\n\n'.join(previa)[:TAMANHO_PREVIA],
+        metadados=metadados,
+    )
+    base['arquivos'] = arquivos
+    base['tamanho_maximo_trecho'] = tamanho_maximo
+    return base
@@ -0,0 +1,342 @@
+"""
+Métricas por etapa do turno: latência, tokens e relevância
+
+Spans em volta das etapas de um turno (carregar a base, buscar o contexto,
+montar a resposta RAG, a chamada ao chat.completions, renderizar o
+histórico) alimentam histogramas acumulados no processo. Cada resposta do
+modelo registra também o resposta.usage (tokens de prompt, de completion e
+em cache), o modelo e os escores de relevância dos trechos enviados. A
+fração do prompt servida pelo cache de prefixo da OpenAI
+(prompt_tokens_details.cached_tokens / prompt_tokens) tem histograma próprio:
+é ela que confirma que o prefixo fixo (motor_rag.montar_mensagens) está
+sendo reaproveitado em produção.
+
+Saídas:
+    - GET /metrics num servidor HTTP local, no formato texto do Prometheus
+    - opcionalmente, um evento por linha num arquivo JSON lines
+
+Desligado, etapa() devolve sempre o mesmo nullcontext e os registros
+retornam na primeira linha: nenhum relógio é lido, nada é alocado.
+
+Uso:
+    metricas = Metricas(ativo=True, arquivo_jsonl="cache/metricas.jsonl")
+    metricas.iniciar_servidor(porta=9464)
+    with metricas.etapa("buscar_contexto_relevante"):
+        ...
+    metricas.registrar_resposta(modelo, resposta.usage, escores)
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PORTA_PADRAO = 9464
+
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LIMITES_TOKENS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+LIMITES_RELEVANCIA = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+LIMITES_FRACAO = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+DESCRICOES = {
+    "chatbot_etapa_segundos": "Duração de cada etapa do turno",
+    "chatbot_primeiro_token_segundos": "Tempo até o primeiro token da resposta",
+    "chatbot_tokens": "Tokens por resposta do modelo (resposta.usage; cached = prefixo do prompt em cache)",
+    "chatbot_prompt_cache_fracao": "Fração dos tokens do prompt servida pelo cache de prefixo da OpenAI",
+    "chatbot_relevancia_melhor": "Relevância do melhor trecho enviado no contexto",
+    "chatbot_relevancia_trecho": "Relevância de cada trecho enviado no contexto",
+    "chatbot_respostas_total": "Respostas entregues, por origem (api ou cache)",
+    "chatbot_fila_espera_segundos": "Espera na fila do agendador até a chamada ao modelo sair",
+    "chatbot_novas_tentativas_total": "Novas tentativas de chamadas ao modelo, por motivo (limite, status, conexao)",
+    "chatbot_fila_pedidos": "Pedidos esperando a vez na fila do agendador",
+    "chatbot_llm_em_andamento": "Chamadas ao modelo em andamento no processo",
+    "chatbot_roteamento_total": "Turnos no modo automático, por nível da cascata e motivo da escolha",
+    "chatbot_roteamento_segundos": "Latência da chamada ao modelo por nível da cascata (rapido, completo)",
+}
+
+_DESLIGADO = nullcontext()
+
+
+class Histograma:
+    """Contagens cumulativas por limite superior (le), como no Prometheus"""
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)     # último = +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class _Etapa:
+    """Span de uma etapa: mede do __enter__ ao __exit__, mesmo se der exceção"""
+
+    __slots__ = ("metricas", "nome", "rotulos", "inicio")
+
+    def __init__(self, metricas, nome, rotulos):
+        self.metricas = metricas
+        self.nome = nome
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_excecao, excecao, rastreamento):
+        self.metricas.observar_etapa(
+            self.nome, time.perf_counter() - self.inicio, erro=tipo_excecao is not None, **self.rotulos
+        )
+        return False
+
+
+def _campo(objeto, nome):
+    """Lê um campo do usage tanto do objeto do SDK quanto de um dict"""
+    if objeto is None:
+        return None
+    if isinstance(objeto, dict):
+        return objeto.get(nome)
+    return getattr(objeto, nome, None)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+# ═══════════════════════════════════════════════════════
+# REGISTRO
+# ═══════════════════════════════════════════════════════
+
+class Metricas:
+    """Histogramas e contadores do processo (compartilhados por todas as sessões)"""
+
+    def __init__(self, ativo=False, arquivo_jsonl=None):
+        self.ativo = ativo
+        self.servidor = None
+        self._lock = threading.Lock()
+        self._histogramas = {}      # (nome, rótulos) -> Histograma
+        self._contadores = {}       # (nome, rótulos) -> valor
+        self._medidores = {}        # nome -> função lida na exportação
+        self._arquivo = None
+
+        if ativo and arquivo_jsonl:
+            Path(arquivo_jsonl).parent.mkdir(parents=True, exist_ok=True)
+            self._arquivo = open(arquivo_jsonl, 'a', encoding='utf-8', buffering=1)
+
+    # ───────────────────────────────────────────────────
+    # Spans e observações
+    # ───────────────────────────────────────────────────
+
+    def etapa(self, nome, **rotulos):
+        """Context manager que mede a etapa; desligado, não custa nada além da chamada"""
+        if not self.ativo:
+            return _DESLIGADO
+        return _Etapa(self, nome, rotulos)
+
+    def observar_etapa(self, nome, segundos, erro=False, **rotulos):
+        """Duração já medida por fora (ex.: MedicaoTurno do streaming)"""
+        if not self.ativo or segundos is None:
+            return
+        self._observar("chatbot_etapa_segundos", segundos, LIMITES_SEGUNDOS, etapa=nome, **rotulos)
+        self._gravar({"evento": "etapa", "etapa": nome, "segundos": round(segundos, 6), "erro": erro, **rotulos})
+
+    def registrar_resposta(self, modelo, uso=None, escores=(), tempo_primeiro_token=None, origem="api"):
+        """
+        Uma resposta entregue ao usuário: usage (objeto do SDK ou dict),
+        escores de relevância dos trechos do contexto e TTFT
+        """
+        if not self.ativo:
+            return
+        escores = [float(escore) for escore in escores]
+        tokens = {
+            "prompt": _campo(uso, "prompt_tokens"),
+            "completion": _campo(uso, "completion_tokens"),
+            "cached": _campo(_campo(uso, "prompt_tokens_details"), "cached_tokens"),
+        }
+        if uso is not None and tokens["cached"] is None:
+            tokens["cached"] = 0
+        fracao_cache = tokens["cached"] / tokens["prompt"] if tokens["prompt"] else None
+
+        self._incrementar("chatbot_respostas_total", origem=origem, modelo=modelo)
+        for tipo, quantidade in tokens.items():
+            if quantidade is not None:
+                self._observar("chatbot_tokens", quantidade, LIMITES_TOKENS, tipo=tipo, modelo=modelo)
+        if fracao_cache is not None:
+            self._observar("chatbot_prompt_cache_fracao", fracao_cache, LIMITES_FRACAO, modelo=modelo)
+        if tempo_primeiro_token is not None:
+            self._observar("chatbot_primeiro_token_segundos", tempo_primeiro_token, LIMITES_SEGUNDOS, modelo=modelo)
+        if escores:
+            self._observar("chatbot_relevancia_melhor", max(escores), LIMITES_RELEVANCIA)
+            for escore in escores:
+                self._observar("chatbot_relevancia_trecho", escore, LIMITES_RELEVANCIA)
+
+        self._gravar({
+            "evento": "resposta",
+            "origem": origem,
+            "modelo": modelo,
+            "tokens": tokens,
+            "fracao_cache": round(fracao_cache, 4) if fracao_cache is not None else None,
+            "tempo_primeiro_token": tempo_primeiro_token,
+            "relevancias": [round(escore, 4) for escore in escores],
+        })
+
+    def registrar_roteamento(self, decisao, segundos=None, tempo_primeiro_token=None):
+        """
+        Decisão da cascata (cascata_modelos.escolher_modelo) e a latência do
+        turno no nível escolhido; no JSON lines, com relevância e margem para
+        calibrar os limiares
+        """
+        if not self.ativo:
+            return
+        self._incrementar("chatbot_roteamento_total", nivel=decisao["nivel"], motivo=decisao["motivo"])
+        if segundos is not None:
+            self._observar("chatbot_roteamento_segundos", segundos, LIMITES_SEGUNDOS, nivel=decisao["nivel"])
+        self._gravar({
+            "evento": "roteamento",
+            **decisao,
+            "segundos": round(segundos, 6) if segundos is not None else None,
+            "tempo_primeiro_token": tempo_primeiro_token,
+        })
+
+    def observar_fila(self, modelo, segundos):
+        """Espera de um pedido na fila do agendador (agendador_llm.py)"""
+        if not self.ativo:
+            return
+        self._observar("chatbot_fila_espera_segundos", segundos, LIMITES_SEGUNDOS, modelo=modelo)
+
+    def registrar_nova_tentativa(self, modelo, motivo):
+        if not self.ativo:
+            return
+        self._incrementar("chatbot_novas_tentativas_total", modelo=modelo, motivo=motivo)
+        self._gravar({"evento": "nova_tentativa", "modelo": modelo, "motivo": motivo})
+
+    def adicionar_medidor(self, nome, funcao):
+        """Valor instantâneo (gauge), lido de funcao() a cada exportação"""
+        if self.ativo:
+            self._medidores[nome] = funcao
+
+    def _observar(self, nome, valor, limites, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(limites)
+            histograma.observar(valor)
+
+    def _incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def _gravar(self, evento):
+        if self._arquivo is None:
+            return
+        linha = json.dumps({"ts": round(time.time(), 3), **evento}, ensure_ascii=False)
+        with self._lock:
+            self._arquivo.write(linha + "\n")
+
+    # ───────────────────────────────────────────────────
+    # Exportação
+    # ───────────────────────────────────────────────────
+
+    def exportar_prometheus(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        with self._lock:
+            histogramas = sorted(
+                (chave, h.limites, list(h.contagens), h.soma, h.total) for chave, h in self._histogramas.items()
+            )
+            contadores = sorted(self._contadores.items())
+            medidores = sorted(self._medidores.items())
+
+        linhas = []
+        anunciados = set()
+
+        def anunciar(nome, tipo):
+            if nome not in anunciados:
+                anunciados.add(nome)
+                linhas.append(f"# HELP {nome} {DESCRICOES.get(nome, nome)}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+
+        for (nome, rotulos), limites, contagens, soma, total in histogramas:
+            anunciar(nome, "histogram")
+            acumulado = 0
+            for limite, contagem in zip(limites + ("+Inf",), contagens):
+                acumulado += contagem
+                le = limite if limite == "+Inf" else _numero(limite)
+                linhas.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', le),))} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos_prometheus(rotulos)} {_numero(soma)}")
+            linhas.append(f"{nome}_count{_rotulos_prometheus(rotulos)} {total}")
+
+        for (nome, rotulos), valor in contadores:
+            anunciar(nome, "counter")
+            linhas.append(f"{nome}{_rotulos_prometheus(rotulos)} {_numero(valor)}")
+
+        for nome, funcao in medidores:
+            anunciar(nome, "gauge")
+            linhas.append(f"{nome} {_numero(funcao())}")
+
+        return "\n".join(linhas) + "\n"
+
+    def iniciar_servidor(self, host="127.0.0.1", porta=PORTA_PADRAO):
+        """
+        Serve GET /metrics numa thread daemon. Porta ocupada (outro processo
+        do Streamlit, por exemplo) só gera um aviso no log; retorna o servidor ou None
+        """
+        if not self.ativo or self.servidor is not None:
+            return self.servidor
+        manipulador = type("Manipulador", (_ManipuladorMetricas,), {"metricas": self})
+        try:
+            servidor = ThreadingHTTPServer((host, porta), manipulador)
+        except OSError as e:
+            logger.warning("Endpoint de métricas não iniciado em %s:%s (%s)", host, porta, e)
+            return None
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+        self.servidor = servidor
+        logger.info("Métricas em http://%s:%s/metrics", host, servidor.server_port)
+        return servidor
+
+    def fechar(self):
+        if self.servidor is not None:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+            self.servidor = None
+        if self._arquivo is not None:
+            with self._lock:
+                self._arquivo.close()
+                self._arquivo = None
+
+
+class _ManipuladorMetricas(BaseHTTPRequestHandler):
+    metricas = None
+
+    def log_message(self, formato, *argumentos):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        corpo = self.metricas.exportar_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
@@ -0,0 +1,295 @@
+"""
+Pipeline do RAG sem Streamlit: base, recuperação, prompt e resposta
+
+As mesmas etapas dos bots (bot5.py, bot5_rag.py) em funções importáveis,
+sem nenhum st.*: servem para responder perguntas em lote (responder_lote.py),
+para testes de regressão de prompt e para qualquer processo fora do app.
+
+Os bots usam daqui construir_base e montar_mensagens, de modo que o prompt
+montado em lote é byte a byte o mesmo do app.
+
+Ordem das mensagens e cache de prompt da OpenAI: a API reaproveita o
+prefixo já visto de um prompt (a partir de 1024 tokens, em blocos de 128)
+e cobra/processa esses tokens como "cached_tokens". Por isso tudo o que é
+fixo vem primeiro e sempre com os mesmos bytes (prompt do sistema +
+instruções de resposta, numa única mensagem system) e só depois o que
+muda a cada pergunta (contexto e, por último, a pergunta). O quanto foi
+aproveitado volta em usage.prompt_tokens_details.cached_tokens e é
+registrado por resposta (metricas.py, uso_como_dict).
+
+Uso (dentro de chatbot_streamlit/):
+    motor = MotorRAG.de_config("config/bot_config.json")
+    resultado = motor.responder("Como gero um cartaz?")
+    preparos = motor.preparar_lote(["Como gero um cartaz?", "Vocês têm suporte?"])
+"""
+import os
+import time
+
+from rag_busca import (
+    montar_base, vetorizar_perguntas, buscar_trechos_com_origem, buscar_trechos_lote_com_origem, formatar_contexto,
+    LIMIAR_CONFIANCA_FAQ,
+)
+from rag_vetorial import criar_vetorizador
+from indice_disco import abrir_indice_se_atual
+from ingestao import montar_base_de_diretorio, TAMANHO_MAXIMO_TRECHO
+from observador_arquivos import ler_texto, ler_json
+from contexto_rag import empacotar_contexto, hashes_trechos, ORCAMENTO_CONTEXTO_PADRAO, MAX_CANDIDATOS_PADRAO, QUEDA_RELEVANCIA_PADRAO
+from cliente_openai import criar_cliente
+from agendador_llm import AgendadorLLM
+from busca_paralela import ativar_busca_paralela
+from cascata_modelos import escolher_modelo, MODELO_AUTOMATICO
+
+CAMINHO_CONFIG_PADRAO = "config/bot_config.json"
+CAMINHO_PROMPT_PADRAO = "prompts/prompt_sistema.txt"
+CAMINHO_BASE_PADRAO = "conhecimento/base_conhecimento.txt"
+
+INSTRUCOES_RESPOSTA = (
+    "Instruções: Responda a pergunta usando EXCLUSIVAMENTE as informações do CONTEXTO enviado "
+    "junto com a pergunta. "
+    "Se a informação não estiver no contexto, diga que não possui essa informação na base de conhecimento atual."
+)
+
+# ═══════════════════════════════════════════════════════
+# BASE DE CONHECIMENTO
+# ═══════════════════════════════════════════════════════
+
+def _montar_indices(caminho_arquivo, config_embeddings=None, caminho_indice=None, config_ingestao=None, anterior=None,
+                    cliente=None):
+    """
+    Lê a base e monta os índices (roda também na thread do observador: sem st.*)
+    Se o caminho for um diretório, ingere todos os .txt/.md/.csv em streaming
+    (numa recarga, só os arquivos que mudaram desde a base anterior)
+    """
+    if os.path.isdir(caminho_arquivo):
+        config_ingestao = config_ingestao or {}
+        vetorizador = criar_vetorizador(config_embeddings, cliente) if config_embeddings else None
+        return montar_base_de_diretorio(
+            caminho_arquivo,
+            vetorizador,
+            config_ingestao.get("processos"),
+            config_ingestao.get("tamanho_maximo_trecho", TAMANHO_MAXIMO_TRECHO),
+            base_anterior=anterior,
+        )
+
+    # Índice pré-compilado (python indice_disco.py build-index): abre via mmap
+    base = abrir_indice_se_atual(caminho_indice, caminho_arquivo, config_embeddings, cliente)
+    if base is not None:
+        return base
+
+    with open(caminho_arquivo, 'r', encoding='utf-8') as f:
+        conteudo = f.read()
+
+    # Divide em blocos e sentenças e constrói os índices (uma única vez)
+    vetorizador = criar_vetorizador(config_embeddings, cliente) if config_embeddings else None
+    return montar_base(conteudo, vetorizador)
+
+
+def construir_base(caminho_arquivo, config_embeddings=None, caminho_indice=None, config_ingestao=None, config_faq=None,
+                   config_paralelo=None, cliente=None, anterior=None):
+    """
+    Base + atalho do FAQ (vetores só das perguntas, regravados apenas quando o hash da base muda)
+    + busca em fatias num pool de processos, se a base passar de busca_paralela.minimo_trechos
+    cliente: cliente OpenAI do app, para os embeddings "openai" usarem o mesmo pool de conexões
+    anterior: base atual, passada pelo observador na recarga de um diretório
+    """
+    base = _montar_indices(caminho_arquivo, config_embeddings, caminho_indice, config_ingestao, anterior, cliente)
+    config_faq = config_faq or {}
+    if config_faq.get("atalho_vetorial", True):
+        base = vetorizar_perguntas(
+            base,
+            caminho=config_faq.get("arquivo_vetores"),
+            limiar_confianca=config_faq.get("limiar_confianca", LIMIAR_CONFIANCA_FAQ)
+        )
+    return ativar_busca_paralela(base, config_paralelo)
+
+# ═══════════════════════════════════════════════════════
+# PROMPT
+# ═══════════════════════════════════════════════════════
+
+def mensagem_sistema(prompt_sistema):
+    """Parte fixa do prompt (prefixo do cache): prompt do sistema + instruções de resposta"""
+    return f"{prompt_sistema.strip()}\n\n{INSTRUCOES_RESPOSTA}"
+
+
+def montar_mensagens(prompt_sistema, contexto_relevante, pergunta_usuario):
+    """
+    Mensagens do chat.completions: prefixo fixo (system) + contexto e pergunta
+    A mensagem system não depende da pergunta: é o prefixo que a OpenAI reaproveita
+    """
+    mensagem_com_contexto = (
+        f"CONTEXTO DA BASE DE CONHECIMENTO:\n{contexto_relevante}\n\n"
+        f"PERGUNTA DO USUÁRIO: {pergunta_usuario}"
+    )
+    return [
+        {"role": "system", "content": mensagem_sistema(prompt_sistema)},
+        {"role": "user", "content": mensagem_com_contexto}
+    ]
+
+# ═══════════════════════════════════════════════════════
+# MOTOR
+# ═══════════════════════════════════════════════════════
+
+def uso_como_dict(uso):
+    """resposta.usage -> {'prompt', 'completion', 'cached'} (None se a API não mandou)"""
+    if uso is None:
+        return None
+    detalhes = getattr(uso, "prompt_tokens_details", None)
+    return {
+        "prompt": uso.prompt_tokens,
+        "completion": uso.completion_tokens,
+        "cached": (getattr(detalhes, "cached_tokens", None) or 0) if detalhes is not None else 0,
+    }
+
+
+class MotorRAG:
+    """
+    Recuperação + empacotamento do contexto + prompt + chamada ao modelo,
+    com os mesmos parâmetros do config/bot_config.json usados pelos bots.
+    Os atributos (modelo, motor_busca, orcamento_contexto...) podem ser
+    sobrescritos depois de criar o motor. As chamadas ao modelo passam pelo
+    agendador (config "agendador"): limites por modelo e novas tentativas.
+    Com modelo = MODELO_AUTOMATICO (ou "cascata.ativo" no config), cada
+    pergunta escolhe o modelo pela confiança da busca (cascata_modelos.py).
+    """
+
+    def __init__(self, base, prompt_sistema, config=None, api_key=None):
+        config = config or {}
+        config_contexto = config.get("contexto_rag", {})
+        self.base = base
+        self.prompt_sistema = prompt_sistema
+        self.config = config
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+
+        self.modelo_padrao = config.get("modelo_padrao", "gpt-4o")
+        self.cascata = config.get("cascata", {})
+        self.modelo = MODELO_AUTOMATICO if self.cascata.get("ativo") else self.modelo_padrao
+        self.temperatura = config.get("temperatura_padrao", 0.1)
+        self.max_tokens = config.get("max_tokens_padrao", 500)
+        self.motor_busca = config.get("motor_busca", "bm25")
+        self.orcamento_contexto = config_contexto.get("orcamento_tokens", ORCAMENTO_CONTEXTO_PADRAO)
+        self.max_candidatos = config_contexto.get("max_candidatos", MAX_CANDIDATOS_PADRAO)
+        self.queda_relevancia = config_contexto.get("queda_relevancia", QUEDA_RELEVANCIA_PADRAO)
+        self.agendador = AgendadorLLM.de_config(config.get("agendador"))
+        self._cliente = None
+
+    @classmethod
+    def de_config(cls, caminho_config=CAMINHO_CONFIG_PADRAO, caminho_prompt=CAMINHO_PROMPT_PADRAO, api_key=None):
+        """Motor com a base, o prompt e os parâmetros descritos nos arquivos do app"""
+        config = ler_json(caminho_config) if os.path.exists(caminho_config) else {}
+        cliente = None
+        if (config.get("embeddings") or {}).get("tipo") == "openai":
+            # Embeddings das consultas e chat no mesmo pool de conexões
+            cliente, _ = criar_cliente(
+                api_key or os.getenv("OPENAI_API_KEY"), config.get("base_url"), config.get("cliente_http")
+            )
+        base = construir_base(
+            config.get("base_conhecimento", CAMINHO_BASE_PADRAO),
+            config_embeddings=config.get("embeddings"),
+            caminho_indice=config.get("indice_arquivo"),
+            config_ingestao=config.get("ingestao"),
+            config_faq=config.get("faq"),
+            config_paralelo=config.get("busca_paralela"),
+            cliente=cliente
+        )
+        motor = cls(base, ler_texto(caminho_prompt), config, api_key)
+        motor._cliente = cliente
+        return motor
+
+    @property
+    def cliente(self):
+        """Cliente síncrono, criado na primeira chamada (preparar não precisa de API key)"""
+        if self._cliente is None:
+            self._cliente, _ = criar_cliente(self.api_key, self.config.get("base_url"), self.config.get("cliente_http"))
+        return self._cliente
+
+    # ───────────────────────────────────────────────────
+    # Recuperação e prompt
+    # ───────────────────────────────────────────────────
+
+    def recuperar(self, pergunta):
+        """([(relevância, registro)] candidatos ao contexto, origem das relevâncias)"""
+        return buscar_trechos_com_origem(pergunta, self.base, self.max_candidatos, self.motor_busca)
+
+    def preparar(self, pergunta, candidatos=None, origem=None):
+        """
+        Contexto empacotado e mensagens prontas para o modelo:
+        {'pergunta', 'mensagens', 'contexto', 'trechos', 'estatisticas', 'modelo', 'roteamento'}
+        ('roteamento' é a decisão da cascata, ou None com um modelo fixo)
+        origem: de onde vieram as relevâncias dos candidatos (buscar_trechos_com_origem)
+        """
+        if candidatos is None:
+            candidatos, origem = self.recuperar(pergunta)
+        automatico = self.modelo == MODELO_AUTOMATICO
+        trechos, estatisticas = empacotar_contexto(
+            candidatos, self.orcamento_contexto, self.queda_relevancia,
+            self.modelo_padrao if automatico else self.modelo
+        )
+        contexto = formatar_contexto(trechos)
+        roteamento = None
+        if automatico:
+            roteamento = escolher_modelo(trechos, self.cascata, self.modelo_padrao, origem or self.motor_busca)
+        return {
+            'pergunta': pergunta,
+            'mensagens': montar_mensagens(self.prompt_sistema, contexto, pergunta),
+            'contexto': contexto,
+            'trechos': trechos,
+            'estatisticas': estatisticas,
+            'modelo': roteamento['modelo'] if roteamento else self.modelo,
+            'roteamento': roteamento,
+        }
+
+    def preparar_lote(self, perguntas):
+        """preparar() de cada pergunta, com a busca do lote vetorizada (buscar_trechos_lote)"""
+        candidatos, origens = buscar_trechos_lote_com_origem(perguntas, self.base, self.max_candidatos, self.motor_busca)
+        return [
+            self.preparar(pergunta, achados, origem)
+            for pergunta, achados, origem in zip(perguntas, candidatos, origens)
+        ]
+
+    def parametros_chat(self, mensagens, modelo=None):
+        """Argumentos do chat.completions.create, iguais aos do app (modelo: o escolhido no preparo)"""
+        return {
+            "model": modelo or self.modelo,
+            "messages": mensagens,
+            "temperature": self.temperatura,
+            "max_tokens": self.max_tokens,
+            "top_p": 0.9,
+        }
+
+    # ───────────────────────────────────────────────────
+    # Resposta
+    # ───────────────────────────────────────────────────
+
+    def responder(self, pergunta, sessao=None):
+        """Pergunta -> resultado (dict), com uma chamada síncrona ao modelo"""
+        preparo = self.preparar(pergunta)
+        inicio = time.perf_counter()
+        resposta = self.agendador.criar(
+            self.cliente, sessao=sessao, **self.parametros_chat(preparo['mensagens'], preparo['modelo'])
+        )
+        return self.resultado(preparo, resposta, time.perf_counter() - inicio)
+
+    async def responder_async(self, cliente_assincrono, preparo, sessao=None):
+        """Mesma chamada com um AsyncOpenAI (cliente_openai.criar_cliente_assincrono)"""
+        inicio = time.perf_counter()
+        resposta = await self.agendador.criar_async(
+            cliente_assincrono, sessao=sessao, **self.parametros_chat(preparo['mensagens'], preparo['modelo'])
+        )
+        return self.resultado(preparo, resposta, time.perf_counter() - inicio)
+
+    def resultado(self, preparo, resposta=None, segundos=None):
+        """Resumo serializável de um preparo (e da resposta do modelo, se houver)"""
+        resultado = {
+            "pergunta": preparo['pergunta'],
+            "resposta": resposta.choices[0].message.content if resposta is not None else None,
+            "modelo": getattr(resposta, "model", None) or preparo['modelo'],
+            "tokens": uso_como_dict(getattr(resposta, "usage", None)),
+            "tokens_contexto": preparo['estatisticas']['tokens_depois'],
+            "relevancias": [round(float(relevancia), 4) for relevancia, _ in preparo['trechos']],
+            "trechos": hashes_trechos(preparo['trechos']),
+        }
+        if preparo['roteamento'] is not None:
+            resultado["roteamento"] = preparo['roteamento']
+        if segundos is not None:
+            resultado["latencia_s"] = round(segundos, 3)
+        return resultado
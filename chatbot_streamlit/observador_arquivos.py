@@ -0,0 +1,261 @@
+"""
+Recarga incremental dos arquivos do bot (conhecimento/, prompts/, config/)
+
+Cada arquivo (ou diretório de documentos) lido pelo bot é registrado com
+a função que o carrega. Uma thread de fundo confere periodicamente o
+mtime/tamanho de cada um; se mudou, confere o hash do conteúdo e, só se o conteúdo mudou, recarrega
+aquele arquivo (e apenas ele) e troca a versão de uma vez.
+
+Diretórios: o (mtime, tamanho) de cada arquivo é comparado com a última
+varredura, e o carregador recebe anterior=<valor atual> para reaproveitar
+o que não mudou (ingestao.montar_base_de_diretorio só relê os arquivos
+alterados). Como a varredura faz um stat por arquivo, a próxima espera
+pelo menos FATOR_ESPERA_DIRETORIO x o tempo da última varredura: numa
+árvore grande o observador se espaça sozinho em vez de ocupar um núcleo.
+
+A troca substitui a referência, nunca altera o objeto antigo: um rerun
+que já pegou a versão anterior termina com ela, e o próximo rerun já
+recebe a nova. Nada mais é descartado (ao contrário de st.cache_data.clear()).
+
+Os carregadores rodam fora do script (na thread de fundo): não podem usar st.*
+e devem levantar exceção em caso de erro; a versão anterior é mantida.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_PADRAO = 1.0
+FATOR_ESPERA_DIRETORIO = 50     # varredura de diretório: no máximo ~2% do tempo
+
+# Conteúdo carregado + identidade do arquivo de onde veio
+Versao = namedtuple("Versao", "valor mtime_ns tamanho sha256 carregado_em")
+
+
+def _hash_arquivo(caminho):
+    with open(caminho, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _estado_diretorio(caminho):
+    """{caminho: (mtime_ns, tamanho)} de todos os arquivos sob o diretório"""
+    estados = {}
+    for raiz, subdiretorios, arquivos in os.walk(caminho):
+        subdiretorios.sort()
+        for nome in sorted(arquivos):
+            caminho_arquivo = os.path.join(raiz, nome)
+            try:
+                estado = os.stat(caminho_arquivo)
+            except FileNotFoundError:
+                continue    # apagado durante a varredura
+            estados[caminho_arquivo] = (estado.st_mtime_ns, estado.st_size)
+    return estados
+
+
+def _hash_estados(estados):
+    """Impressão do diretório: hash de (nome, mtime, tamanho) de cada arquivo"""
+    resumo = hashlib.sha256()
+    for caminho, (mtime_ns, tamanho) in estados.items():
+        resumo.update(f"{caminho}|{mtime_ns}|{tamanho}\n".encode('utf-8'))
+    return resumo.hexdigest()
+
+
+def _alterados(anteriores, atuais):
+    """Caminhos criados, alterados ou apagados entre duas varreduras"""
+    return sorted(
+        caminho for caminho in anteriores.keys() | atuais.keys()
+        if anteriores.get(caminho) != atuais.get(caminho)
+    )
+
+
+def gravar_atomico(caminho, texto):
+    """Grava num temporário e renomeia: o observador nunca lê um arquivo pela metade"""
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+    try:
+        with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+# ═══════════════════════════════════════════════════════
+# CARREGADORES SIMPLES
+# ═══════════════════════════════════════════════════════
+
+def ler_texto(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def ler_json(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# ═══════════════════════════════════════════════════════
+# OBSERVADOR
+# ═══════════════════════════════════════════════════════
+
+class _Entrada:
+    __slots__ = ("carregador", "argumentos", "assinatura", "versao", "visto", "proxima")
+
+    def __init__(self, carregador, argumentos, assinatura):
+        self.carregador = carregador
+        self.argumentos = argumentos
+        self.assinatura = assinatura
+        self.versao = None
+        self.visto = None       # (mtime_ns, tamanho) da última verificação; num diretório, {caminho: ...}
+        self.proxima = 0.0      # diretórios: monotonic() antes do qual não varre de novo
+
+
+class ObservadorArquivos:
+    """Mantém a versão atual de cada arquivo registrado, recarregando só o que mudou"""
+
+    def __init__(self, intervalo_segundos=INTERVALO_PADRAO):
+        self.intervalo_segundos = intervalo_segundos
+        self.recargas = 0
+        self.ultima_recarga = None      # (caminho, instante)
+
+        self._entradas = {}             # caminho absoluto -> _Entrada
+        self._lock = threading.Lock()
+        self._lock_recarga = threading.Lock()   # uma recarga por vez (thread de fundo x botão)
+        self._thread = None
+
+    def obter(self, caminho, carregador, *argumentos):
+        """
+        Valor atual do arquivo. Na primeira chamada (ou se os argumentos do
+        carregador mudaram) carrega na hora; depois, a thread de fundo cuida.
+        """
+        chave = os.path.abspath(caminho)
+        assinatura = self._assinatura(carregador, argumentos)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada.assinatura == assinatura and entrada.versao is not None:
+                return entrada.versao.valor
+
+        # Novo registro (ou mesmo arquivo com outra configuração): substitui o anterior
+        entrada = _Entrada(carregador, argumentos, assinatura)
+        self._recarregar(chave, entrada, forcar=True, propagar_erros=True)
+        with self._lock:
+            self._entradas[chave] = entrada
+        self._iniciar()
+        return entrada.versao.valor
+
+    def versao(self, caminho):
+        """Versao (valor, mtime, hash...) atual do arquivo, ou None se não registrado"""
+        with self._lock:
+            entrada = self._entradas.get(os.path.abspath(caminho))
+        return entrada.versao if entrada is not None else None
+
+    def verificar(self, caminho=None, forcar=False):
+        """
+        Confere um arquivo (ou todos) agora e recarrega os que mudaram.
+        forcar=True compara o hash mesmo com mtime/tamanho iguais e ignora
+        a espera entre varreduras de diretório.
+        Retorna a lista de caminhos recarregados.
+        """
+        with self._lock:
+            if caminho is None:
+                alvos = list(self._entradas.items())
+            else:
+                chave = os.path.abspath(caminho)
+                alvos = [(chave, self._entradas[chave])] if chave in self._entradas else []
+        return [chave for chave, entrada in alvos if self._recarregar(chave, entrada, forcar)]
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "arquivos": len(self._entradas),
+                "recargas": self.recargas,
+                "ultima_recarga": self.ultima_recarga,
+            }
+
+    # ───────────────────────────────────────────────────
+    # Internos
+    # ───────────────────────────────────────────────────
+
+    @staticmethod
+    def _assinatura(carregador, argumentos):
+        # Os scripts do Streamlit redefinem as funções a cada rerun: compara pelo nome
+        nome = f"{carregador.__module__}.{carregador.__qualname__}"
+        return nome, json.dumps(argumentos, sort_keys=True, default=str)
+
+    def _recarregar(self, chave, entrada, forcar=False, propagar_erros=False):
+        """Recarrega a entrada se o conteúdo mudou; True se trocou de versão"""
+        with self._lock_recarga:
+            return self._recarregar_travado(chave, entrada, forcar, propagar_erros)
+
+    def _recarregar_travado(self, chave, entrada, forcar, propagar_erros):
+        try:
+            diretorio = os.path.isdir(chave)
+            if diretorio:
+                if not forcar and time.monotonic() < entrada.proxima:
+                    return False
+                # Diretório (corpus da ingestão): metadados de cada arquivo, sem ler o conteúdo
+                inicio = time.monotonic()
+                visto = _estado_diretorio(chave)
+                duracao = time.monotonic() - inicio
+                entrada.proxima = time.monotonic() + max(self.intervalo_segundos, FATOR_ESPERA_DIRETORIO * duracao)
+                sha256 = _hash_estados(visto)
+            else:
+                estado = os.stat(chave)
+                visto = (estado.st_mtime_ns, estado.st_size)
+            if visto == entrada.visto and not forcar:
+                return False
+
+            if not diretorio:
+                sha256 = _hash_arquivo(chave)
+            if entrada.versao is not None and sha256 == entrada.versao.sha256:
+                # Só o mtime mudou (touch, salvar sem alterar)
+                entrada.visto = visto
+                return False
+
+            extras = {}
+            if diretorio and entrada.versao is not None:
+                alterados = _alterados(entrada.visto or {}, visto)
+                logger.info("%s: %d arquivo(s) alterado(s): %s", chave, len(alterados), ", ".join(alterados[:5]))
+                extras['anterior'] = entrada.versao.valor
+
+            # Marca antes de carregar: se o carregador falhar, não tenta de novo até o arquivo mudar
+            entrada.visto = visto
+            valor = entrada.carregador(chave, *entrada.argumentos, **extras)
+        except Exception as e:
+            if propagar_erros:
+                raise
+            logger.warning("Falha ao recarregar %s; mantendo a versão anterior: %s", chave, e)
+            return False
+
+        mtime_ns, tamanho = (None, None) if diretorio else visto
+        nova = Versao(valor, mtime_ns, tamanho, sha256, time.time())
+        with self._lock:
+            primeira_carga = entrada.versao is None
+            entrada.versao = nova
+            if not primeira_carga:
+                self.recargas += 1
+                self.ultima_recarga = (chave, nova.carregado_em)
+        if not primeira_carga:
+            logger.info("Recarregado: %s", chave)
+        return True
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._laco, name="observador-arquivos", daemon=True)
+        self._thread.start()
+
+    def _laco(self):
+        while True:
+            time.sleep(self.intervalo_segundos)
+            try:
+                self.verificar()
+            except Exception as e:
+                logger.warning("Observador de arquivos: %s", e)
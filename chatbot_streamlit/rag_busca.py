@@ -0,0 +1,709 @@
+"""
+Busca na base de conhecimento do RAG
+
+A base é processada uma única vez (montar_base) em blocos e sentenças,
+já normalizados e tokenizados, que são indexados num índice invertido com
+pontuação BM25. Cada consulta é normalizada uma vez (preparar_consulta) e
+percorre apenas as listas de postings dos seus termos.
+
+Com um vetorizador configurado, os mesmos trechos também formam um índice
+vetorial (rag_vetorial.py) para o motor "vetorial".
+
+Se o conteúdo for um FAQ ("1 - Pergunta", "2 – Pergunta", "21- Pergunta"),
+cada entrada vira um bloco e as perguntas ganham um índice próprio: a
+consulta é comparada primeiro só com as perguntas e cai na busca no texto
+completo apenas se nenhuma pergunta for parecida o bastante. Antes disso,
+um índice vetorial só das perguntas (vetorizar_perguntas) dá o atalho: se a
+pergunta mais parecida passa do limiar de confiança, o contexto é apenas o
+bloco daquela entrada.
+
+Em bases grandes, a varredura de BM25/similaridade pode ser dividida em
+fatias num pool de processos (busca_paralela.py, base['fatias']).
+"""
+import hashlib
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from difflib import SequenceMatcher
+
+from rag_vetorial import IndiceVetorial, IndicePerguntas, VetorizadorHashing
+
+logger = logging.getLogger(__name__)
+
+# ═══════════════════════════════════════════════════════
+# PARÂMETROS DA BUSCA
+# ═══════════════════════════════════════════════════════
+
+LIMIAR_BLOCO = 0.1          # Relevância mínima para blocos
+LIMIAR_SENTENCA = 0.15      # Threshold um pouco maior para sentenças
+TAMANHO_MINIMO_SENTENCA = 20  # Ignora sentenças muito curtas
+LIMIAR_PERGUNTA = 0.4       # Relevância mínima contra o índice de perguntas do FAQ
+LIMIAR_CONFIANCA_FAQ = 0.6  # Cosseno a partir do qual a pergunta do FAQ é tomada como a mesma
+MAX_COMPARADORES = 20000    # SequenceMatcher com set_seq2 já feito guardados por base (LRU)
+
+MOTORES_BUSCA = ("bm25", "similaridade", "vetorial")
+
+
+def limiar_por_tipo(tipo):
+    """Relevância mínima para um trecho do tipo 'bloco' ou 'sentenca'"""
+    return LIMIAR_BLOCO if tipo == 'bloco' else LIMIAR_SENTENCA
+
+# ═══════════════════════════════════════════════════════
+# NORMALIZAÇÃO E TOKENIZAÇÃO
+# ═══════════════════════════════════════════════════════
+
+_PONTUACAO = re.compile(r'[^\w\s]')
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem caracteres especiais (forma usada pelo SequenceMatcher)"""
+    return _PONTUACAO.sub('', texto.lower())
+
+
+def remover_acentos(texto):
+    """Remove acentos mantendo as letras base (ç -> c, ã -> a)"""
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def tokenizar_normalizado(texto_normalizado):
+    """Divide um texto já normalizado em termos sem acentos"""
+    return remover_acentos(texto_normalizado).split()
+
+
+def tokenizar(texto):
+    """Divide o texto em termos minúsculos e sem acentos"""
+    return tokenizar_normalizado(normalizar_texto(texto))
+
+
+def normalizar_pergunta(pergunta):
+    """Forma canônica da pergunta: 'Como faço Logout?' == 'como faco logout'"""
+    return ' '.join(tokenizar(pergunta))
+
+
+def preparar_consulta(pergunta):
+    """Normaliza e tokeniza a pergunta uma única vez por busca"""
+    normalizado = normalizar_texto(pergunta)
+    return {
+        'texto': pergunta,
+        'normalizado': normalizado,
+        'tokens': tokenizar_normalizado(normalizado),
+    }
+
+
+# Formas da consulta, da mais fina para a mais grossa: cada uma determina as seguintes
+FORMAS_CONSULTA = ('texto', 'normalizado', 'tokens')
+
+
+def chave_consulta(consulta, base_conhecimento, motor="bm25", faq=True):
+    """
+    A forma da pergunta que buscar_trechos realmente lê com esse motor e essa
+    base: BM25, índice de perguntas e vetorizadores locais só veem os tokens
+    (sem acentos), a similaridade vê o texto normalizado (com acentos) e os
+    embeddings da OpenAI, o texto original. Mesma chave, mesmo resultado.
+    """
+    formas = ['tokens']
+    if motor == "similaridade":
+        formas.append('normalizado')
+    if motor == "vetorial" and 'indice_vetorial' in base_conhecimento:
+        formas.append(getattr(base_conhecimento['vetorizador'], 'entrada_consulta', 'texto'))
+    if faq and 'vetores_perguntas' in base_conhecimento:
+        formas.append(getattr(base_conhecimento['vetores_perguntas'].vetorizador, 'entrada_consulta', 'texto'))
+    forma = min(formas, key=FORMAS_CONSULTA.index)
+    return ' '.join(consulta['tokens']) if forma == 'tokens' else consulta[forma]
+
+# ═══════════════════════════════════════════════════════
+# ÍNDICE INVERTIDO BM25
+# ═══════════════════════════════════════════════════════
+
+class IndiceBM25:
+    """
+    Índice invertido (termo -> [(doc_id, frequência)]) com pontuação BM25
+
+    As pontuações são divididas pelo máximo teórico da consulta, de modo
+    que a relevância fica entre 0 e 1 e os limiares continuam comparáveis.
+    """
+
+    def __init__(self, documentos_tokenizados, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.total_documentos = len(documentos_tokenizados)
+
+        tamanhos = [len(tokens) for tokens in documentos_tokenizados]
+        tamanho_medio = sum(tamanhos) / len(tamanhos) if tamanhos else 0.0
+
+        postings = defaultdict(list)
+        for doc_id, tokens in enumerate(documentos_tokenizados):
+            for termo, frequencia in Counter(tokens).items():
+                postings[termo].append((doc_id, frequencia))
+        self.postings = dict(postings)
+
+        self.idf = {termo: self._calcular_idf(len(lista)) for termo, lista in self.postings.items()}
+        # Termo ausente do índice: máximo informativo (e nunca encontrado)
+        self.idf_ausente = self._calcular_idf(0)
+
+        # Normalização por tamanho de documento, pré-calculada
+        self.normas = [
+            k1 * (1 - b + b * tamanho / tamanho_medio) if tamanho_medio else k1
+            for tamanho in tamanhos
+        ]
+
+    def _calcular_idf(self, frequencia_documentos):
+        n = self.total_documentos
+        return math.log(1 + (n - frequencia_documentos + 0.5) / (frequencia_documentos + 0.5))
+
+    def pesos_consulta(self, tokens_consulta):
+        """
+        [(termo, idf)] na ordem em que pontuar() soma, e o máximo teórico da
+        consulta (a busca em fatias usa os mesmos pesos da base inteira)
+        """
+        k1_mais_1 = self.k1 + 1
+        pesos = [(termo, self.idf.get(termo, self.idf_ausente)) for termo in set(tokens_consulta)]
+        maximo_teorico = 0.0
+        for _, idf in pesos:
+            maximo_teorico += idf * k1_mais_1
+        return pesos, maximo_teorico
+
+    def pontuar(self, tokens_consulta):
+        """Retorna {doc_id: relevância} apenas para documentos com algum termo da consulta"""
+        pesos, maximo_teorico = self.pesos_consulta(tokens_consulta)
+        if not pesos:
+            return {}
+
+        k1_mais_1 = self.k1 + 1
+        pontuacoes = defaultdict(float)
+        for termo, idf in pesos:
+            for doc_id, frequencia in self.postings.get(termo, ()):
+                pontuacoes[doc_id] += idf * frequencia * k1_mais_1 / (frequencia + self.normas[doc_id])
+
+        return {doc_id: p / maximo_teorico for doc_id, p in pontuacoes.items()}
+
+# ═══════════════════════════════════════════════════════
+# FAQ
+# ═══════════════════════════════════════════════════════
+
+# "1 -Pergunta", "2 – Pergunta", "21- Pergunta", "3. Pergunta", " 24 - Pergunta"
+_CABECALHO_FAQ = re.compile(r'^\s*(\d{1,5})\s*[-–—.)]\s*(\S.*)$')
+_ROTULO_RESPOSTA = re.compile(r'^\s*respostas?\s*:\s*', re.IGNORECASE)
+_NUMERACAO = re.compile(r'^\s*\d{1,5}\s*[-–—.)]\s*')
+
+# Saltos maiores que isso na numeração são listas dentro de uma resposta, não novas entradas
+SALTO_MAXIMO_FAQ = 5
+
+
+def numero_cabecalho_faq(linha, ultimo_numero):
+    """Número da entrada se a linha for o cabeçalho da próxima pergunta do FAQ, senão None"""
+    cabecalho = _CABECALHO_FAQ.match(linha)
+    if cabecalho and ultimo_numero < int(cabecalho.group(1)) <= ultimo_numero + SALTO_MAXIMO_FAQ:
+        return int(cabecalho.group(1))
+    return None
+
+
+def dividir_faq(conteudo):
+    """
+    Um bloco por entrada do FAQ (cabeçalho numerado + resposta, mesmo com
+    linhas em branco no meio). Devolve None se o conteúdo não parece um FAQ.
+    O texto antes da primeira pergunta (título) vira um bloco à parte.
+    """
+    blocos = []
+    atual = []
+    ultimo_numero = 0
+    for linha in conteudo.split('\n'):
+        numero = numero_cabecalho_faq(linha, ultimo_numero)
+        if numero is not None:
+            if atual:
+                blocos.append(atual)
+            atual = [linha.strip()]
+            ultimo_numero = numero
+        elif linha.strip():
+            atual.append(linha.strip())
+    if atual:
+        blocos.append(atual)
+
+    if ultimo_numero < 2:
+        return None
+    return ['\n'.join(linhas) for linhas in blocos]
+
+
+def entrada_faq(bloco, posicao):
+    """Entrada {'id', 'pergunta', 'resposta', 'bloco'} do bloco, ou None se ele não começa com um cabeçalho numerado"""
+    primeira, _, resto = bloco.partition('\n')
+    cabecalho = _CABECALHO_FAQ.match(primeira)
+    if not cabecalho:
+        return None
+    return {
+        'id': int(cabecalho.group(1)),
+        'pergunta': cabecalho.group(2).strip(),
+        'resposta': _ROTULO_RESPOSTA.sub('', resto.strip(), count=1),
+        'bloco': posicao,
+    }
+
+
+def extrair_faq(blocos):
+    """
+    Entradas do FAQ dos blocos que começam com um cabeçalho numerado;
+    'bloco' é a posição (e o id do registro) do bloco
+    """
+    entradas = (entrada_faq(bloco, posicao) for posicao, bloco in enumerate(blocos))
+    return [entrada for entrada in entradas if entrada is not None]
+
+
+def indexar_perguntas(base):
+    """Acrescenta à base as entradas do FAQ e o índice só de perguntas (se houver FAQ)"""
+    entradas = extrair_faq(base['blocos'])
+    if len(entradas) >= 2:
+        base['faq'] = entradas
+        base['indice_perguntas'] = IndiceBM25([tokenizar(e['pergunta']) for e in entradas])
+    return base
+
+
+def vetorizar_perguntas(base, vetorizador=None, caminho=None, limiar_confianca=LIMIAR_CONFIANCA_FAQ):
+    """
+    Acrescenta à base o índice vetorial das perguntas do FAQ ('vetores_perguntas').
+    Com caminho (.npz ao lado da base), reaproveita a matriz gravada enquanto o
+    hash da base for o mesmo; senão vetoriza as perguntas e regrava o arquivo.
+    """
+    if 'faq' not in base:
+        return base
+    vetorizador = vetorizador or base.get('vetorizador') or VetorizadorHashing()
+    versao = f"{base['versao']}:{vetorizador.tipo}:{getattr(vetorizador, 'modelo', vetorizador.dimensao)}"
+
+    indice = IndicePerguntas.carregar(caminho, versao, vetorizador, limiar_confianca)
+    if indice is None:
+        perguntas = [{'texto': e['pergunta'], 'tokens': tokenizar(e['pergunta'])} for e in base['faq']]
+        indice = IndicePerguntas.construir(perguntas, vetorizador, versao, limiar_confianca)
+        if caminho:
+            try:
+                indice.salvar(caminho)
+            except OSError as e:
+                logger.warning("Não foi possível gravar %s: %s", caminho, e)
+    base['vetores_perguntas'] = indice
+    return base
+
+# ═══════════════════════════════════════════════════════
+# MONTAGEM DA BASE
+# ═══════════════════════════════════════════════════════
+
+def hash_conteudo(texto, tamanho=16):
+    """Identificador estável de um texto (não muda se outros trechos forem editados)"""
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:tamanho]
+
+
+def criar_registro(id_trecho, texto, tipo, bloco=None):
+    """
+    Registro de um trecho indexado: texto original + formas pré-processadas
+    'bloco' é a posição do bloco de onde o trecho saiu (o próprio, para blocos)
+    """
+    normalizado = normalizar_texto(texto)
+    return {
+        'id': id_trecho,
+        'hash': hash_conteudo(texto),
+        'tipo': tipo,
+        'bloco': bloco,
+        'texto': texto,
+        'normalizado': normalizado,
+        'tokens': tokenizar_normalizado(normalizado),
+    }
+
+
+def montar_base(conteudo, vetorizador=None):
+    """
+    Divide o conteúdo em blocos e sentenças, pré-processa cada trecho
+    e constrói o índice BM25 (e o vetorial, se houver vetorizador)
+    """
+    # Divide em blocos: uma entrada por bloco se for FAQ, senão parágrafos
+    blocos = dividir_faq(conteudo)
+    if blocos is None:
+        blocos = [bloco.strip() for bloco in conteudo.split('\n\n') if bloco.strip()]
+    return montar_base_de_blocos(blocos, vetorizador, versao=hash_conteudo(conteudo), texto_completo=conteudo)
+
+
+def montar_base_de_blocos(blocos, vetorizador=None, versao=None, texto_completo='', metadados=None):
+    """
+    Monta a base a partir de blocos já separados (ex.: trechos da ingestão).
+    metadados, se informado, é uma lista paralela a blocos (fonte, offset...)
+    copiada para os registros do bloco e das suas sentenças.
+    """
+    # Divide em sentenças também (lembrando de qual bloco veio cada uma)
+    sentencas = []
+    origem_sentencas = []
+    for posicao, bloco in enumerate(blocos):
+        # Remove numeração e formatação ("1.", "2 –", "21-")
+        bloco_limpo = _NUMERACAO.sub('', bloco)
+        sents = [s.strip() for s in bloco_limpo.split('\n') if s.strip()]
+        sentencas.extend(sents)
+        origem_sentencas.extend([posicao] * len(sents))
+
+    # Trechos indexados: todos os blocos e as sentenças não muito curtas
+    trechos = [(bloco, 'bloco', posicao) for posicao, bloco in enumerate(blocos)]
+    trechos.extend(
+        (sentenca, 'sentenca', origem) for sentenca, origem in zip(sentencas, origem_sentencas)
+        if len(sentenca) > TAMANHO_MINIMO_SENTENCA
+    )
+    registros = [criar_registro(i, texto, tipo, posicao) for i, (texto, tipo, posicao) in enumerate(trechos)]
+    if metadados is not None:
+        for registro, (_, _, posicao) in zip(registros, trechos):
+            registro.update(metadados[posicao])
+
+    base = {
+        'versao': versao or hash_conteudo('\n\n'.join(blocos)),
+        'blocos': blocos,
+        'sentencas': sentencas,
+        'texto_completo': texto_completo,
+        'registros': registros,
+        # Hashes dos trechos atuais: o cache de respostas descarta o que não estiver aqui
+        'hashes': frozenset(registro['hash'] for registro in registros),
+        'indice': IndiceBM25([registro['tokens'] for registro in registros]),
+    }
+
+    if vetorizador is not None:
+        base['vetorizador'] = vetorizador
+        base['indice_vetorial'] = IndiceVetorial.construir(
+            registros, vetorizador, [limiar_por_tipo(registro['tipo']) for registro in registros]
+        )
+
+    return indexar_perguntas(base)
+
+# ═══════════════════════════════════════════════════════
+# BUSCA
+# ═══════════════════════════════════════════════════════
+
+def similaridade_normalizada(consulta_normalizada, trecho_normalizado):
+    """SequenceMatcher.ratio() entre dois textos já normalizados"""
+    return SequenceMatcher(None, consulta_normalizada, trecho_normalizado).ratio()
+
+
+def calcular_similaridade(texto1, texto2):
+    """Calcula similaridade entre dois textos usando SequenceMatcher"""
+    return similaridade_normalizada(normalizar_texto(texto1), normalizar_texto(texto2))
+
+
+def _razao(correspondencias, tamanho_total):
+    """A mesma conta de SequenceMatcher.ratio() e dos seus limites superiores"""
+    return 2.0 * correspondencias / tamanho_total if tamanho_total else 1.0
+
+
+class ComparadorSimilaridade:
+    """
+    Top-k por SequenceMatcher.ratio() (consulta em seq1, trecho em seq2) com
+    exatamente o resultado da varredura completa, mas sem calcular ratio()
+    da maioria dos trechos:
+        - limites superiores em cascata: real_quick_ratio() (só os tamanhos)
+          e quick_ratio() (caracteres em comum); o trecho cujo limite não
+          passa do limiar do seu tipo sai antes de qualquer ratio();
+        - os demais são visitados do maior limite para o menor, com um heap
+          mínimo dos k melhores: o heap enche cedo com trechos bons e a
+          visita para no primeiro limite que não bate o pior do heap;
+        - o SequenceMatcher de cada trecho guarda o set_seq2 (b2j e a
+          contagem de caracteres do trecho) entre consultas (LRU).
+    Em empate de relevância ganha o menor id, como em heapq.nlargest com
+    (relevância, -id). Os comparadores são estado mutável (set_seq1): uma
+    consulta por vez.
+    """
+
+    def __init__(self, textos, limiares, capacidade=MAX_COMPARADORES):
+        self.textos = textos
+        self.limiares = limiares
+        self.tamanhos = [len(texto) for texto in textos]
+        self.capacidade = capacidade
+        self._comparadores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _comparador(self, posicao, consulta_normalizada):
+        comparador = self._comparadores.get(posicao)
+        if comparador is None:
+            comparador = self._comparadores[posicao] = SequenceMatcher(None)
+            comparador.set_seq2(self.textos[posicao])
+            if len(self._comparadores) > self.capacidade:
+                self._comparadores.popitem(last=False)
+        else:
+            self._comparadores.move_to_end(posicao)
+        comparador.set_seq1(consulta_normalizada)
+        return comparador
+
+    def top_k(self, consulta_normalizada, max_resultados, primeiro_id=0):
+        """[(similaridade, primeiro_id + posição)] do maior para o menor; em empate, o menor id"""
+        if max_resultados <= 0:
+            return []
+        tamanho_consulta = len(consulta_normalizada)
+        with self._lock:
+            candidatos = []
+            for posicao, tamanho in enumerate(self.tamanhos):
+                limiar = self.limiares[posicao]
+                # real_quick_ratio(), sem nem olhar o texto
+                if _razao(min(tamanho_consulta, tamanho), tamanho_consulta + tamanho) <= limiar:
+                    continue
+                limite = self._comparador(posicao, consulta_normalizada).quick_ratio()
+                if limite > limiar:
+                    candidatos.append((-limite, posicao))
+            candidatos.sort()
+
+            melhores = []   # heap de (similaridade, -posição): a raiz é o pior dos k
+            for negativo, posicao in candidatos:
+                if len(melhores) == max_resultados:
+                    pior, posicao_pior = melhores[0][0], -melhores[0][1]
+                    # Os próximos têm limite menor, ou igual e posição maior: nenhum entra
+                    if -negativo < pior or (-negativo == pior and posicao > posicao_pior):
+                        break
+                similaridade = self._comparador(posicao, consulta_normalizada).ratio()
+                if similaridade <= self.limiares[posicao]:
+                    continue
+                item = (similaridade, -posicao)
+                if len(melhores) < max_resultados:
+                    heapq.heappush(melhores, item)
+                elif item > melhores[0]:
+                    heapq.heapreplace(melhores, item)
+        melhores.sort(reverse=True)
+        return [(similaridade, primeiro_id - negativo) for similaridade, negativo in melhores]
+
+
+def _comparador_similaridade(base_conhecimento):
+    """Comparador da base, montado na primeira busca por similaridade"""
+    comparador = base_conhecimento.get('comparador_similaridade')
+    if comparador is None:
+        registros = base_conhecimento['registros']
+        comparador = base_conhecimento.setdefault('comparador_similaridade', ComparadorSimilaridade(
+            [registro['normalizado'] for registro in registros],
+            [limiar_por_tipo(registro['tipo']) for registro in registros],
+        ))
+    return comparador
+
+
+def _buscar_por_similaridade(consulta, base_conhecimento, max_resultados):
+    """SequenceMatcher (motor original) com poda pelos limites superiores; já devolve o top-k ordenado"""
+    registros = base_conhecimento['registros']
+    return [
+        (similaridade, registros[doc_id])
+        for similaridade, doc_id in _comparador_similaridade(base_conhecimento).top_k(
+            consulta['normalizado'], max_resultados
+        )
+    ]
+
+
+def _buscar_por_bm25(consulta, base_conhecimento):
+    """Consulta o índice invertido: custo proporcional aos postings dos termos"""
+    registros = base_conhecimento['registros']
+    resultados = []
+    for doc_id, relevancia in base_conhecimento['indice'].pontuar(consulta['tokens']).items():
+        registro = registros[doc_id]
+        if relevancia > limiar_por_tipo(registro['tipo']):
+            resultados.append((relevancia, registro))
+    return resultados
+
+
+def _buscar_vetorial(consulta, base_conhecimento, max_resultados):
+    """Produto matriz-vetor + argpartition; já devolve o top-k ordenado"""
+    registros = base_conhecimento['registros']
+    vetor = base_conhecimento['vetorizador'].vetorizar_consulta(consulta)
+    return [
+        (similaridade, registros[doc_id])
+        for similaridade, doc_id in base_conhecimento['indice_vetorial'].buscar(vetor, max_resultados)
+    ]
+
+
+def _buscar_por_pergunta(consulta, base_conhecimento):
+    """Compara a consulta só com as perguntas do FAQ; devolve o bloco de cada entrada parecida"""
+    registros = base_conhecimento['registros']
+    entradas = base_conhecimento['faq']
+    return [
+        (relevancia, registros[entradas[posicao]['bloco']])
+        for posicao, relevancia in base_conhecimento['indice_perguntas'].pontuar(consulta['tokens']).items()
+        if relevancia >= LIMIAR_PERGUNTA
+    ]
+
+
+def _atalho_faq(consulta, base_conhecimento):
+    """Se uma pergunta do FAQ é praticamente a consulta, devolve só o bloco daquela entrada"""
+    indice = base_conhecimento['vetores_perguntas']
+    similaridade, posicao = indice.melhor(indice.vetorizador.vetorizar_consulta(consulta))
+    if similaridade < indice.limiar_confianca:
+        return []
+    entrada = base_conhecimento['faq'][posicao]
+    return [(similaridade, base_conhecimento['registros'][entrada['bloco']])]
+
+
+# De onde vieram as relevâncias (cada caminho pontua numa escala própria)
+ORIGEM_FAQ_VETORIAL = "faq_vetorial"      # cosseno contra os vetores das perguntas do FAQ
+ORIGEM_FAQ_PERGUNTAS = "faq_perguntas"    # BM25 normalizado contra o índice de perguntas
+
+
+def origem_motor(motor, base_conhecimento):
+    """O motor que de fato pontua a varredura: vetorial sem índice vetorial cai no BM25"""
+    if motor == "vetorial" and 'indice_vetorial' in base_conhecimento:
+        return "vetorial"
+    return "similaridade" if motor == "similaridade" else "bm25"
+
+
+def buscar_trechos(pergunta, base_conhecimento, max_resultados=3, motor="bm25", faq=True):
+    """
+    Retorna [(relevância, registro)] dos trechos mais relevantes, do maior para o menor.
+    Com faq=True e uma base de FAQ, tenta primeiro o atalho vetorial e depois o
+    índice de perguntas; a varredura de blocos e sentenças fica para o resto.
+    """
+    return buscar_trechos_com_origem(pergunta, base_conhecimento, max_resultados, motor, faq)[0]
+
+
+def buscar_trechos_com_origem(pergunta, base_conhecimento, max_resultados=3, motor="bm25", faq=True):
+    """
+    buscar_trechos + o caminho que produziu as relevâncias: ORIGEM_FAQ_VETORIAL,
+    ORIGEM_FAQ_PERGUNTAS ou o motor (origem_motor). A cascata de modelos usa a
+    origem para escolher os limiares na escala certa.
+    """
+    consulta = preparar_consulta(pergunta)
+    if faq and 'vetores_perguntas' in base_conhecimento:
+        resultados = _atalho_faq(consulta, base_conhecimento)
+        if resultados:
+            return resultados, ORIGEM_FAQ_VETORIAL
+    if faq and 'indice_perguntas' in base_conhecimento:
+        resultados = _buscar_por_pergunta(consulta, base_conhecimento)
+        if resultados:
+            return heapq.nlargest(max_resultados, resultados, key=lambda x: (x[0], -x[1]['id'])), ORIGEM_FAQ_PERGUNTAS
+    origem = origem_motor(motor, base_conhecimento)
+    if origem == "vetorial":
+        return _buscar_vetorial(consulta, base_conhecimento, max_resultados), origem
+    return _buscar_no_texto(consulta, base_conhecimento, max_resultados, motor), origem
+
+
+def buscar_trechos_lote(perguntas, base_conhecimento, max_resultados=3, motor="bm25", faq=True):
+    """
+    buscar_trechos de cada pergunta, na mesma ordem. O atalho do FAQ e o motor
+    vetorial vetorizam o lote inteiro e fazem um único produto matriz-matriz;
+    BM25 e similaridade seguem consulta a consulta (o índice invertido já só
+    toca os postings dos termos de cada uma). No vetorial, trechos empatados
+    a menos de ~1e-7 podem trocar de ordem (arredondamento do produto em lote).
+    """
+    return buscar_trechos_lote_com_origem(perguntas, base_conhecimento, max_resultados, motor, faq)[0]
+
+
+def buscar_trechos_lote_com_origem(perguntas, base_conhecimento, max_resultados=3, motor="bm25", faq=True):
+    """buscar_trechos_lote + a origem das relevâncias de cada pergunta (listas paralelas)"""
+    consultas = [preparar_consulta(pergunta) for pergunta in perguntas]
+    registros = base_conhecimento['registros']
+    resultados = [None] * len(consultas)
+    origem = origem_motor(motor, base_conhecimento)
+    origens = [origem] * len(consultas)
+    pendentes = list(range(len(consultas)))
+
+    if faq and 'vetores_perguntas' in base_conhecimento and pendentes:
+        indice = base_conhecimento['vetores_perguntas']
+        entradas = base_conhecimento['faq']
+        matriz = indice.vetorizador.vetorizar([consultas[i] for i in pendentes])
+        for i, (similaridade, posicao) in zip(pendentes, indice.melhores(matriz)):
+            if similaridade >= indice.limiar_confianca:
+                resultados[i] = [(similaridade, registros[entradas[posicao]['bloco']])]
+                origens[i] = ORIGEM_FAQ_VETORIAL
+        pendentes = [i for i in pendentes if resultados[i] is None]
+
+    if faq and 'indice_perguntas' in base_conhecimento:
+        for i in pendentes:
+            achados = _buscar_por_pergunta(consultas[i], base_conhecimento)
+            if achados:
+                resultados[i] = heapq.nlargest(max_resultados, achados, key=lambda x: (x[0], -x[1]['id']))
+                origens[i] = ORIGEM_FAQ_PERGUNTAS
+        pendentes = [i for i in pendentes if resultados[i] is None]
+
+    if origem == "vetorial":
+        if pendentes:
+            matriz = base_conhecimento['vetorizador'].vetorizar([consultas[i] for i in pendentes])
+            for i, achados in zip(pendentes, base_conhecimento['indice_vetorial'].buscar_lote(matriz, max_resultados)):
+                resultados[i] = [(similaridade, registros[doc_id]) for similaridade, doc_id in achados]
+    else:
+        for i in pendentes:
+            resultados[i] = _buscar_no_texto(consultas[i], base_conhecimento, max_resultados, motor)
+    return resultados, origens
+
+
+def _buscar_no_texto(consulta, base_conhecimento, max_resultados, motor):
+    """Varredura de blocos e sentenças (BM25 ou SequenceMatcher) e top-k"""
+    # Base grande com busca em fatias (busca_paralela.py): top-k de cada processo, juntados
+    fatias = base_conhecimento.get('fatias')
+    if fatias is not None:
+        resultados = fatias.buscar(consulta, max_resultados, motor)
+        if resultados is not None:
+            return resultados
+
+    if motor == "similaridade":
+        return _buscar_por_similaridade(consulta, base_conhecimento, max_resultados)
+
+    # Em empate, o trecho que vem antes na base (blocos primeiro) ganha
+    resultados = _buscar_por_bm25(consulta, base_conhecimento)
+    return heapq.nlargest(max_resultados, resultados, key=lambda x: (x[0], -x[1]['id']))
+
+
+def formatar_contexto(resultados):
+    """Monta o texto de contexto com o rótulo de relevância de cada trecho"""
+    if not resultados:
+        return "Não foi encontrada informação relevante na base de conhecimento para esta pergunta."
+    return "\n\n".join(f"[Relevância: {sim:.2f}] {registro['texto']}" for sim, registro in resultados)
+
+
+class CacheBusca:
+    """
+    LRU limitado de resultados de busca, compartilhado entre sessões do processo
+
+    Chave: a forma da pergunta que o motor lê (chave_consulta), max_resultados,
+    motor e versão da base, de modo que duas perguntas só dividem uma entrada
+    se a busca não as distingue, e recarregar uma base alterada nunca devolve
+    resultados antigos.
+    """
+
+    def __init__(self, capacidade=1024):
+        self.capacidade = capacidade
+        self.acertos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._resultados = OrderedDict()
+
+    def buscar(self, pergunta, base_conhecimento, max_resultados=3, motor="bm25"):
+        """Mesmo retorno de buscar_trechos, reaproveitando buscas anteriores"""
+        return self.buscar_com_origem(pergunta, base_conhecimento, max_resultados, motor)[0]
+
+    def buscar_com_origem(self, pergunta, base_conhecimento, max_resultados=3, motor="bm25"):
+        """Mesmo retorno de buscar_trechos_com_origem, reaproveitando buscas anteriores"""
+        consulta = chave_consulta(preparar_consulta(pergunta), base_conhecimento, motor)
+        chave = (consulta, max_resultados, motor, base_conhecimento.get('versao'))
+        with self._lock:
+            guardado = self._resultados.get(chave)
+            if guardado is not None:
+                self._resultados.move_to_end(chave)
+                self.acertos += 1
+                resultados, origem = guardado
+                return list(resultados), origem
+
+        # Busca fora do lock: sessões concorrentes não esperam umas pelas outras
+        resultados, origem = buscar_trechos_com_origem(pergunta, base_conhecimento, max_resultados, motor)
+        resultados = tuple(resultados)
+        with self._lock:
+            self.falhas += 1
+            self._resultados[chave] = (resultados, origem)
+            while len(self._resultados) > self.capacidade:
+                self._resultados.popitem(last=False)
+        return list(resultados), origem
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "entradas": len(self._resultados),
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+        }
+
+
+# Instância do processo: o módulo é importado uma vez e sobrevive aos reruns do Streamlit
+cache_busca = CacheBusca()
+
+
+def buscar_contexto_relevante(pergunta, base_conhecimento, max_resultados=3, motor="bm25"):
+    """
+    Busca os trechos mais relevantes na base de conhecimento
+    e os formata como contexto para o prompt
+    """
+    if not base_conhecimento['blocos']:
+        return "Nenhuma informação disponível na base de conhecimento."
+
+    return formatar_contexto(buscar_trechos(pergunta, base_conhecimento, max_resultados, motor))
@@ -0,0 +1,265 @@
+"""
+Busca vetorial (densa) na base de conhecimento do RAG
+
+Todos os trechos são convertidos em vetores e empilhados numa única matriz
+float32 contígua (trechos x dimensão). Uma consulta é um produto
+matriz-vetor seguido de np.argpartition para o top-k; um lote de consultas
+(buscar_lote) é um único produto matriz-matriz.
+
+O vetorizador é plugável (config/bot_config.json, chave "embeddings"):
+  - "hashing": hashing de termos e trigramas, sem rede
+  - "tfidf":   hashing ponderado pelo IDF da própria base, sem rede
+  - "openai":  endpoint de embeddings da OpenAI (ou serviço compatível via base_url)
+"""
+import os
+import zlib
+
+import numpy as np
+
+DIMENSAO_PADRAO = 512
+
+# ═══════════════════════════════════════════════════════
+# VETORIZADORES
+# ═══════════════════════════════════════════════════════
+
+def _caracteristicas(tokens):
+    """Termos inteiros + trigramas de caracteres (tolera plural e erros de digitação)"""
+    for token in tokens:
+        yield token
+        if len(token) > 3:
+            marcado = f"#{token}#"
+            for i in range(len(marcado) - 2):
+                yield marcado[i:i + 3]
+
+
+class VetorizadorHashing:
+    """Hashing trick: cada característica cai num índice fixo do vetor (crc32, estável entre processos)"""
+
+    tipo = "hashing"
+    entrada_consulta = "tokens"     # o que lê da consulta (chave do cache de busca)
+
+    def __init__(self, dimensao=DIMENSAO_PADRAO):
+        self.dimensao = dimensao
+
+    def ajustar(self, registros):
+        """Sem estado a aprender"""
+        return self
+
+    def _contagens(self, tokens):
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for caracteristica in _caracteristicas(tokens):
+            h = zlib.crc32(caracteristica.encode('utf-8'))
+            # Bit alto define o sinal: reduz o viés das colisões
+            vetor[h % self.dimensao] += 1.0 if h & 0x80000000 else -1.0
+        return vetor
+
+    def _ponderar(self, vetor):
+        return np.sign(vetor) * np.log1p(np.abs(vetor))
+
+    def vetorizar(self, registros):
+        """Matriz float32 (len(registros) x dimensao) com linhas de norma 1"""
+        matriz = np.zeros((len(registros), self.dimensao), dtype=np.float32)
+        for i, registro in enumerate(registros):
+            matriz[i] = self._ponderar(self._contagens(registro['tokens']))
+        return _normalizar_linhas(matriz)
+
+    def vetorizar_consulta(self, consulta):
+        vetor = self._ponderar(self._contagens(consulta['tokens']))
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+
+class VetorizadorTfidf(VetorizadorHashing):
+    """Hashing ponderado pelo IDF de cada posição, calculado sobre a própria base"""
+
+    tipo = "tfidf"
+
+    def __init__(self, dimensao=DIMENSAO_PADRAO):
+        super().__init__(dimensao)
+        self.idf = np.ones(self.dimensao, dtype=np.float32)
+
+    def ajustar(self, registros):
+        frequencia = np.zeros(self.dimensao, dtype=np.float32)
+        for registro in registros:
+            frequencia += self._contagens(registro['tokens']) != 0
+        total = len(registros)
+        self.idf = np.log((1 + total) / (1 + frequencia)).astype(np.float32) + 1.0
+        return self
+
+    def _ponderar(self, vetor):
+        return super()._ponderar(vetor) * self.idf
+
+
+class VetorizadorOpenAI:
+    """
+    Embeddings pela API da OpenAI; base_url permite apontar para um serviço local compatível.
+    cliente: o cliente do app (cliente_openai.criar_cliente), para os embeddings usarem
+    o mesmo pool de conexões do chat; sem ele, cria um com o pool padrão
+    """
+
+    tipo = "openai"
+    entrada_consulta = "texto"
+
+    def __init__(self, modelo="text-embedding-3-small", base_url=None, tamanho_lote=256, cliente=None):
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        if cliente is None:
+            from cliente_openai import criar_cliente
+
+            cliente, _ = criar_cliente(os.getenv("OPENAI_API_KEY"), base_url)
+        elif base_url is not None:
+            # Serviço de embeddings à parte, ainda no mesmo pool HTTP
+            cliente = cliente.with_options(base_url=base_url)
+        self.cliente = cliente
+        self.dimensao = None
+
+    def ajustar(self, registros):
+        return self
+
+    def _embeddings(self, textos):
+        resposta = self.cliente.embeddings.create(model=self.modelo, input=textos)
+        return [item.embedding for item in resposta.data]
+
+    def vetorizar(self, registros):
+        vetores = []
+        for inicio in range(0, len(registros), self.tamanho_lote):
+            lote = registros[inicio:inicio + self.tamanho_lote]
+            vetores.extend(self._embeddings([r['texto'] for r in lote]))
+        matriz = np.asarray(vetores, dtype=np.float32).reshape(len(registros), -1)
+        self.dimensao = matriz.shape[1]
+        return _normalizar_linhas(matriz)
+
+    def vetorizar_consulta(self, consulta):
+        vetor = np.asarray(self._embeddings([consulta['texto']])[0], dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+
+VETORIZADORES = {
+    "hashing": VetorizadorHashing,
+    "tfidf": VetorizadorTfidf,
+    "openai": VetorizadorOpenAI,
+}
+
+
+def criar_vetorizador(config_embeddings, cliente=None):
+    """
+    Instancia o vetorizador descrito em config["embeddings"]
+    cliente: cliente OpenAI compartilhado, usado só pelo vetorizador "openai"
+    """
+    parametros = dict(config_embeddings or {})
+    tipo = parametros.pop("tipo", "hashing")
+    if tipo not in VETORIZADORES:
+        raise ValueError(f"Vetorizador desconhecido: {tipo}")
+    if tipo == "openai" and cliente is not None:
+        parametros["cliente"] = cliente
+    return VETORIZADORES[tipo](**parametros)
+
+
+def _normalizar_linhas(matriz):
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return np.ascontiguousarray(matriz / normas, dtype=np.float32)
+
+# ═══════════════════════════════════════════════════════
+# ÍNDICE VETORIAL
+# ═══════════════════════════════════════════════════════
+
+class IndiceVetorial:
+    """Matriz de embeddings (trechos x dimensão) + limiar mínimo por trecho"""
+
+    def __init__(self, matriz, limiares):
+        self.matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        self.limiares = np.asarray(limiares, dtype=np.float32)
+
+    @classmethod
+    def construir(cls, registros, vetorizador, limiares):
+        vetorizador.ajustar(registros)
+        return cls(vetorizador.vetorizar(registros), limiares)
+
+    def buscar(self, vetor_consulta, max_resultados):
+        """Retorna [(similaridade, doc_id)] do top-k acima do limiar de cada trecho"""
+        if not len(self.matriz) or max_resultados <= 0:
+            return []
+
+        # Similaridade de cosseno de todos os trechos num único produto
+        return self._melhores(self.matriz @ vetor_consulta.astype(np.float32, copy=False), max_resultados)
+
+    def buscar_lote(self, matriz_consultas, max_resultados):
+        """buscar() de cada linha de matriz_consultas, com um único produto matriz-matriz"""
+        if not len(self.matriz) or max_resultados <= 0:
+            return [[] for _ in range(len(matriz_consultas))]
+
+        # consultas x trechos: o BLAS percorre a matriz da base uma vez para o lote todo
+        pontuacoes = np.asarray(matriz_consultas, dtype=np.float32) @ self.matriz.T
+        return [self._melhores(linha, max_resultados) for linha in pontuacoes]
+
+    def _melhores(self, pontuacoes, max_resultados):
+        candidatos = np.flatnonzero(pontuacoes > self.limiares)
+        if len(candidatos) > max_resultados:
+            melhores = np.argpartition(-pontuacoes[candidatos], max_resultados - 1)[:max_resultados]
+            candidatos = candidatos[melhores]
+
+        # Ordena só os k escolhidos (empate: menor doc_id primeiro)
+        ordem = np.lexsort((candidatos, -pontuacoes[candidatos]))
+        return [(float(pontuacoes[i]), int(i)) for i in candidatos[ordem]]
+
+# ═══════════════════════════════════════════════════════
+# ÍNDICE DE PERGUNTAS DO FAQ
+# ═══════════════════════════════════════════════════════
+
+class IndicePerguntas:
+    """
+    Matriz float32 (perguntas x dimensão) só com as perguntas do FAQ
+
+    Pequena o bastante para ficar num .npz ao lado da base; a versão (hash da
+    base + vetorizador) diz se o arquivo ainda vale ou precisa ser refeito.
+    """
+
+    def __init__(self, matriz, versao, vetorizador, limiar_confianca):
+        self.matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        self.versao = versao
+        self.vetorizador = vetorizador
+        self.limiar_confianca = limiar_confianca
+
+    @classmethod
+    def construir(cls, registros, vetorizador, versao, limiar_confianca):
+        return cls(vetorizador.vetorizar(registros), versao, vetorizador, limiar_confianca)
+
+    @classmethod
+    def carregar(cls, caminho, versao, vetorizador, limiar_confianca):
+        """Índice gravado em caminho, ou None se não existe ou é de outra versão da base"""
+        if not caminho or not os.path.exists(caminho):
+            return None
+        try:
+            with np.load(caminho, allow_pickle=False) as dados:
+                if str(dados["versao"]) != versao:
+                    return None
+                matriz = dados["matriz"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(matriz, versao, vetorizador, limiar_confianca)
+
+    def salvar(self, caminho):
+        """Grava num temporário e renomeia (leitores nunca veem o arquivo pela metade)"""
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'wb') as f:
+            np.savez(f, matriz=self.matriz, versao=np.array(self.versao))
+        os.replace(temporario, caminho)
+
+    def melhor(self, vetor_consulta):
+        """(similaridade, posição) da pergunta mais parecida: um único produto matriz-vetor"""
+        if not len(self.matriz):
+            return 0.0, -1
+        pontuacoes = self.matriz @ vetor_consulta.astype(np.float32, copy=False)
+        posicao = int(np.argmax(pontuacoes))
+        return float(pontuacoes[posicao]), posicao
+
+    def melhores(self, matriz_consultas):
+        """melhor() de cada linha de matriz_consultas: [(similaridade, posição)]"""
+        if not len(self.matriz):
+            return [(0.0, -1)] * len(matriz_consultas)
+        pontuacoes = np.asarray(matriz_consultas, dtype=np.float32) @ self.matriz.T
+        posicoes = np.argmax(pontuacoes, axis=1)
+        similaridades = pontuacoes[np.arange(len(posicoes)), posicoes]
+        return [(float(s), int(p)) for s, p in zip(similaridades, posicoes)]
@@ -0,0 +1,265 @@
+"""
+Respostas em lote: perguntas de uma planilha (CSV) ou de um JSONL pelo pipeline do RAG
+
+Usa o mesmo motor do app (motor_rag.py): mesma base, mesmos trechos, mesmo
+prompt. Serve para pré-responder perguntas de clientes e para testes de
+regressão de prompt (rode em dois commits e compare as saídas).
+
+Pipeline (asyncio):
+    leitura em lotes -> busca vetorizada do lote (numa thread) -> fila limitada
+    -> N workers com o AsyncOpenAI -> uma linha JSON gravada por resposta
+
+As chamadas passam pelo agendador do motor (agendador_llm.py): os limites
+por minuto do config seguram o lote antes de a API devolver 429, e os
+erros passageiros são repetidos com espera exponencial.
+
+A fila limitada segura a leitura enquanto os workers estão ocupados: a
+memória não cresce com o tamanho da entrada. As respostas são gravadas na
+ordem em que chegam; o campo "indice" é a posição da pergunta na entrada.
+
+Entrada:
+    .csv   - coluna com a pergunta (--coluna, padrão "pergunta")
+    .jsonl - objetos com o campo --coluna, ou só a pergunta como string JSON
+As demais colunas vão para a saída em "campos".
+
+Uso (dentro de chatbot_streamlit/):
+    python responder_lote.py perguntas.csv --saida respostas.jsonl --concorrencia 8
+    python responder_lote.py perguntas.jsonl --modelo gpt-4.1-nano --limite 100
+    python responder_lote.py perguntas.csv --sem-llm     # só busca + prompt, sem chamar o modelo
+    python responder_lote.py perguntas.csv --modelo automático   # cascata: modelo escolhido por pergunta
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+from cliente_openai import criar_cliente_assincrono
+from motor_rag import MotorRAG, CAMINHO_CONFIG_PADRAO, CAMINHO_PROMPT_PADRAO
+from rag_busca import MOTORES_BUSCA
+
+CONCORRENCIA_PADRAO = 8
+TAMANHO_LOTE_PADRAO = 64
+
+# ═══════════════════════════════════════════════════════
+# ENTRADA E SAÍDA
+# ═══════════════════════════════════════════════════════
+
+def ler_perguntas(caminho, coluna="pergunta"):
+    """Gera (pergunta, demais campos) de um .csv ou .jsonl, sem carregar o arquivo inteiro"""
+    with open(caminho, 'r', encoding='utf-8', newline='') as f:
+        if Path(caminho).suffix.lower() == ".csv":
+            leitor = csv.DictReader(f)
+            if coluna not in (leitor.fieldnames or []):
+                raise ValueError(f"Coluna '{coluna}' não encontrada em {caminho}: {leitor.fieldnames}")
+            for linha in leitor:
+                campos = dict(linha)
+                yield (campos.pop(coluna) or "").strip(), campos
+            return
+
+        for numero, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            item = json.loads(linha)
+            if isinstance(item, str):
+                yield item.strip(), {}
+            elif isinstance(item, dict) and coluna in item:
+                campos = dict(item)
+                yield str(campos.pop(coluna) or "").strip(), campos
+            else:
+                raise ValueError(f"{caminho}:{numero}: esperado um texto ou um objeto com '{coluna}'")
+
+
+class Relatorio:
+    """Vazão, latência das chamadas, tokens e erros do lote (e por nível, no modo automático)"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.perguntas = 0
+        self.erros = 0
+        self.latencias = []
+        self.tokens = {"prompt": 0, "completion": 0, "cached": 0}
+        self.segundos_busca = 0.0
+        self.niveis = {}            # nível da cascata -> latências (None sem chamada ao modelo)
+
+    def registrar(self, resultado):
+        self.perguntas += 1
+        if resultado.get("erro"):
+            self.erros += 1
+        if resultado.get("latencia_s") is not None:
+            self.latencias.append(resultado["latencia_s"])
+        if resultado.get("roteamento"):
+            self.niveis.setdefault(resultado["roteamento"]["nivel"], []).append(resultado.get("latencia_s"))
+        for tipo, quantidade in (resultado.get("tokens") or {}).items():
+            self.tokens[tipo] += quantidade or 0
+
+    def como_dict(self):
+        duracao = time.perf_counter() - self.inicio
+        relatorio = {
+            "perguntas": self.perguntas,
+            "erros": self.erros,
+            "duracao_s": round(duracao, 3),
+            "perguntas_por_segundo": round(self.perguntas / duracao, 2) if duracao else None,
+            "busca_s": round(self.segundos_busca, 3),
+            "tokens": self.tokens,
+            "fracao_cache": round(self.tokens["cached"] / self.tokens["prompt"], 4) if self.tokens["prompt"] else None,
+            "tokens_por_segundo": round((self.tokens["prompt"] + self.tokens["completion"]) / duracao, 1) if duracao else None,
+        }
+        if self.latencias:
+            p50, p95, p99 = np.percentile(self.latencias, [50, 95, 99])
+            relatorio["latencia_s"] = {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+        if self.niveis:
+            relatorio["cascata"] = {}
+            for nivel, latencias in sorted(self.niveis.items()):
+                medidas = [latencia for latencia in latencias if latencia is not None]
+                relatorio["cascata"][nivel] = {
+                    "perguntas": len(latencias),
+                    "latencia_p50_s": round(float(np.percentile(medidas, 50)), 3) if medidas else None,
+                }
+        return relatorio
+
+    def progresso(self):
+        duracao = time.perf_counter() - self.inicio
+        return f"   {self.perguntas} perguntas, {self.erros} erros, {self.perguntas / duracao:.1f}/s"
+
+# ═══════════════════════════════════════════════════════
+# PIPELINE
+# ═══════════════════════════════════════════════════════
+
+async def processar(motor, perguntas, saida, concorrencia=CONCORRENCIA_PADRAO, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                    sem_llm=False, incluir_contexto=False, tentativas=2, intervalo_progresso=5.0):
+    """Responde todas as perguntas, gravando uma linha JSON por resposta em saida (arquivo aberto)"""
+    relatorio = Relatorio()
+    fila = asyncio.Queue(maxsize=max(concorrencia * 2, tamanho_lote))
+    cliente = None
+    if not sem_llm:
+        cliente = criar_cliente_assincrono(
+            motor.api_key, motor.config.get("base_url"), motor.config.get("cliente_http")
+        )
+        motor.agendador.tentativas = tentativas
+        # Em lote não há usuário esperando: o pedido aguarda o limite por minuto o quanto for preciso
+        motor.agendador.timeout_fila = None
+    iterador = enumerate(perguntas)
+    ultimo_progresso = time.perf_counter()
+
+    def proximo_lote():
+        """Lê e prepara o próximo lote (roda numa thread: busca e tokens são CPU)"""
+        lote = list(islice(iterador, tamanho_lote))
+        inicio = time.perf_counter()
+        preparos = motor.preparar_lote([pergunta for _, (pergunta, _) in lote]) if lote else []
+        return lote, preparos, time.perf_counter() - inicio
+
+    async def produtor():
+        try:
+            while True:
+                lote, preparos, segundos = await asyncio.to_thread(proximo_lote)
+                if not lote:
+                    break
+                relatorio.segundos_busca += segundos
+                for (indice, (_, campos)), preparo in zip(lote, preparos):
+                    await fila.put((indice, campos, preparo))
+        finally:
+            for _ in range(concorrencia):
+                await fila.put(None)
+
+    def gravar(indice, campos, preparo, resultado):
+        nonlocal ultimo_progresso
+        resultado = {"indice": indice, **resultado}
+        if incluir_contexto:
+            resultado["contexto"] = preparo['contexto']
+        if campos:
+            resultado["campos"] = campos
+        saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        relatorio.registrar(resultado)
+        if intervalo_progresso and time.perf_counter() - ultimo_progresso >= intervalo_progresso:
+            ultimo_progresso = time.perf_counter()
+            print(relatorio.progresso(), file=sys.stderr, flush=True)
+
+    async def trabalhador():
+        while (tarefa := await fila.get()) is not None:
+            indice, campos, preparo = tarefa
+            if sem_llm or not preparo['pergunta']:
+                resultado = motor.resultado(preparo)
+                if not preparo['pergunta']:
+                    resultado["erro"] = "pergunta vazia"
+            else:
+                try:
+                    resultado = await motor.responder_async(cliente, preparo)
+                except Exception as e:      # erro da API depois das tentativas: registra e segue o lote
+                    resultado = {**motor.resultado(preparo), "erro": f"{type(e).__name__}: {e}"[:300]}
+            gravar(indice, campos, preparo, resultado)
+
+    try:
+        await asyncio.gather(produtor(), *(trabalhador() for _ in range(concorrencia)))
+    finally:
+        if cliente is not None:
+            await cliente.close()
+    return relatorio.como_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Responde em lote perguntas de um CSV/JSONL com o RAG do bot")
+    parser.add_argument("entrada", help="arquivo .csv ou .jsonl com as perguntas")
+    parser.add_argument("--saida", help="arquivo .jsonl de saída (padrão: <entrada>.respostas.jsonl)")
+    parser.add_argument("--coluna", default="pergunta", help="coluna/campo com a pergunta")
+    parser.add_argument("--config", default=CAMINHO_CONFIG_PADRAO)
+    parser.add_argument("--prompt", default=CAMINHO_PROMPT_PADRAO)
+    parser.add_argument("--modelo", help="sobrescreve modelo_padrao do config ('automático' = cascata)")
+    parser.add_argument("--motor", choices=MOTORES_BUSCA, help="sobrescreve motor_busca do config")
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA_PADRAO, help="chamadas ao modelo em voo")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO, help="perguntas por busca vetorizada")
+    parser.add_argument("--tentativas", type=int, default=2, help="novas tentativas por chamada (429/5xx)")
+    parser.add_argument("--limite", type=int, help="processa só as primeiras N perguntas")
+    parser.add_argument("--sem-llm", action="store_true", help="só busca e prompt (regressão do contexto)")
+    parser.add_argument("--incluir-contexto", action="store_true", help="grava o contexto enviado em cada linha")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    saida = args.saida or f"{Path(args.entrada).with_suffix('')}.respostas.jsonl"
+
+    inicio = time.perf_counter()
+    motor = MotorRAG.de_config(args.config, args.prompt)
+    if args.modelo:
+        motor.modelo = args.modelo
+    if args.motor:
+        motor.motor_busca = args.motor
+    if not args.sem_llm and not motor.api_key:
+        print("❌ OPENAI_API_KEY não encontrada (use --sem-llm para só montar os prompts)", file=sys.stderr)
+        return 1
+    print(f"📚 Base: {len(motor.base['registros'])} trechos em {time.perf_counter() - inicio:.2f}s", file=sys.stderr)
+
+    perguntas = ler_perguntas(args.entrada, args.coluna)
+    if args.limite:
+        perguntas = islice(perguntas, args.limite)
+
+    Path(saida).parent.mkdir(parents=True, exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        relatorio = asyncio.run(processar(
+            motor, perguntas, f, args.concorrencia, args.lote,
+            args.sem_llm, args.incluir_contexto or args.sem_llm, args.tentativas,
+        ))
+
+    print(f"✅ {relatorio['perguntas']} perguntas em {relatorio['duracao_s']:.1f}s "
+          f"({relatorio['perguntas_por_segundo']}/s), {relatorio['erros']} erros -> {saida}")
+    print(f"   busca: {relatorio['busca_s']:.2f}s  tokens: {relatorio['tokens']['prompt']} prompt, "
+          f"{relatorio['tokens']['completion']} completion, {relatorio['tokens']['cached']} em cache "
+          f"({relatorio['tokens_por_segundo']}/s)")
+    if relatorio["fracao_cache"] is not None:
+        print(f"   cache de prefixo: {relatorio['fracao_cache']:.0%} dos tokens de prompt")
+    if "latencia_s" in relatorio:
+        latencia = relatorio["latencia_s"]
+        print(f"   latência por chamada: p50 {latencia['p50']}s  p95 {latencia['p95']}s  p99 {latencia['p99']}s")
+    for nivel, dados in relatorio.get("cascata", {}).items():
+        latencia = f", latência p50 {dados['latencia_p50_s']}s" if dados["latencia_p50_s"] is not None else ""
+        print(f"   cascata {nivel}: {dados['perguntas']} perguntas{latencia}")
+    return 1 if relatorio['erros'] == relatorio['perguntas'] and relatorio['perguntas'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
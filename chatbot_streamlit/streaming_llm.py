@@ -0,0 +1,70 @@
+"""
+Respostas em streaming do chat.completions com medição de latência percebida
+
+Uso com st.write_stream:
+    medicao = MedicaoTurno()
+    stream = client.chat.completions.create(..., stream=True, stream_options={"include_usage": True})
+    resposta_ia = st.write_stream(medicao.transmitir(stream))
+    registrar_latencia(st.session_state, medicao)
+"""
+import time
+
+
+class MedicaoTurno:
+    """Tempo até o primeiro token (TTFT) e tempo total de geração de um turno"""
+
+    def __init__(self):
+        # Começa antes da chamada à API: o TTFT inclui a latência da requisição
+        self.inicio = time.perf_counter()
+        self.tempo_primeiro_token = None
+        self.tempo_total = None
+        # Último pedaço do stream quando se pede stream_options={"include_usage": True}
+        self.uso = None
+        self.modelo = None
+
+    def transmitir(self, stream):
+        """Gera os pedaços de texto do stream, registrando os tempos ao longo do caminho"""
+        try:
+            for pedaco in stream:
+                self.modelo = getattr(pedaco, "model", None) or self.modelo
+                if getattr(pedaco, "usage", None) is not None:
+                    self.uso = pedaco.usage
+                if not pedaco.choices:
+                    continue
+                texto = pedaco.choices[0].delta.content
+                if texto:
+                    if self.tempo_primeiro_token is None:
+                        self.tempo_primeiro_token = time.perf_counter() - self.inicio
+                    yield texto
+        finally:
+            self.tempo_total = time.perf_counter() - self.inicio
+
+    @property
+    def tokens_em_cache(self):
+        """Tokens do prompt aproveitados do cache de prefixo da OpenAI (None sem usage)"""
+        if self.uso is None:
+            return None
+        detalhes = getattr(self.uso, "prompt_tokens_details", None)
+        return getattr(detalhes, "cached_tokens", None) or 0
+
+    def como_dict(self):
+        return {
+            "tempo_primeiro_token": self.tempo_primeiro_token,
+            "tempo_total": self.tempo_total,
+            "tokens_prompt": getattr(self.uso, "prompt_tokens", None),
+            "tokens_em_cache": self.tokens_em_cache,
+        }
+
+    def resumo(self):
+        """Texto curto para exibir abaixo da resposta"""
+        ttft = f"{self.tempo_primeiro_token:.2f}s" if self.tempo_primeiro_token is not None else "-"
+        total = f"{self.tempo_total:.2f}s" if self.tempo_total is not None else "-"
+        texto = f"⏱️ 1º token: {ttft} • total: {total}"
+        if self.tokens_em_cache is not None and self.uso.prompt_tokens:
+            texto += f" • 💾 prompt em cache: {self.tokens_em_cache}/{self.uso.prompt_tokens} tokens"
+        return texto
+
+
+def registrar_latencia(session_state, medicao):
+    """Acumula as medições da sessão em session_state["latencias"]"""
+    session_state.setdefault("latencias", []).append(medicao.como_dict())
@@ -0,0 +1,127 @@
+"""
+ComparadorSimilaridade.top_k x varredura completa (ratio() de todos os trechos
+e heapq.nlargest no fim, a implementação anterior do motor 'similaridade')
+
+O top-k tem de ser idêntico, relevância exata e id na mesma ordem: na base
+distribuída, num corpus sintético maior, com empates e com trechos exatamente
+nos limiares 0.1 (bloco) e 0.15 (sentença), que ficam de fora nos dois.
+
+Uso (dentro de chatbot_streamlit/):
+    python -m pytest tests
+"""
+import heapq
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / "benchmarks"))
+from rag_busca import (
+    ComparadorSimilaridade, montar_base, buscar_trechos, preparar_consulta,
+    similaridade_normalizada, limiar_por_tipo, LIMIAR_BLOCO, LIMIAR_SENTENCA,
+)
+from corpus_sintetico import gerar_corpus
+
+KS = (1, 3, 10, 50)
+
+
+def varredura_completa(textos, limiares, consulta_normalizada, max_resultados, primeiro_id=0):
+    """Implementação anterior: ratio() de todos os trechos e top-k no fim (empate: menor id)"""
+    resultados = [
+        (similaridade_normalizada(consulta_normalizada, texto), posicao)
+        for posicao, texto in enumerate(textos)
+    ]
+    resultados = [(s, posicao) for s, posicao in resultados if s > limiares[posicao]]
+    melhores = heapq.nlargest(max_resultados, resultados, key=lambda x: (x[0], -x[1]))
+    return [(similaridade, primeiro_id + posicao) for similaridade, posicao in melhores]
+
+
+def comparar_na_base(base, perguntas):
+    registros = base['registros']
+    textos = [registro['normalizado'] for registro in registros]
+    limiares = [limiar_por_tipo(registro['tipo']) for registro in registros]
+    for pergunta in perguntas:
+        consulta = preparar_consulta(pergunta)['normalizado']
+        for k in KS:
+            esperado = varredura_completa(textos, limiares, consulta, k)
+            obtido = [
+                (similaridade, registro['id'])
+                for similaridade, registro in buscar_trechos(pergunta, base, k, "similaridade", faq=False)
+            ]
+            assert obtido == esperado, (pergunta, k)
+
+
+@pytest.fixture(scope="module")
+def conteudo_base():
+    return (RAIZ / "conhecimento" / "base_conhecimento.txt").read_text(encoding="utf-8")
+
+
+@pytest.fixture(scope="module")
+def perguntas():
+    with open(RAIZ / "benchmarks" / "perguntas_rotuladas.json", encoding="utf-8") as f:
+        return [item["pergunta"] for item in json.load(f)["perguntas"]]
+
+
+def test_base_distribuida(conteudo_base, perguntas):
+    comparar_na_base(montar_base(conteudo_base), perguntas)
+
+
+def test_corpus_sintetico(conteudo_base, perguntas):
+    base = montar_base(gerar_corpus(conteudo_base, 3))
+    assert len(base['registros']) > 3 * len(montar_base(conteudo_base)['registros']) // 2
+    comparar_na_base(base, perguntas[::4])
+
+
+def test_empates_ficam_com_o_menor_id():
+    # Textos repetidos (mesma relevância) espalhados entre outros
+    textos = ["como instalar o app", "outro assunto qualquer", "como instalar o app",
+              "instalar", "como instalar o app", "instalar"]
+    limiares = [LIMIAR_BLOCO] * len(textos)
+    comparador = ComparadorSimilaridade(textos, limiares)
+    for k in range(1, len(textos) + 2):
+        for primeiro_id in (0, 100):
+            esperado = varredura_completa(textos, limiares, "como instalar", k, primeiro_id)
+            assert comparador.top_k("como instalar", k, primeiro_id) == esperado
+    assert [posicao for _, posicao in comparador.top_k("como instalar", 3)] == [0, 2, 4]
+
+
+@pytest.mark.parametrize("consulta, no_limite, acima, limiar", [
+    # ratio() = 2M/T, exato em float: 1 caractere em comum em 20 (0.1), 3 em 40 (0.15)
+    ("abcdefghij", "a123456789", "ab12345678", LIMIAR_BLOCO),
+    ("abcdefghijklmnopqrst", "abc" + "0" * 17, "abcd" + "0" * 16, LIMIAR_SENTENCA),
+    # Aqui o próprio real_quick_ratio() (só os tamanhos) já dá 2/20: a poda é no limite exato
+    ("abcdefghijklmnopqrs", "a", "ab", LIMIAR_BLOCO),
+])
+def test_relevancia_igual_ao_limiar_fica_de_fora(consulta, no_limite, acima, limiar):
+    textos = [no_limite, acima, "9" * len(consulta)]
+    limiares = [limiar] * len(textos)
+    assert similaridade_normalizada(consulta, no_limite) == limiar
+    relevancia_acima = similaridade_normalizada(consulta, acima)
+    assert relevancia_acima > limiar
+
+    comparador = ComparadorSimilaridade(textos, limiares)
+    for k in (1, 2, 3):
+        esperado = varredura_completa(textos, limiares, consulta, k)
+        assert comparador.top_k(consulta, k) == esperado == [(relevancia_acima, 1)]
+
+
+def test_limiares_mistos_aleatorio():
+    # Alfabeto pequeno: muitos empates de ratio() e limites quick_ratio() iguais ao limiar
+    sorteio = random.Random(7)
+    alfabeto = "abcde "
+    textos = [
+        ''.join(sorteio.choice(alfabeto) for _ in range(sorteio.randint(0, 30)))
+        for _ in range(300)
+    ]
+    limiares = [sorteio.choice((LIMIAR_BLOCO, LIMIAR_SENTENCA)) for _ in textos]
+    # Capacidade pequena: o LRU dos SequenceMatcher descarta e refaz set_seq2 entre consultas
+    comparador = ComparadorSimilaridade(textos, limiares, capacidade=16)
+    for _ in range(60):
+        consulta = ''.join(sorteio.choice(alfabeto) for _ in range(sorteio.randint(1, 25)))
+        for k in (1, 5, 40, 400):
+            assert comparador.top_k(consulta, k, 7) == varredura_completa(textos, limiares, consulta, k, 7)
+    assert comparador.top_k("abc", 0) == []